@@ -8,9 +8,9 @@ This server handles:
 - GPT-4o integration
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import os
@@ -36,7 +36,11 @@ except ImportError as e:
 
 # Import TTS service (optional, will fail gracefully if not available)
 try:
-    from tts.cosyvoice_service import get_tts_service
+    from tts.cosyvoice_service import HEALER_VOICE_MAP, get_tts_service
+    from tts.audio_format import AudioEncoding, negotiate
+    from tts.audio_http import AudioFileResponse, audio_file_path
+    from tts.jobs import CancelTokenError, QueueFullError, get_job_queue
+    from tts.scheduler import PREGENERATION, get_scheduler
     TTS_AVAILABLE = True
 except ImportError as e:
     print(f"TTS module not available: {e}. TTS functionality will be disabled.")
@@ -80,6 +84,7 @@ class ChatResponse(BaseModel):
 class RAGRetrievalRequest(BaseModel):
     query: str
     topK: Optional[int] = 3
+    healerId: Optional[str] = None  # Applies the healer's source preferences
     
     class Config:
         populate_by_name = True
@@ -90,9 +95,17 @@ class RAGRetrievalResponse(BaseModel):
     error: Optional[str] = None
 
 
+class RAGReloadResponse(BaseModel):
+    status: str  # 'reloading', 'busy' or 'error'
+    error: Optional[str] = None
+
+
 class TTSRequest(BaseModel):
     text: str
     healerId: str
+    sessionId: Optional[str] = None  # Client session, for fair scheduling between clients
+    pregeneration: bool = False  # Batch generation: scheduled after all on-demand requests
+    formats: Optional[List[str]] = None  # Playable formats in order of preference ('opus', 'mp3', 'wav')
     
     class Config:
         populate_by_name = True
@@ -104,6 +117,22 @@ class TTSResponse(BaseModel):
     status: str  # 'generating', 'ready', 'error'
 
 
+class TTSJobTimings(BaseModel):
+    queued: float  # Seconds waiting before generation started
+    generating: float  # Seconds spent generating
+    total: float
+
+
+class TTSJobResponse(BaseModel):
+    jobId: str
+    status: str  # 'queued', 'generating', 'ready', 'error', 'cancelled'
+    audioUrl: Optional[str] = None
+    error: Optional[str] = None
+    queuePosition: Optional[int] = None  # 1-based, while queued
+    timings: TTSJobTimings
+    cancelToken: Optional[str] = None  # Only in the submit response; required to cancel
+
+
 # ==================== Helper Functions ====================
 
 def build_prompt(healer_id: str, user_input: str, conversation_history: List[ChatMessage], rag_context: Optional[str] = None) -> List[dict]:
@@ -254,6 +283,7 @@ async def retrieve_rag(request: RAGRetrievalRequest):
     Receives:
     - query: User's query to search for
     - topK: Number of chunks to retrieve (default: 3)
+    - healerId: Healer whose preferred sources to search (optional)
     
     Returns:
     - chunks: List of retrieved text chunks
@@ -275,9 +305,14 @@ async def retrieve_rag(request: RAGRetrievalRequest):
                 error="RAG knowledge base not found. Please run 'python -m rag.build_kb' to build the knowledge base."
             )
         
-        # Retrieve context
+        # Retrieve context in a thread pool so concurrent requests can be
+        # embedded together by the shared embedding service
         top_k = request.topK or 3
-        chunks = retrieve_context(request.query, top_k=top_k)
+        loop = asyncio.get_event_loop()
+        chunks = await loop.run_in_executor(
+            None,
+            lambda: retrieve_context(request.query, top_k=top_k, healer_id=request.healerId)
+        )
         
         print(f"RAG retrieval: query='{request.query[:50]}...', retrieved {len(chunks)} chunks")
         
@@ -294,8 +329,55 @@ async def retrieve_rag(request: RAGRetrievalRequest):
         )
 
 
+@app.on_event("startup")
+async def start_rag_watcher():
+    """Start the knowledge base file watcher if RAG_KB_WATCH_INTERVAL is set."""
+    try:
+        from rag.retriever import start_watcher
+        start_watcher()
+    except ImportError:
+        pass
+
+
+@app.post("/api/admin/rag/reload", response_model=RAGReloadResponse)
+async def reload_rag(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Reload the RAG knowledge base without a restart.
+    
+    Loads the version that vector_store/CURRENT points to in the background
+    and swaps it in once it is warm. Queries in flight finish on the old
+    version. If ADMIN_TOKEN is set, the X-Admin-Token header must match it.
+    
+    Returns:
+    - status: 'reloading' (started) or 'busy' (a reload is already running)
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if admin_token and x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    try:
+        from rag.retriever import reload_knowledge_base_async
+    except ImportError as e:
+        return RAGReloadResponse(status="error", error=f"RAG module not available: {str(e)}")
+    
+    return RAGReloadResponse(status=reload_knowledge_base_async()["status"])
+
+
+def tts_job_response(job, cancel_token: Optional[str] = None) -> TTSJobResponse:
+    """API view of a TTS job (with the submitter's cancel token after a submit)."""
+    return TTSJobResponse(
+        jobId=job.id,
+        status=job.status,
+        audioUrl=f"/api/tts/audio/{Path(job.audio_path).name}" if job.audio_path else None,
+        error=job.error,
+        queuePosition=get_job_queue().position(job),
+        timings=TTSJobTimings(**job.timings()),
+        cancelToken=cancel_token
+    )
+
+
 @app.post("/api/tts/generate", response_model=TTSResponse)
-async def generate_tts(request: TTSRequest):
+async def generate_tts(request: TTSRequest, accept: Optional[str] = Header(None)):
     """
     TTS generation endpoint.
     
@@ -304,6 +386,8 @@ async def generate_tts(request: TTSRequest):
     Receives:
     - text: Text to synthesize
     - healerId: ID of the healer (milo, leo, luna, max)
+    - formats: Optional playable formats in order of preference (otherwise
+      the Accept header, otherwise the server default)
     
     Returns:
     - audioUrl: URL to the generated audio file (relative path)
@@ -319,17 +403,17 @@ async def generate_tts(request: TTSRequest):
     try:
         print(f"Received TTS request: healerId={request.healerId}, text={request.text[:50]}...")
         
-        # Run TTS generation in a thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        tts_service = get_tts_service()
-        
-        # Generate audio file
-        success, output_path = await loop.run_in_executor(
-            None,
-            tts_service.generate_speech,
-            request.text,
-            request.healerId
-        )
+        # Generate through the job queue (cached replies finish immediately,
+        # identical requests in flight share one job) and wait for the result
+        job_queue = get_job_queue()
+        try:
+            job, _ = job_queue.submit(request.text, request.healerId, session=request.sessionId,
+                                      lane=PREGENERATION if request.pregeneration else None,
+                                      encoding=negotiate(request.formats, accept))
+        except QueueFullError as e:
+            return TTSResponse(audioUrl=None, error=str(e), status="error")
+        await job_queue.wait(job)
+        success, output_path = job.status == "ready", job.audio_path
         
         if success and output_path:
             # Convert absolute path to relative URL for frontend
@@ -345,7 +429,7 @@ async def generate_tts(request: TTSRequest):
         else:
             return TTSResponse(
                 audioUrl=None,
-                error="Failed to generate speech audio.",
+                error=job.error or "Failed to generate speech audio.",
                 status="error"
             )
     
@@ -361,27 +445,182 @@ async def generate_tts(request: TTSRequest):
         )
 
 
-@app.get("/api/tts/audio/{filename}")
-async def get_audio_file(filename: str):
+@app.post("/api/tts/jobs", response_model=TTSJobResponse)
+async def submit_tts_job(request: TTSRequest, accept: Optional[str] = Header(None)):
     """
-    Serve generated audio files.
+    Submit a TTS job.
     
-    This endpoint serves the generated TTS audio files to the frontend.
+    Returns immediately with the job ID; poll GET /api/tts/jobs/{jobId} or
+    subscribe to GET /api/tts/jobs/{jobId}/events for the result. A reply
+    that is already cached comes back 'ready', and a request identical to
+    a job in flight returns that job. The response's cancelToken cancels
+    this submit (DELETE /api/tts/jobs/{jobId}?token=...).
+    
+    Receives:
+    - text: Text to synthesize
+    - healerId: ID of the healer (milo, leo, luna, max)
+    - sessionId: Optional client session (jobs of different sessions take turns)
+    - pregeneration: Optional, true for batch jobs that should run after on-demand ones
+    - formats: Optional playable formats in order of preference (e.g. ["opus", "mp3"])
     """
-    import tempfile
-    temp_dir = Path(tempfile.gettempdir())
-    audio_path = temp_dir / filename
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    if request.healerId not in HEALER_VOICE_MAP:
+        raise HTTPException(status_code=400, detail=f"Unknown healer: {request.healerId}")
     
-    if not audio_path.exists():
-        raise HTTPException(status_code=404, detail="Audio file not found")
+    try:
+        job, cancel_token = get_job_queue().submit(request.text, request.healerId, session=request.sessionId,
+                                                   lane=PREGENERATION if request.pregeneration else None,
+                                                   encoding=negotiate(request.formats, accept))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return tts_job_response(job, cancel_token)
+
+
+@app.get("/api/tts/jobs/{job_id}", response_model=TTSJobResponse)
+async def get_tts_job(job_id: str, wait: float = 0):
+    """
+    Get a TTS job's status.
     
-    return FileResponse(
-        path=str(audio_path),
+    With wait > 0 (seconds, at most 60) the request is held until the job
+    finishes or the time runs out (long polling).
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="TTS job not found")
+    if wait > 0:
+        await job_queue.wait(job, timeout=min(wait, 60))
+    return tts_job_response(job)
+
+
+@app.get("/api/tts/jobs/{job_id}/events")
+async def tts_job_events(job_id: str):
+    """
+    Subscribe to a TTS job (server-sent events).
+    
+    Sends the job's state now and whenever it changes, with a keep-alive
+    comment every 15 seconds, and closes once the job has finished.
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="TTS job not found")
+    
+    async def events():
+        last = None
+        while True:
+            current = tts_job_response(job)
+            state = (current.status, current.queuePosition)
+            if state != last:
+                yield f"data: {current.model_dump_json()}\n\n"
+                last = state
+            if job.finished:
+                return
+            if not await job_queue.wait(job, timeout=15):
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-store"})
+
+
+@app.delete("/api/tts/jobs/{job_id}", response_model=TTSJobResponse)
+async def cancel_tts_job(job_id: str, token: str):
+    """
+    Cancel a TTS job.
+    
+    token is the cancelToken of the submit being withdrawn. A job shared
+    by several identical submits keeps running until all of them have
+    cancelled it; repeating a cancel changes nothing.
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    try:
+        job = get_job_queue().cancel(job_id, token)
+    except CancelTokenError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="TTS job not found")
+    return tts_job_response(job)
+
+
+@app.get("/api/tts/scheduler")
+async def tts_scheduler_stats():
+    """
+    TTS inference scheduler statistics.
+    
+    Returns running and waiting inferences and, per priority lane, the
+    queue wait time and service time of recent requests (seconds).
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    return get_scheduler().stats()
+
+
+@app.get("/api/tts/stream")
+async def stream_tts(text: str, healerId: str, sessionId: Optional[str] = None):
+    """
+    Streaming TTS endpoint.
+    
+    Returns the healer's speech as a WAV stream (chunked transfer encoding)
+    that starts as soon as the first audio chunk is synthesized, so an
+    <audio> element pointed at this URL starts playing before generation
+    has finished.
+    
+    Receives (query parameters):
+    - text: Text to synthesize
+    - healerId: ID of the healer (milo, leo, luna, max)
+    - sessionId: Optional client session, for fair scheduling
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    
+    tts_service = get_tts_service()
+    if healerId not in HEALER_VOICE_MAP:
+        raise HTTPException(status_code=400, detail=f"Unknown healer: {healerId}")
+    
+    # Load the model before the response starts, so failures are still HTTP errors
+    if tts_service.cached_audio(text, healerId, AudioEncoding("wav")) is None:
+        loop = asyncio.get_event_loop()
+        if not await loop.run_in_executor(None, tts_service.initialize):
+            raise HTTPException(status_code=503, detail="TTS model failed to load")
+        if not tts_service.voice_available(healerId):
+            raise HTTPException(status_code=500, detail="Voice file not found")
+    
+    print(f"Streaming TTS: healerId={healerId}, text={text[:50]}...")
+    # A plain generator: Starlette iterates it in a worker thread
+    return StreamingResponse(
+        tts_service.stream_speech(text, healerId, session=sessionId),
         media_type="audio/wav",
-        filename=filename
+        headers={"Cache-Control": "no-store"}
     )
 
 
+@app.api_route("/api/tts/audio/{filename}", methods=["GET", "HEAD"])
+async def get_audio_file(filename: str, request: Request):
+    """
+    Serve generated audio files.
+    
+    This endpoint serves the generated TTS audio files to the frontend,
+    from the audio cache or (with the cache disabled) the temp directory.
+    Responses carry a strong ETag and answer conditional (If-None-Match)
+    and byte range requests, so replays and seeking don't download the
+    file again (see tts/audio_http.py).
+    """
+    if not TTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="TTS service is not available")
+    
+    audio_path = audio_file_path(filename)
+    if audio_path is None or not audio_path.is_file():
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    
+    return await AudioFileResponse.prepare(audio_path, request.headers, request.method)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,252 @@
+"""
+Retrieval Benchmark
+
+Measures retrieval speed and quality for every embedding backend and
+retriever configuration against a small fixture knowledge base bundled
+with the repo (rag/fixtures/bench_kb.jsonl). Each fixture record is a
+held-out question with its known answer: the answers are indexed and the
+questions are used as queries, so a query is a hit when a chunk of its
+own record comes back.
+
+Reported per configuration: QPS, p50/p99 latency, recall@k and MRR; per
+backend: cold-load time, build time and memory. Output is JSON.
+
+Runs fully offline (HuggingFace Hub access is disabled); backends whose
+models are not available locally are reported as skipped.
+
+Usage:
+    python -m rag.bench
+    python -m rag.bench --backends onnx --top-k 3 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Offline before anything imports huggingface_hub / chromadb
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures" / "bench_kb.jsonl"
+
+BACKENDS = ["torch", "onnx"]
+TOP_K_VALUES = [1, 3, 5]
+
+# Partition filters to benchmark: None searches every partition
+HEALER_FILTERS = [None, "leo", "milo"]
+
+
+def load_fixture(path: Path) -> list[dict]:
+    """Load fixture records (id, source, question, answer)."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_queries(path: Path) -> list[dict]:
+    """
+    Load a query set: JSONL lines with "query" and the "record_id" of the
+    record holding the answer.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def current_rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def score_hits(hits: list[dict], record_id: str) -> tuple[bool, float]:
+    """Return (hit within the results, reciprocal rank) for one query."""
+    for rank, hit in enumerate(hits, start=1):
+        if hit["metadata"].get("record_id") == record_id:
+            return True, 1.0 / rank
+    return False, 0.0
+
+
+def run_queries(knowledge_base, queries: list[dict], top_k: int, healer_id, clients: int) -> dict:
+    """
+    Run a query set against a loaded knowledge base.
+
+    With clients > 1, queries are issued from that many threads at once
+    (as concurrent API requests would be).
+    """
+    latencies = [0.0] * len(queries)
+    scores = [(False, 0.0)] * len(queries)
+
+    def run(indices):
+        for i in indices:
+            start = time.perf_counter()
+            hits = knowledge_base.search(queries[i]["query"], top_k=top_k, healer_id=healer_id)
+            latencies[i] = time.perf_counter() - start
+            scores[i] = score_hits(hits, queries[i]["record_id"])
+
+    start = time.perf_counter()
+    if clients <= 1:
+        run(range(len(queries)))
+    else:
+        threads = [
+            threading.Thread(target=run, args=(range(c, len(queries), clients),))
+            for c in range(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "queries": len(queries),
+        "qps": len(queries) / elapsed if elapsed > 0 else 0.0,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        f"recall@{top_k}": sum(hit for hit, _ in scores) / len(queries),
+        "mrr": sum(rr for _, rr in scores) / len(queries),
+    }
+
+
+def bench_backend(backend: str, records: list[dict], queries: list[dict], args) -> dict:
+    """Build the fixture KB with one embedding backend and run every configuration."""
+    from rag.build_kb import build_vector_store, chunk_documents
+    from rag.embedding_service import BatchingEmbeddingService
+    from rag.embeddings import get_embeddings
+    from rag.retriever import KnowledgeBase
+
+    result = {"backend": backend}
+    rss_before = current_rss_mb()
+
+    try:
+        start = time.perf_counter()
+        embeddings = get_embeddings(backend)
+        embeddings.embed_query("warm up")
+        result["model_load_s"] = time.perf_counter() - start
+    except Exception as e:
+        result["skipped"] = f"{type(e).__name__}: {e}"
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as store_dir:
+        # Build output goes to stderr so stdout stays machine-readable
+        with contextlib.redirect_stdout(sys.stderr):
+            start = time.perf_counter()
+            texts = [{"text": r["answer"], "source": r["source"], "id": r["id"]} for r in records]
+            build_vector_store(chunk_documents(texts), store_dir=Path(store_dir), embeddings=embeddings)
+            result["build_s"] = time.perf_counter() - start
+
+        # Cold load: open the index and answer a first query
+        start = time.perf_counter()
+        knowledge_base = KnowledgeBase(Path(store_dir), embeddings=embeddings)
+        knowledge_base.search(queries[0]["query"], top_k=1)
+        result["cold_load_s"] = time.perf_counter() - start
+        result["rss_mb"] = current_rss_mb()
+        result["rss_increment_mb"] = result["rss_mb"] - rss_before
+
+        modes = {"direct": (embeddings, 1)}
+        if args.clients > 1:
+            modes["batched"] = (
+                BatchingEmbeddingService(embeddings, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms),
+                args.clients
+            )
+
+        configurations = []
+        for mode, (query_embeddings, clients) in modes.items():
+            knowledge_base.embeddings = query_embeddings
+            for healer_id in HEALER_FILTERS:
+                for top_k in args.top_k:
+                    # Warm-up pass so the first configuration isn't penalized
+                    run_queries(knowledge_base, queries[:4], top_k, healer_id, 1)
+                    metrics = run_queries(knowledge_base, queries, top_k, healer_id, clients)
+                    configurations.append({
+                        "mode": mode,
+                        "clients": clients,
+                        "healer_filter": healer_id,
+                        "top_k": top_k,
+                        **metrics,
+                    })
+                    print(
+                        f"  {backend}/{mode} healer={healer_id} k={top_k}: "
+                        f"{metrics['qps']:.1f} qps, p50 {metrics['latency_p50_ms']:.1f} ms, "
+                        f"recall {metrics[f'recall@{top_k}']:.2f}, mrr {metrics['mrr']:.2f}",
+                        file=sys.stderr
+                    )
+
+        result["configurations"] = configurations
+        result["peak_rss_mb"] = peak_rss_mb()
+
+    return result
+
+
+def main():
+    """Run the retrieval benchmark and print (or save) the JSON report."""
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval speed and quality")
+    parser.add_argument("--fixture", type=Path, default=FIXTURE_PATH, help="Fixture records (JSONL)")
+    parser.add_argument("--queries", type=Path, help="Query set (JSONL with query, record_id); default: fixture questions")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated embedding backends")
+    parser.add_argument("--top-k", default=",".join(map(str, TOP_K_VALUES)), help="Comma-separated top-k values")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients for the batched mode (1 disables it)")
+    parser.add_argument("--max-batch", type=int, default=32, help="Embedding service max batch size")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Embedding service max wait (ms)")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    args.top_k = [int(k) for k in args.top_k.split(",")]
+
+    records = load_fixture(args.fixture)
+    if args.queries:
+        queries = load_queries(args.queries)
+    else:
+        queries = [{"query": r["question"], "record_id": r["id"]} for r in records]
+
+    print(f"Benchmarking {len(queries)} queries against {len(records)} fixture records...", file=sys.stderr)
+
+    report = {
+        "fixture": str(args.fixture),
+        "records": len(records),
+        "queries": len(queries),
+        "cpu_count": os.cpu_count(),
+        "backends": [],
+    }
+    for backend in args.backends.split(","):
+        print(f"\n[{backend}]", file=sys.stderr)
+        result = bench_backend(backend, records, queries, args)
+        if "skipped" in result:
+            print(f"  Skipped: {result['skipped']}", file=sys.stderr)
+        report["backends"].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+        print(f"\nReport written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,212 +4,896 @@ Knowledge Base Builder
 This script builds a vector database from HuggingFace mental health datasets.
 Run this once to build the knowledge base, then use retriever.py for queries.
 
+The build is a streaming pipeline of generators:
+
+    extract -> dedupe -> chunk -> embed -> write
+
+Only a few dataset shards and one embedding batch are in memory at a time,
+so peak memory stays flat however large the corpus is. Statistics are
+computed incrementally and the build's peak RSS is reported.
+
+Builds are incremental: a content-hash manifest (rag/manifest.py) lets a
+rebuild embed only new or changed chunks and drop deleted ones, and an
+interrupted build resumes from its last committed batch.
+
 Usage:
     python -m rag.build_kb
+    python -m rag.build_kb --workers 8
+    python -m rag.build_kb --embed-workers 4 --torch-threads 4
+    python -m rag.build_kb --full      # ignore previous builds and start from scratch
+    python -m rag.build_kb --source local   # offline, from `python -m rag.snapshot` files
+    python -m rag.build_kb --report build_report.json
+
+Every build saves a JSON report (wall/CPU time and items/s per stage,
+peak memory, per-dataset counts) as build_report.json in its version
+directory and prints a summary table.
 """
 
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datasets import load_dataset
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from datasets.distributed import split_dataset_by_node
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-import statistics
+import argparse
+import chromadb
+import hashlib
+import json
+import math
 import random
+import resource
 import os
+import shutil
+import sys
+import time
 from pathlib import Path
 
-# HuggingFace datasets for mental health counseling
-HF_DATASETS = [
-    "mrs83/kurtis_mental_health_final",
-    "samhog/psychology-RLHF",
-    "Felladrin/pretrain-mental-health-counseling-conversations",
-    "LuangMV97/Empathetic_counseling_Dataset",
-    "tolu07/Mental_Health_FAQ",
-    "thu-coai/augesc",
-    "nbertagnolli/counsel-chat",
-    "Amod/mental_health_counseling_conversations",
-    "ZahrizhalAli/mental_health_conversational_dataset",
-]
-
-# Vector store directory
+from rag.chunker import split_batch
+from rag.doc_store import DocStore, DocStoreWriter, print_size_report
+from rag.embedding_cache import CachedEmbeddings, with_cache
+from rag.embeddings import embedding_model_id, get_embeddings
+from rag.manifest import MANIFEST_FILE, BuildManifest, chunk_id
+from rag.parallel_embed import get_build_embeddings
+from rag.snapshot import extract_texts, read_table, snapshot_files
+from rag.sources import HF_DATASETS, partition_name, record_type, write_partition_manifest
+from rag.vector_index import write_vector_index
+from rag.versions import (
+    current_version_dir,
+    find_unfinished_version,
+    mark_building,
+    mark_finished,
+    new_version_dir,
+    prune_versions,
+    publish_version,
+)
+
+# Vector store directory (each build becomes a new version inside it)
 VECTOR_STORE_DIR = Path(__file__).parent / "vector_store"
 
+# Chunking parameters
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+CHUNK_SEPARATORS = ["\n\n", "\nQuestion:", "\nAnswer:", "\n", ".", " ", ""]
+
+# Part of every chunk's content hash: changing any of these re-chunks and re-embeds
+CHUNKER_PARAMS = {"size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP, "separators": CHUNK_SEPARATORS}
+
+# Texts per chunking task sent to a worker process
+CHUNK_BATCH_SIZE = 500
+
+# Chroma has a batch size limit, so we need to insert in batches
+# Use a safe batch size (5000 is well below the limit)
+EMBED_BATCH_SIZE = 5000
+
+# "extract" includes downloading (streaming) the datasets, "write" the
+# Chroma inserts, manifest and text store/index files
+PIPELINE_STAGES = ["extract", "dedupe", "chunk", "embed", "write"]
+
+# Structured build report saved in every version directory
+BUILD_REPORT_FILE = "build_report.json"
+
+# Where datasets are read from (override with RAG_SOURCE or --source):
+# "auto" uses a local snapshot when there is one and the Hub otherwise,
+# "local" only uses snapshots, "hub" always streams from HuggingFace
+SOURCE_MODES = ["auto", "local", "hub"]
+
+
+class RunningStats:
+    """Count, mean, standard deviation and max of a stream (Welford's algorithm)."""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.max = 0
+        self._m2 = 0.0
+    
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.max = max(self.max, value)
+    
+    @property
+    def stdev(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def children_cpu_seconds():
+    """CPU time used by finished (joined) child processes, e.g. pool workers."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageStats:
+    """
+    Items and time of one pipeline stage.
+    
+    Memory is not tracked per stage: the stages run interleaved in one
+    process, so the build only reports one process-wide peak RSS.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        
+        # Time spent in this stage's own code (measured directly or derived,
+        # see PipelineStats.stage_times) and CPU time of its worker processes
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.worker_cpu_seconds = 0.0
+    
+    def tick(self, count=1):
+        self.items += count
+    
+    def add_time(self, wall, cpu):
+        self.wall_seconds += wall
+        self.cpu_seconds += cpu
+
+
+class PipelineStats:
+    """Incremental statistics for a whole build."""
+    
+    def __init__(self, sample_size=5):
+        self.stages = {name: StageStats(name) for name in PIPELINE_STAGES}
+        self.text_lengths = RunningStats()
+        self.chunk_lengths = RunningStats()
+        self.first_text = None
+        
+        # Incremental build counters
+        self.reused_chunks = 0
+        self.removed_chunks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Per-dataset counts (examples, texts, unique_texts, chunks, stored_chunks)
+        self.datasets = {}
+        
+        # Wall/CPU time spent pulling items out of each generator stage,
+        # which includes the time of the stages upstream of it
+        self.inclusive = {}
+        self.started = time.time()
+        
+        # Datasets that failed to load; their existing chunks are kept as-is
+        self.failed_sources = set()
+        
+        # Reservoir sample of chunks to show at the end
+        self.sample_size = sample_size
+        self.chunk_samples = []
+    
+    def dataset(self, source):
+        """Counters of one dataset."""
+        if source not in self.datasets:
+            self.datasets[source] = {"examples": 0, "texts": 0, "unique_texts": 0, "chunks": 0, "stored_chunks": 0}
+        return self.datasets[source]
+    
+    def measure(self, name, iterable):
+        """Pass items through, timing each pull as inclusive time of stage `name` (generator)."""
+        totals = self.inclusive.setdefault(name, [0.0, 0.0])
+        iterator = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                totals[0] += time.perf_counter() - wall
+                totals[1] += time.process_time() - cpu
+            yield item
+    
+    @contextmanager
+    def timed(self, name):
+        """Time a block as inclusive time of `name`."""
+        totals = self.inclusive.setdefault(name, [0.0, 0.0])
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+    
+    def stage_times(self):
+        """
+        Exclusive wall and CPU time of each stage.
+        
+        Generator stages are measured inclusively (pulling an item from
+        "chunk" runs dedupe and extract too), so each one's own time is its
+        inclusive time minus that of the stage feeding it. "write" is the
+        rest of the vector store step ("store") after chunking and embedding.
+        """
+        def inclusive(name):
+            return self.inclusive.get(name, [0.0, 0.0])
+        
+        times = {}
+        upstream = [0.0, 0.0]
+        for name in ("extract", "dedupe", "chunk"):
+            total = inclusive(name)
+            times[name] = [max(0.0, total[0] - upstream[0]), max(0.0, total[1] - upstream[1])]
+            upstream = total
+        embed = self.stages["embed"]
+        times["embed"] = [embed.wall_seconds, embed.cpu_seconds]
+        store = inclusive("store")
+        times["write"] = [max(0.0, store[0] - upstream[0] - embed.wall_seconds),
+                          max(0.0, store[1] - upstream[1] - embed.cpu_seconds)]
+        return times
+    
+    def to_dict(self):
+        """Structured build report (JSON-serializable)."""
+        times = self.stage_times()
+        stages = []
+        for stage in self.stages.values():
+            wall, cpu = times[stage.name]
+            stages.append({
+                "stage": stage.name,
+                "items": stage.items,
+                "wall_s": round(wall, 3),
+                "cpu_s": round(cpu + stage.worker_cpu_seconds, 3),
+                "worker_cpu_s": round(stage.worker_cpu_seconds, 3),
+                "items_per_s": round(stage.items / wall, 1) if wall > 0 else None,
+            })
+        
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        scale = 1024 if sys.platform != "darwin" else 1024 * 1024
+        
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_s": round(time.time() - self.started, 3),
+            "cpu_count": os.cpu_count(),
+            "peak_rss_mb": round(self_usage.ru_maxrss / scale, 1),
+            "peak_worker_rss_mb": round(child_usage.ru_maxrss / scale, 1),
+            "stages": stages,
+            "datasets": self.datasets,
+            "failed_datasets": sorted(self.failed_sources),
+            "totals": {
+                "texts": self.text_lengths.count,
+                "unique_texts": self.stages["dedupe"].items,
+                "chunks": self.chunk_lengths.count,
+                "embedded_chunks": self.stages["embed"].items,
+                "reused_chunks": self.reused_chunks,
+                "removed_chunks": self.removed_chunks,
+                "embedding_cache_hits": self.cache_hits,
+                "embedding_cache_misses": self.cache_misses,
+            },
+        }
+    
+    def add_chunk(self, chunk):
+        index = self.chunk_lengths.count
+        self.chunk_lengths.add(len(chunk.page_content))
+        if len(self.chunk_samples) < self.sample_size:
+            self.chunk_samples.append((index, chunk))
+        else:
+            slot = random.randint(0, index)
+            if slot < self.sample_size:
+                self.chunk_samples[slot] = (index, chunk)
+    
+    def report(self):
+        """Print text, chunk and per-stage statistics."""
+        if self.text_lengths.count:
+            print(f"\nTotal texts: {self.text_lengths.count}")
+            print(f"Average length: {self.text_lengths.mean:.2f} chars")
+            print(f"Max length: {self.text_lengths.max} chars")
+            print(f"Sample text: {self.first_text[:200]}...")
+            print(f"Deduplicated texts: {self.stages['dedupe'].items}")
+        
+        if self.chunk_lengths.count:
+            avg_chunk = self.chunk_lengths.mean
+            print(f"\nChunk statistics:")
+            print(f"  Total chunks: {self.chunk_lengths.count}")
+            print(f"  Average chunk size: {avg_chunk:.2f} chars ({(avg_chunk / CHUNK_SIZE) * 100:.1f}% of target)")
+            print(f"  Max chunk size: {self.chunk_lengths.max}")
+            print(f"  Standard deviation: {self.chunk_lengths.stdev:.2f}")
+            
+            # Show random samples
+            print(f"\nSample chunks:")
+            for i, chunk in sorted(self.chunk_samples, key=lambda sample: sample[0]):
+                print(f"\n  Chunk {i} (size {len(chunk.page_content)}):")
+                print(f"  {chunk.page_content[:300]}...")
+        
+        total = self.reused_chunks + self.stages["embed"].items
+        if total:
+            print(f"\nIncremental build:")
+            print(f"  Reused chunks: {self.reused_chunks} of {total} "
+                  f"(reuse ratio {self.reused_chunks / total * 100:.1f}%)")
+            print(f"  Embedded chunks: {self.stages['embed'].items}")
+            print(f"  Removed chunks: {self.removed_chunks}")
+        
+        if self.stages["embed"].wall_seconds > 0:
+            embed = self.stages["embed"]
+            print(f"  Embedding throughput: {embed.items / embed.wall_seconds:.1f} chunks/s")
+        
+        if self.cache_hits + self.cache_misses:
+            print(f"  Embedding cache: {self.cache_hits} hits, {self.cache_misses} misses "
+                  f"({self.cache_hits / (self.cache_hits + self.cache_misses) * 100:.1f}% hit rate)")
+        
+        report = self.to_dict()
+        print(f"\nPipeline stages:")
+        print(f"  {'stage':<8} {'items':>10} {'wall s':>9} {'CPU s':>9} {'items/s':>10}")
+        for stage in report["stages"]:
+            rate = f"{stage['items_per_s']:.0f}" if stage["items_per_s"] is not None else "-"
+            print(f"  {stage['stage']:<8} {stage['items']:>10} {stage['wall_s']:>9.1f} {stage['cpu_s']:>9.1f} "
+                  f"{rate:>10}")
+        print(f"  Total wall time: {report['wall_s']:.1f}s, peak RSS {report['peak_rss_mb']:.1f} MB "
+              f"(largest worker {report['peak_worker_rss_mb']:.1f} MB)")
+
+
+def extract_text(example):
+    """Join the non-empty string fields of a dataset example (None if too short)."""
+    # Extract all string values from the example
+    text = "\n".join([
+        value
+        for value in example.values()
+        if isinstance(value, str) and value.strip()
+    ])
+    
+    # Filter out very short texts
+    if len(text) > 50:
+        return text
+    return None
+
 
-def load_and_extract_texts():
-    """Load datasets from HuggingFace and extract text content."""
-    all_texts = []
-    text_lengths = []
+def list_extraction_units(stats=None, source_mode="auto"):
+    """
+    Split every dataset into independent units of extraction work.
+    
+    A unit is one file of a local snapshot or one file shard of a streaming
+    dataset, so datasets stored as several files are extracted by several
+    workers at once. Units only depend on the dataset files, never on the
+    number of workers.
     
+    Args:
+        stats: PipelineStats to record failed datasets in
+        source_mode: One of SOURCE_MODES
+    
+    Returns:
+        List of (dataset name, shard index, shard count, local file or None)
+        tuples in build order
+    """
+    units = []
     for name in HF_DATASETS:
+        files = snapshot_files(name) if source_mode != "hub" else None
+        if files:
+            units.extend((name, shard, len(files), path) for shard, path in enumerate(files))
+            continue
+        if source_mode == "local":
+            print(f"  Error loading {name}: no local snapshot (run 'python -m rag.snapshot' first)")
+            if stats is not None:
+                stats.failed_sources.add(name)
+            continue
+        
         try:
-            print(f"Loading {name}...")
             ds = load_dataset(name, split="train", streaming=True)
+            num_shards = max(1, ds.n_shards)
+            units.extend((name, shard, num_shards, None) for shard in range(num_shards))
+        except Exception as e:
+            print(f"  Error loading {name}: {e}")
+            if stats is not None:
+                stats.failed_sources.add(name)
+    return units
+
+
+def extract_unit(unit):
+    """
+    Extract texts from one dataset shard (runs in a worker process).
+    
+    Local snapshot files are memory-mapped and extracted column-wise;
+    Hub shards are streamed row by row.
+    
+    Returns:
+        Dict with the unit's "source", "shard", extracted "texts" (in stream
+        order), "examples" seen, "start"/"end" timestamps and "error" (if any)
+    """
+    name, shard, num_shards, path = unit
+    result = {"source": name, "shard": shard, "texts": [], "examples": 0, "start": time.time(), "error": None}
+    
+    try:
+        if path is not None:
+            table = read_table(path)
+            result["texts"] = extract_texts(table)
+            result["examples"] = table.num_rows
+        else:
+            ds = load_dataset(name, split="train", streaming=True)
+            if num_shards > 1:
+                ds = split_dataset_by_node(ds, rank=shard, world_size=num_shards)
             
+            texts = result["texts"]
             count = 0
             for example in ds:
-                # Extract all string values from the example
-                text_parts = [
-                    str(value) 
-                    for value in example.values() 
-                    if isinstance(value, str) and value.strip()
-                ]
-                text = "\n".join(text_parts)
-                
-                # Filter out very short texts
-                if len(text) > 50:
-                    all_texts.append(text.strip())
-                    text_lengths.append(len(text))
-                
+                text = extract_text(example)
+                if text is not None:
+                    texts.append(text)
                 count += 1
-                if count % 1000 == 0:
-                    print(f"  Extracted {count} texts...")
+            result["examples"] = count
+    except Exception as e:
+        result["error"] = str(e)
+    
+    result["end"] = time.time()
+    return result
+
+
+def ordered_map(pool, fn, items, window):
+    """
+    Like pool.map, but with at most `window` tasks submitted ahead.
+    
+    Results are yielded in input order; finished results never pile up
+    beyond the window while the consumer is busy.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_and_extract_texts(workers=None, stats=None, source_mode=None):
+    """
+    Load datasets (local snapshots or HuggingFace) and extract text content (generator).
+    
+    Dataset shards are extracted in parallel across a process pool. Results
+    are consumed in unit order, so the output is identical for any number
+    of workers.
+    
+    Args:
+        workers: Number of worker processes (default: one per CPU)
+        stats: PipelineStats to update
+        source_mode: One of SOURCE_MODES (default: RAG_SOURCE, else "auto")
+    
+    Yields:
+        Records, each a dict with "text" and "source" (dataset name)
+    """
+    stats = stats or PipelineStats()
+    stage = stats.stages["extract"]
+    
+    source_mode = source_mode or os.getenv("RAG_SOURCE", "auto")
+    if source_mode not in SOURCE_MODES:
+        raise ValueError(f"Unknown source mode: {source_mode}. Valid modes: {SOURCE_MODES}")
+    
+    print(f"Listing dataset shards (source: {source_mode})...")
+    units = list_extraction_units(stats, source_mode)
+    workers = min(workers or os.cpu_count() or 1, max(1, len(units)))
+    print(f"Extracting {len(units)} shards from {len(HF_DATASETS)} datasets with {workers} workers...")
+    
+    # Per-dataset throughput: texts, examples and the wall-clock span of its shards
+    throughput = {}
+    
+    worker_cpu = children_cpu_seconds()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in ordered_map(pool, extract_unit, units, window=2 * workers):
+            name = result["source"]
+            if result["error"]:
+                print(f"  Error loading {name} (shard {result['shard']}): {result['error']}")
+                stats.failed_sources.add(name)
+                continue
             
-            print(f"  Completed {name}, total texts: {len(all_texts)}")
+            for text in result["texts"]:
+                stats.text_lengths.add(len(text))
+                stage.tick()
+                if stats.first_text is None:
+                    stats.first_text = text
+                yield {"text": text.strip(), "source": name}
             
-        except Exception as e:
-            print(f"  Error loading {name}: {e}")
+            dataset = throughput.setdefault(name, {"texts": 0, "examples": 0, "start": result["start"], "end": result["end"]})
+            dataset["texts"] += len(result["texts"])
+            dataset["examples"] += result["examples"]
+            dataset["start"] = min(dataset["start"], result["start"])
+            dataset["end"] = max(dataset["end"], result["end"])
+            print(f"  Completed {name} shard {result['shard'] + 1}, total texts: {stage.items}")
+    stage.worker_cpu_seconds += children_cpu_seconds() - worker_cpu
+    
+    print("\nExtraction throughput:")
+    for name, dataset in throughput.items():
+        counts = stats.dataset(name)
+        counts["examples"] += dataset["examples"]
+        counts["texts"] += dataset["texts"]
+        elapsed = dataset["end"] - dataset["start"]
+        rate = dataset["texts"] / elapsed if elapsed > 0 else 0.0
+        print(f"  {name}: {dataset['texts']} texts from {dataset['examples']} examples "
+              f"in {elapsed:.1f}s ({rate:.0f} texts/s)")
+
+
+def dedupe_texts(records, stats=None):
+    """
+    Drop repeated texts, keeping the first occurrence (generator).
+    
+    Only a 16-byte hash per unique text is remembered, not the text itself.
+    """
+    stats = stats or PipelineStats()
+    stage = stats.stages["dedupe"]
+    seen = set()
+    
+    for record in records:
+        digest = hashlib.blake2b(record["text"].encode("utf-8"), digest_size=16).digest()
+        if digest in seen:
             continue
+        seen.add(digest)
+        stage.tick()
+        stats.dataset(record["source"])["unique_texts"] += 1
+        yield record
+
+
+def chunk_documents(texts, stats=None, workers=1, batch_size=CHUNK_BATCH_SIZE):
+    """
+    Split texts into chunks for embedding (generator).
+    
+    Uses rag.chunker, which gives the same chunks as LangChain's
+    RecursiveCharacterTextSplitter, faster. With workers > 1, batches of
+    texts are chunked in a process pool and consumed in order.
+    
+    Each chunk keeps the dataset it came from ("source") and that
+    dataset's record type ("record_type") as metadata, plus the record's
+    "id" as "record_id" when the record has one.
+    """
+    stats = stats or PipelineStats()
+    stage = stats.stages["chunk"]
+    
+    def record_batches():
+        batch = []
+        for record in texts:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def split(batch):
+        return split_batch([record["text"] for record in batch], CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS)
+    
+    def chunked_batches():
+        if workers <= 1:
+            for batch in record_batches():
+                yield batch, split(batch)
+            return
+        
+        # Records stay here; only their texts go to the workers
+        pending = deque()
+        worker_cpu = children_cpu_seconds()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in record_batches():
+                texts_only = [record["text"] for record in batch]
+                pending.append((batch, pool.submit(split_batch, texts_only, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS)))
+                if len(pending) >= 2 * workers:
+                    batch, future = pending.popleft()
+                    yield batch, future.result()
+            while pending:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        stage.worker_cpu_seconds += children_cpu_seconds() - worker_cpu
+    
+    for batch, batch_chunks in chunked_batches():
+        for record, record_chunks in zip(batch, batch_chunks):
+            metadata = {"source": record["source"], "record_type": record_type(record["source"])}
+            if "id" in record:
+                metadata["record_id"] = record["id"]
+            stats.dataset(record["source"])["chunks"] += len(record_chunks)
+            
+            for text in record_chunks:
+                chunk = Document(page_content=text, metadata=dict(metadata))
+                stats.add_chunk(chunk)
+                stage.tick()
+                yield chunk
+
+
+def carry_forward_texts(doc_store, store_dir, manifest, sources):
+    """
+    Copy the texts of datasets that failed to load this run into the new chunk text store.
+    
+    Their chunks stay in Chroma and the manifest, so their texts are taken
+    from the text store this version started from (still in store_dir
+    until the new one is finished).
+    
+    Raises:
+        RuntimeError: If a kept chunk has no text there; publishing the
+            version would make the retriever drop those chunks
+    """
+    base = DocStore(store_dir) if DocStore.exists(store_dir) else None
+    copied = missing = 0
+    try:
+        for cid in manifest.chunk_ids(sorted(sources)):
+            text = base.get(cid) if base is not None else None
+            if text is None:
+                missing += 1
+                continue
+            doc_store.add(cid, text)
+            copied += 1
+    finally:
+        if base is not None:
+            base.close()
+    
+    if missing:
+        raise RuntimeError(f"{missing} chunks of failed datasets ({', '.join(sorted(sources))}) have no text "
+                           f"in the previous chunk text store; rebuild once they load again")
+    if copied:
+        print(f"  Kept {copied} chunk texts of failed datasets from the previous build")
+
+
+def build_vector_store(chunks, store_dir=VECTOR_STORE_DIR, embeddings=None, stats=None, batch_size=EMBED_BATCH_SIZE):
+    """
+    Create embeddings and store in Chroma vector database.
     
-    # Statistics
-    if text_lengths:
-        avg_length = statistics.mean(text_lengths)
-        max_length = max(text_lengths)
-        print(f"\nTotal texts: {len(all_texts)}")
-        print(f"Average length: {avg_length:.2f} chars")
-        print(f"Max length: {max_length} chars")
-        if all_texts:
-            print(f"Sample text: {all_texts[0][:200]}...")
-    
-    # Deduplicate
-    all_texts = list(set(all_texts))
-    print(f"Deduplicated texts: {len(all_texts)}")
-    
-    return all_texts
-
-
-def chunk_documents(texts):
-    """Split texts into chunks for embedding."""
-    documents = [
-        Document(page_content=text, metadata={"source": "hf_datasets"}) 
-        for text in texts
-    ]
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200,
-        chunk_overlap=150,
-        length_function=len,
-        separators=["\n\n", "\nQuestion:", "\nAnswer:", "\n", ".", " ", ""]
-    )
-    
-    chunks = text_splitter.split_documents(documents)
-    
-    # Statistics
-    chunk_lengths = [len(chunk.page_content) for chunk in chunks]
-    if chunk_lengths:
-        avg_chunk = statistics.mean(chunk_lengths)
-        max_chunk = max(chunk_lengths)
-        stdev = statistics.stdev(chunk_lengths) if len(chunk_lengths) > 1 else 0
-        
-        print(f"\nChunk statistics:")
-        print(f"  Total chunks: {len(chunks)}")
-        print(f"  Average chunk size: {avg_chunk:.2f} chars ({(avg_chunk / 1200) * 100:.1f}% of target)")
-        print(f"  Max chunk size: {max_chunk}")
-        print(f"  Standard deviation: {stdev:.2f}")
-        
-        # Show random samples
-        random_indices = random.sample(range(len(chunks)), min(5, len(chunks)))
-        print(f"\nSample chunks:")
-        for i in sorted(random_indices):
-            print(f"\n  Chunk {i} (size {len(chunks[i].page_content)}):")
-            print(f"  {chunks[i].page_content[:300]}...")
-    
-    return chunks
-
-
-def build_vector_store(chunks):
-    """Create embeddings and store in Chroma vector database."""
-    print(f"\nCreating embeddings and vector store...")
-    print(f"Total chunks to process: {len(chunks)}")
-    
-    # Use HuggingFace embeddings (lightweight, no API key needed)
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    Chunks are consumed as a stream: each batch of new chunks is embedded
+    and written before more are pulled. Chunks already recorded in the
+    store's build manifest are skipped, chunks that no longer appear are
+    deleted at the end, and every written batch is committed to the
+    manifest so an interrupted build can resume where it stopped.
+    
+    Chunks go to one collection per source dataset, and a partition
+    manifest is saved so the retriever knows which collections exist and
+    what kind of records they hold. Chunk texts are not stored in Chroma
+    but in a compressed chunk text store (rag/doc_store.py) rewritten on
+    every build; datasets that fail to load keep the texts of their
+    previous build.
+    
+    Args:
+        chunks: Iterable of chunked documents from chunk_documents()
+        store_dir: Directory to write the vector store to
+        embeddings: Embedding model (default: the configured backend)
+        stats: PipelineStats to update
+        batch_size: Chunks embedded and inserted per batch
+    
+    Returns:
+        Number of chunks stored per source
+    """
+    stats = stats or PipelineStats()
+    print(f"\nCreating embeddings and vector store (batch size: {batch_size})...")
+    
+    # Use HuggingFace embeddings (lightweight, no API key needed);
+    # RAG_EMBEDDING_BACKEND=onnx switches to the quantized ONNX export
+    if embeddings is None:
+        embeddings = get_embeddings()
+    
+    # Texts embedded by earlier builds (any version, any store) come from the on-disk cache
+    embeddings = with_cache(embeddings)
+    
+    # The embedding model is part of every chunk's content hash too, so
+    # switching model or backend re-embeds everything instead of mixing
+    # vectors of two models in one store
+    chunk_params = {**CHUNKER_PARAMS, "embedding_model": embedding_model_id(embeddings)}
     
     # Create vector store directory
-    VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # Chroma has a batch size limit, so we need to insert in batches
-    # Use a safe batch size (5000 is well below the limit)
-    batch_size = 5000
-    total_batches = (len(chunks) + batch_size - 1) // batch_size
-    
-    print(f"Inserting {len(chunks)} chunks in {total_batches} batches (batch size: {batch_size})...")
-    
-    # Initialize vector store with first batch
-    first_batch = chunks[:batch_size]
-    vectorstore = Chroma.from_documents(
-        documents=first_batch,
-        embedding=embeddings,
-        persist_directory=str(VECTOR_STORE_DIR)
-    )
-    
-    # Add remaining batches
-    for i in range(1, total_batches):
-        start_idx = i * batch_size
-        end_idx = min((i + 1) * batch_size, len(chunks))
-        batch = chunks[start_idx:end_idx]
-        
-        print(f"  Processing batch {i+1}/{total_batches} (chunks {start_idx}-{end_idx-1})...")
-        vectorstore.add_documents(batch)
-    
-    # Persist the final vector store
-    # Note: Chroma 0.4.x+ automatically persists, but we call it for older versions
+    store_dir.mkdir(parents=True, exist_ok=True)
+    client = chromadb.PersistentClient(path=str(store_dir))
+    manifest = BuildManifest(store_dir, run_id=store_dir.name)
+    
+    collections = {}
+    
+    def get_collection(source):
+        if source not in collections:
+            collections[source] = client.get_or_create_collection(partition_name(source), embedding_function=None)
+        return collections[source]
+    
+    def write_batch(batch):
+        wall, cpu = time.perf_counter(), time.process_time()
+        vectors = embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+        stats.stages["embed"].add_time(time.perf_counter() - wall, time.process_time() - cpu)
+        stats.stages["embed"].tick(len(batch))
+        
+        # Write each source's chunks to its own partition. Upsert keeps a
+        # resumed batch idempotent if it was written but not committed.
+        partitions = {}
+        for (cid, chunk), vector in zip(batch, vectors):
+            partitions.setdefault(chunk.metadata["source"], []).append((cid, chunk, vector))
+        
+        for source, items in partitions.items():
+            get_collection(source).upsert(
+                ids=[cid for cid, _, _ in items],
+                embeddings=[vector for _, _, vector in items],
+                metadatas=[chunk.metadata for _, chunk, _ in items]
+            )
+        
+        manifest.commit_batch([(cid, chunk.metadata["source"]) for cid, chunk in batch])
+        stats.stages["write"].tick(len(batch))
+    
+    pending = []
+    pending_ids = set()
+    seen = []
+    batch_number = 0
+    
+    # Every chunk (new or reused) goes to the text store
+    doc_store = DocStoreWriter(store_dir)
     try:
-        vectorstore.persist()
-    except AttributeError:
-        # Chroma 0.4.x+ doesn't have persist() method (auto-persists)
-        pass
+        for chunk in chunks:
+            cid = chunk_id(chunk.metadata["source"], chunk.page_content, chunk_params)
+            if cid in pending_ids:
+                continue
+            doc_store.add(cid, chunk.page_content)
+            
+            if manifest.is_committed(cid):
+                stats.reused_chunks += 1
+                seen.append(cid)
+                if len(seen) >= batch_size:
+                    manifest.mark_seen(seen)
+                    seen = []
+                continue
+            
+            pending.append((cid, chunk))
+            pending_ids.add(cid)
+            if len(pending) >= batch_size:
+                batch_number += 1
+                print(f"  Processing batch {batch_number} ({len(pending)} new chunks, "
+                      f"{stats.reused_chunks} reused so far)...")
+                write_batch(pending)
+                pending = []
+                pending_ids = set()
+        
+        if pending:
+            batch_number += 1
+            print(f"  Processing batch {batch_number} ({len(pending)} new chunks)...")
+            write_batch(pending)
+        if seen:
+            manifest.mark_seen(seen)
+        if stats.failed_sources:
+            carry_forward_texts(doc_store, store_dir, manifest, stats.failed_sources)
+    except BaseException:
+        doc_store.abort()
+        raise
+    doc_store.finish()
+    
+    # Remove chunks that are no longer produced by the corpus
+    for source, stale_ids in manifest.stale(keep_sources=stats.failed_sources).items():
+        print(f"  Removing {len(stale_ids)} deleted chunks from {source}...")
+        for start in range(0, len(stale_ids), batch_size):
+            get_collection(source).delete(ids=stale_ids[start:start + batch_size])
+        manifest.remove(stale_ids)
+        stats.removed_chunks += len(stale_ids)
     
-    print(f"Vector store saved to: {VECTOR_STORE_DIR}")
-    print(f"Total documents in vector store: {len(chunks)}")
+    counts = manifest.counts()
+    manifest.close()
     
-    return vectorstore
+    if isinstance(embeddings, CachedEmbeddings):
+        stats.cache_hits += embeddings.hits
+        stats.cache_misses += embeddings.misses
+    
+    # Drop partitions that lost all their chunks
+    for source in list(collections):
+        if source not in counts:
+            client.delete_collection(partition_name(source))
+    
+    write_partition_manifest(store_dir, counts)
+    for source, count in counts.items():
+        stats.dataset(source)["stored_chunks"] = count
+    
+    # Flat copy of the vectors that API workers memory-map and share
+    print("Exporting shared vector index...")
+    write_vector_index(store_dir, {partition_name(source): get_collection(source) for source in counts})
+    
+    print(f"Vector store saved to: {store_dir}")
+    print(f"Total documents in vector store: {sum(counts.values())} in {len(counts)} partitions")
+    print_size_report(store_dir)
+    
+    return counts
+
+
+def prepare_version_dir(full=False):
+    """
+    Pick the directory this build writes to.
+    
+    Resumes an interrupted build if there is one. Otherwise creates a new
+    version, seeded with a copy of the live version (when it has a build
+    manifest) so unchanged chunks are reused instead of re-embedded. The
+    live version itself is never modified.
+    
+    Args:
+        full: Discard interrupted builds and start from an empty version
+    """
+    unfinished = find_unfinished_version(VECTOR_STORE_DIR)
+    if unfinished is not None:
+        if not full:
+            print(f"Resuming interrupted build: {unfinished.name}")
+            return unfinished
+        print(f"Discarding interrupted build: {unfinished.name}")
+        shutil.rmtree(unfinished, ignore_errors=True)
+    
+    version_dir = new_version_dir(VECTOR_STORE_DIR)
+    base = None if full else current_version_dir(VECTOR_STORE_DIR)
+    if base is not None and (base / MANIFEST_FILE).exists():
+        print(f"Starting incremental build from version {base.name}")
+        shutil.copytree(base, version_dir, dirs_exist_ok=True)
+    else:
+        print("Starting full build")
+    
+    mark_building(version_dir)
+    return version_dir
 
 
 def main():
     """Main function to build knowledge base."""
+    parser = argparse.ArgumentParser(description="Build the NightWhisper knowledge base")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for dataset extraction (default: one per CPU)")
+    parser.add_argument("--chunk-workers", type=int, default=None,
+                        help="Worker processes for chunking (default: one per CPU)")
+    parser.add_argument("--embed-workers", type=int, default=None,
+                        help="Worker processes for embedding (default: RAG_EMBED_WORKERS, else 1)")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="Torch threads per embedding worker (default: CPUs / embed workers)")
+    parser.add_argument("--source", choices=SOURCE_MODES, default=None,
+                        help="Read datasets from local snapshots, the Hub, or snapshots when available (default: RAG_SOURCE, else auto)")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild from scratch instead of reusing/resuming previous builds")
+    parser.add_argument("--report", type=Path, default=None,
+                        help=f"Also write the JSON build report here (always saved as {BUILD_REPORT_FILE} in the version)")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Building NightWhisper Knowledge Base")
     print("=" * 60)
     
-    # Step 1: Load and extract texts
-    print("\n[Step 1] Loading datasets from HuggingFace...")
-    texts = load_and_extract_texts()
+    # Steps 1-3 run as one streaming pipeline:
+    # extract -> dedupe -> chunk -> embed -> write
+    print("\n[Step 1-3] Streaming datasets into the vector store...")
+    stats = PipelineStats()
+    texts = stats.measure("extract", load_and_extract_texts(workers=args.workers, stats=stats, source_mode=args.source))
+    texts = stats.measure("dedupe", dedupe_texts(texts, stats=stats))
+    chunks = stats.measure("chunk", chunk_documents(texts, stats=stats, workers=args.chunk_workers or os.cpu_count() or 1))
     
-    if not texts:
-        print("Error: No texts extracted. Exiting.")
-        return
+    # Build into a new (or resumed) version directory; a running server
+    # keeps reading the current version until we publish this one
+    version_dir = prepare_version_dir(full=args.full)
+    worker_cpu = children_cpu_seconds()
+    embeddings = get_build_embeddings(workers=args.embed_workers, threads=args.torch_threads)
+    try:
+        with stats.timed("store"):
+            counts = build_vector_store(chunks, store_dir=version_dir, embeddings=embeddings, stats=stats)
+    finally:
+        if hasattr(embeddings, "close"):
+            embeddings.close()
+    
+    # Embedding workers are joined last; the other pools' CPU is already attributed
+    stats.stages["embed"].worker_cpu_seconds += max(0.0, children_cpu_seconds() - worker_cpu - sum(
+        stats.stages[name].worker_cpu_seconds for name in ("extract", "chunk")
+    ))
     
-    # Step 2: Chunk documents
-    print("\n[Step 2] Chunking documents...")
-    chunks = chunk_documents(texts)
+    stats.report()
     
-    if not chunks:
+    report = stats.to_dict()
+    report["version"] = version_dir.name
+    report_json = json.dumps(report, indent=2)
+    (version_dir / BUILD_REPORT_FILE).write_text(report_json)
+    if args.report:
+        args.report.write_text(report_json)
+    print(f"\nBuild report saved to: {args.report or version_dir / BUILD_REPORT_FILE}")
+    
+    if not counts:
         print("Error: No chunks created. Exiting.")
+        shutil.rmtree(version_dir, ignore_errors=True)
         return
     
-    # Step 3: Build vector store
-    print("\n[Step 3] Building vector store...")
-    vectorstore = build_vector_store(chunks)
+    # Step 4: Atomically switch the CURRENT pointer to the new version
+    mark_finished(version_dir)
+    publish_version(VECTOR_STORE_DIR, version_dir)
+    prune_versions(VECTOR_STORE_DIR)
     
     print("\n" + "=" * 60)
     print("Knowledge base build complete!")
     print("=" * 60)
-    print(f"\nVector store location: {VECTOR_STORE_DIR}")
+    print(f"\nVector store location: {version_dir}")
     print("You can now use the retriever to query the knowledge base.")
+    print("Running servers pick it up via POST /api/admin/rag/reload (or RAG_KB_WATCH_INTERVAL).")
 
 
 if __name__ == "__main__":
     main()
-
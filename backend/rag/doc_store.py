@@ -0,0 +1,267 @@
+"""
+Chunk Text Store
+
+Chunk texts are kept out of Chroma in a compact store written at build
+time next to the Chroma files:
+
+    docs.zst           # Chunk texts, UTF-8, in zstd-compressed blocks of ~64 KB
+    docs_blocks.npy    # (offset, compressed length) of every block in docs.zst
+    docs_index.npy     # Sorted (chunk ID, block, offset, length) entries
+
+At serve time the data file is memory-mapped and the index files are
+loaded with mmap_mode="r", so opening a store costs no reads and every
+process serving the same version shares one page-cache copy. A lookup is a
+binary search in the index and one block decompression (recent blocks are
+cached).
+
+Usage:
+    python -m rag.doc_store                 # size report for the live version
+    python -m rag.doc_store --store <dir>   # size report for a vector store directory
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import zstandard
+
+DATA_FILE = "docs.zst"
+BLOCKS_FILE = "docs_blocks.npy"
+INDEX_FILE = "docs_index.npy"
+
+# Uncompressed bytes per block: larger compresses better, smaller decompresses faster per lookup
+BLOCK_SIZE = 64 * 1024
+
+COMPRESSION_LEVEL = 9
+
+# Decompressed blocks kept per store
+BLOCK_CACHE_SIZE = 64
+
+# Chunk IDs are hex SHA-256 digests (rag.manifest.chunk_id), stored as 32 raw bytes
+INDEX_DTYPE = np.dtype([("id", "S32"), ("block", "<u4"), ("offset", "<u4"), ("length", "<u4")])
+
+# Index entries copied per step when finishing a store
+INDEX_COPY_SIZE = 1 << 20
+
+
+def _id_key(chunk_id: str) -> bytes:
+    # numpy drops trailing NUL bytes of "S" values, so compare without them
+    return bytes.fromhex(chunk_id).rstrip(b"\0")
+
+
+class DocStoreWriter:
+    """
+    Write a chunk text store.
+
+    Texts can be added in any order and more than once; the index is
+    sorted and deduplicated by finish(). Index entries are streamed to a
+    temporary file with each block and sorted there (memory-mapped), so
+    memory use does not grow with the number of chunks. Files are written
+    under temporary names and only replace an existing store once complete.
+
+    Args:
+        store_dir: Vector store directory to write the files to
+    """
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = store_dir
+        self._data = open(store_dir / f"{DATA_FILE}.tmp", "wb")
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._entries = open(store_dir / f"{INDEX_FILE}.entries.tmp", "wb")
+        self._block = bytearray()
+        self._block_entries = []
+        self._blocks = []
+        self._position = 0
+
+    def add(self, chunk_id: str, text: str):
+        data = text.encode("utf-8")
+        self._block_entries.append((bytes.fromhex(chunk_id), len(self._blocks), len(self._block), len(data)))
+        self._block += data
+        if len(self._block) >= BLOCK_SIZE:
+            self._flush_block()
+
+    def _flush_block(self):
+        compressed = self._compressor.compress(bytes(self._block))
+        self._data.write(compressed)
+        self._blocks.append((self._position, len(compressed)))
+        self._position += len(compressed)
+        self._entries.write(np.array(self._block_entries, dtype=INDEX_DTYPE).tobytes())
+        self._block = bytearray()
+        self._block_entries = []
+
+    def _write_index(self, path: Path) -> int:
+        entries_path = self.store_dir / f"{INDEX_FILE}.entries.tmp"
+        if entries_path.stat().st_size == 0:
+            entries_path.unlink()
+            with open(path, "wb") as f:
+                np.save(f, np.empty(0, dtype=INDEX_DTYPE))
+            return 0
+
+        # Sort in place in the mapped file; ties on the ID fall back to
+        # (block, offset), so the first copy of a chunk added more than once comes first
+        entries = np.memmap(entries_path, dtype=INDEX_DTYPE, mode="r+")
+        entries.sort(order="id")
+        keep = np.ones(len(entries), dtype=bool)
+        keep[1:] = entries["id"][1:] != entries["id"][:-1]
+
+        index = np.lib.format.open_memmap(path, mode="w+", dtype=INDEX_DTYPE, shape=(int(keep.sum()),))
+        row = 0
+        for start in range(0, len(entries), INDEX_COPY_SIZE):
+            kept = entries[start:start + INDEX_COPY_SIZE][keep[start:start + INDEX_COPY_SIZE]]
+            index[row:row + len(kept)] = kept
+            row += len(kept)
+        index.flush()
+        count = len(index)
+        del index, entries
+        entries_path.unlink()
+        return count
+
+    def finish(self) -> int:
+        """
+        Write the index files and publish the store.
+
+        Returns:
+            Number of distinct chunks stored
+        """
+        if self._block:
+            self._flush_block()
+        self._data.flush()
+        os.fsync(self._data.fileno())
+        self._data.close()
+        self._entries.close()
+
+        count = self._write_index(self.store_dir / f"{INDEX_FILE}.tmp")
+        with open(self.store_dir / f"{BLOCKS_FILE}.tmp", "wb") as f:
+            np.save(f, np.array(self._blocks, dtype="<u8").reshape(-1, 2))
+        for name in (BLOCKS_FILE, INDEX_FILE, DATA_FILE):
+            os.replace(self.store_dir / f"{name}.tmp", self.store_dir / name)
+        return count
+
+    def abort(self):
+        """Discard a partially written store."""
+        self._data.close()
+        self._entries.close()
+        for name in (DATA_FILE, f"{INDEX_FILE}.entries"):
+            (self.store_dir / f"{name}.tmp").unlink(missing_ok=True)
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped chunk text store.
+
+    Args:
+        store_dir: Vector store directory containing the store files
+    """
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = store_dir
+        self.index = np.load(store_dir / INDEX_FILE, mmap_mode="r")
+        self.blocks = np.load(store_dir / BLOCKS_FILE, mmap_mode="r")
+        with open(store_dir / DATA_FILE, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def exists(store_dir: Path) -> bool:
+        return all((store_dir / name).exists() for name in (DATA_FILE, BLOCKS_FILE, INDEX_FILE))
+
+    def __len__(self):
+        return len(self.index)
+
+    def _block(self, number: int) -> bytes:
+        with self._cache_lock:
+            block = self._cache.get(number)
+            if block is not None:
+                self._cache.move_to_end(number)
+                return block
+
+        offset, length = (int(value) for value in self.blocks[number])
+        # Decompress straight from the mapped pages (no intermediate copy)
+        block = zstandard.ZstdDecompressor().decompress(memoryview(self._data)[offset:offset + length])
+        with self._cache_lock:
+            self._cache[number] = block
+            if len(self._cache) > BLOCK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return block
+
+    def get(self, chunk_id: str) -> Optional[str]:
+        """Get a chunk's text (None if the ID is not in the store)."""
+        key = _id_key(chunk_id)
+        ids = self.index["id"]
+        position = int(np.searchsorted(ids, key))
+        if position >= len(ids) or ids[position] != key:
+            return None
+        _, block, offset, length = self.index[position]
+        return self._block(int(block))[offset:offset + length].decode("utf-8")
+
+    def get_many(self, chunk_ids: list[str]) -> list[Optional[str]]:
+        """Get the texts of several chunks, in the order of chunk_ids."""
+        return [self.get(chunk_id) for chunk_id in chunk_ids]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._cache.clear()
+
+
+def directory_size(path: Path) -> int:
+    """Total size of the files under a directory."""
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def size_report(store_dir: Path) -> dict:
+    """
+    Compare the chunk text store with the Chroma files of a vector store.
+
+    Returns:
+        Dict with "doc_store_bytes", "chroma_bytes" (everything else in
+        the directory), "chunks" and "ratio" (doc store / Chroma)
+    """
+    doc_store_bytes = sum(
+        (store_dir / name).stat().st_size
+        for name in (DATA_FILE, BLOCKS_FILE, INDEX_FILE)
+        if (store_dir / name).exists()
+    )
+    chroma_bytes = directory_size(store_dir) - doc_store_bytes
+    chunks = len(np.load(store_dir / INDEX_FILE, mmap_mode="r")) if (store_dir / INDEX_FILE).exists() else 0
+    return {
+        "doc_store_bytes": doc_store_bytes,
+        "chroma_bytes": chroma_bytes,
+        "chunks": chunks,
+        "ratio": doc_store_bytes / chroma_bytes if chroma_bytes else 0.0,
+    }
+
+
+def print_size_report(store_dir: Path):
+    report = size_report(store_dir)
+    print(f"Chunk text store: {report['doc_store_bytes'] / (1024 * 1024):.1f} MB for {report['chunks']} chunks")
+    print(f"Chroma directory: {report['chroma_bytes'] / (1024 * 1024):.1f} MB "
+          f"(text store is {report['ratio'] * 100:.1f}% of that)")
+
+
+def main():
+    """Print the size report of a vector store's chunk text store."""
+    from rag.retriever import VECTOR_STORE_DIR
+    from rag.versions import current_version_dir
+
+    parser = argparse.ArgumentParser(description="Chunk text store size report")
+    parser.add_argument("--store", type=Path, help="Vector store directory (default: the live version)")
+    args = parser.parse_args()
+
+    store_dir = args.store or current_version_dir(VECTOR_STORE_DIR)
+    if store_dir is None or not DocStore.exists(store_dir):
+        print(f"No chunk text store found in {store_dir or VECTOR_STORE_DIR}")
+        return 1
+    print_size_report(store_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
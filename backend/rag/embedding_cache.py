@@ -0,0 +1,289 @@
+"""
+Embedding Cache
+
+A persistent, content-addressed cache of chunk embeddings, so the same text
+is never embedded twice by the same model - across rebuilds, full rebuilds
+and benchmark runs.
+
+Entries are keyed by model ID plus a hash of the chunk text. Each model has
+its own directory:
+
+    embedding_cache/
+    └── <model>/
+        ├── meta.json     # Model ID and vector dimension
+        ├── vectors.f32   # Row-major float32 vectors, memory-mapped for reads
+        └── keys.bin      # 16-byte text hash per row, same order as vectors.f32
+
+Both files are append-only. Vectors are written before their keys, so a
+crash can at worst leave unreferenced vector rows, which are ignored on
+load and dropped by compaction. Only one build should write a cache at a
+time.
+
+Usage:
+    python -m rag.embedding_cache stats
+    python -m rag.embedding_cache compact --max-size-mb 500
+    python -m rag.embedding_cache clear --model sentence-transformers/all-MiniLM-L6-v2
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Cache location (override with RAG_EMBEDDING_CACHE_DIR)
+CACHE_DIR = Path(os.getenv("RAG_EMBEDDING_CACHE_DIR", Path(__file__).parent / "embedding_cache"))
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    """Content hash of a chunk text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+def model_dir_name(model_id: str) -> str:
+    """Filesystem-safe directory name for a model ID."""
+    return re.sub(r"[^A-Za-z0-9._-]", "__", model_id)
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one model.
+
+    Args:
+        model_id: Identifies the model; vectors of different models never mix
+        cache_dir: Root cache directory
+    """
+
+    def __init__(self, model_id: str, cache_dir: Path = CACHE_DIR):
+        self.model_id = model_id
+        self.dir = cache_dir / model_dir_name(model_id)
+        self.dim = None
+        self._rows = {}
+        self._valid_rows = 0
+        self._vectors = None
+
+        meta_path = self.dir / META_FILE
+        if meta_path.exists():
+            self.dim = json.loads(meta_path.read_text())["dim"]
+            self._load_index()
+
+    def _load_index(self):
+        keys = (self.dir / KEYS_FILE).read_bytes() if (self.dir / KEYS_FILE).exists() else b""
+        vector_rows = (self.dir / VECTORS_FILE).stat().st_size // (self.dim * 4) if (self.dir / VECTORS_FILE).exists() else 0
+
+        # Keys are written after their vectors, so only rows with both are valid
+        rows = min(len(keys) // KEY_SIZE, vector_rows)
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(rows)}
+        self._valid_rows = rows
+        self._vectors = None
+
+    def _mapped(self) -> np.ndarray:
+        """Memory map of the vector file, remapped when it has grown."""
+        if self._vectors is None or self._vectors.shape[0] < self._valid_rows:
+            self._vectors = np.memmap(self.dir / VECTORS_FILE, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._vectors
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, texts: list[str]) -> list[Optional[list[float]]]:
+        """Look up cached vectors (None for misses), in the order of texts."""
+        if not self._rows:
+            return [None] * len(texts)
+        vectors = self._mapped()
+        results = []
+        for text in texts:
+            row = self._rows.get(text_key(text))
+            results.append(vectors[row].tolist() if row is not None else None)
+        return results
+
+    def put(self, texts: list[str], vectors: list[list[float]]):
+        """Append vectors for texts not cached yet."""
+        new = {}
+        for text, vector in zip(texts, vectors):
+            key = text_key(text)
+            if key not in self._rows and key not in new:
+                new[key] = vector
+        if not new:
+            return
+
+        array = np.asarray(list(new.values()), dtype=np.float32)
+        if self.dim is None:
+            self.dim = array.shape[1]
+            self.dir.mkdir(parents=True, exist_ok=True)
+            (self.dir / META_FILE).write_text(json.dumps({"model_id": self.model_id, "dim": self.dim}))
+        elif array.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {array.shape[1]} does not match cache dimension {self.dim}")
+
+        # Start from the last valid row (drops rows orphaned by an earlier crash)
+        with open(self.dir / VECTORS_FILE, "ab") as f:
+            f.truncate(self._valid_rows * self.dim * 4)
+            f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.dir / KEYS_FILE, "ab") as f:
+            f.truncate(self._valid_rows * KEY_SIZE)
+            f.write(b"".join(new))
+            f.flush()
+            os.fsync(f.fileno())
+
+        for key in new:
+            self._rows[key] = self._valid_rows
+            self._valid_rows += 1
+
+    def size_bytes(self) -> int:
+        """Disk space used by this model's cache."""
+        if not self.dir.exists():
+            return 0
+        return sum(path.stat().st_size for path in self.dir.iterdir() if path.is_file())
+
+    def compact(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Rewrite the cache without orphaned rows, evicting the oldest entries
+        if it is larger than max_bytes.
+
+        Returns:
+            Number of entries evicted
+        """
+        if self.dim is None:
+            return 0
+
+        row_bytes = self.dim * 4 + KEY_SIZE
+        keep = len(self._rows)
+        if max_bytes is not None:
+            keep = min(keep, max(0, max_bytes // row_bytes))
+
+        # Rows are in insertion order, so the newest entries are the last ones
+        ordered = sorted(self._rows.items(), key=lambda item: item[1])[len(self._rows) - keep:]
+        vectors = self._mapped() if ordered else None
+
+        tmp_vectors = self.dir / f"{VECTORS_FILE}.tmp"
+        tmp_keys = self.dir / f"{KEYS_FILE}.tmp"
+        with open(tmp_vectors, "wb") as vf, open(tmp_keys, "wb") as kf:
+            for start in range(0, len(ordered), 10000):
+                batch = ordered[start:start + 10000]
+                vf.write(np.ascontiguousarray(vectors[[row for _, row in batch]]).tobytes())
+                kf.write(b"".join(key for key, _ in batch))
+
+        self._vectors = None
+        os.replace(tmp_vectors, self.dir / VECTORS_FILE)
+        os.replace(tmp_keys, self.dir / KEYS_FILE)
+
+        evicted = len(self._rows) - keep
+        self._load_index()
+        return evicted
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document embeddings from an EmbeddingCache
+    and only sends cache misses to the model. Queries are not cached.
+
+    Args:
+        embeddings: Model to embed cache misses with
+        model_id: Cache key of the model (see rag.embeddings.embedding_model_id)
+        cache_dir: Root cache directory
+    """
+
+    def __init__(self, embeddings: Embeddings, model_id: str, cache_dir: Path = CACHE_DIR):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = EmbeddingCache(model_id, cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = self.cache.get(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+def with_cache(embeddings: Embeddings, cache_dir: Path = CACHE_DIR) -> Embeddings:
+    """
+    Wrap an embedding model with the on-disk cache.
+
+    Returns the model unchanged if it is already cached, has no known model
+    ID, or caching is disabled with RAG_EMBEDDING_CACHE=0.
+    """
+    from rag.embeddings import embedding_model_id
+
+    if isinstance(embeddings, CachedEmbeddings) or os.getenv("RAG_EMBEDDING_CACHE", "1") == "0":
+        return embeddings
+    model_id = embedding_model_id(embeddings)
+    if model_id is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, model_id, cache_dir)
+
+
+def list_caches(cache_dir: Path = CACHE_DIR) -> list[EmbeddingCache]:
+    """Open the cache of every model found under cache_dir."""
+    if not cache_dir.exists():
+        return []
+    caches = []
+    for path in sorted(cache_dir.iterdir()):
+        meta_path = path / META_FILE
+        if meta_path.exists():
+            caches.append(EmbeddingCache(json.loads(meta_path.read_text())["model_id"], cache_dir))
+    return caches
+
+
+def main():
+    """Report, compact or clear the embedding cache."""
+    parser = argparse.ArgumentParser(description="Manage the on-disk embedding cache")
+    parser.add_argument("command", choices=["stats", "compact", "clear"])
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help="Cache directory")
+    parser.add_argument("--model", help="Only this model ID (default: all models)")
+    parser.add_argument("--max-size-mb", type=float,
+                        help="compact: evict the oldest entries until each model's cache fits")
+    args = parser.parse_args()
+
+    caches = [cache for cache in list_caches(args.cache_dir) if args.model in (None, cache.model_id)]
+    if not caches:
+        print(f"No embedding cache found at {args.cache_dir}")
+        return 0
+
+    total = 0
+    for cache in caches:
+        if args.command == "compact":
+            max_bytes = int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None
+            evicted = cache.compact(max_bytes)
+            print(f"Compacted {cache.model_id}: evicted {evicted} entries")
+        elif args.command == "clear":
+            shutil.rmtree(cache.dir)
+            print(f"Cleared {cache.model_id}")
+            continue
+
+        size = cache.size_bytes()
+        total += size
+        print(f"  {cache.model_id}: {len(cache)} entries, dim {cache.dim}, {size / (1024 * 1024):.1f} MB")
+
+    if args.command != "clear":
+        print(f"Total: {total / (1024 * 1024):.1f} MB in {args.cache_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Embedding Service
+
+Collects embedding requests from concurrent callers (e.g. several
+/api/rag/retrieve calls arriving at once), waits a few milliseconds for
+more to arrive, and embeds them as one batch. Each caller gets back only
+its own vectors.
+
+One batched matmul uses the CPU's vector units far better than many
+single-query calls queued behind each other on the same model.
+
+Configuration (environment variables):
+- RAG_EMBED_MAX_BATCH: Maximum texts per batch (default: 32)
+- RAG_EMBED_MAX_WAIT_MS: How long the first request waits for company (default: 5)
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class BatchingEmbeddingService(Embeddings):
+    """
+    Embeddings wrapper that micro-batches concurrent requests.
+
+    A single background thread owns the underlying model; callers block on
+    a Future until their batch has been embedded.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+
+        # Counters for monitoring how well requests are being batched
+        self.batches = 0
+        self.texts = 0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    def _submit(self, texts: list[str]) -> list[list[float]]:
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def _collect(self) -> list[tuple[list[str], Future]]:
+        """Block for the first request, then gather more until the batch is full or the wait expires."""
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                texts, future = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append((texts, future))
+            size += len(texts)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self._submit(list(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit([text])[0]
+
+
+# Global service instance (shared by everything in the process that embeds)
+_service: Optional[BatchingEmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> BatchingEmbeddingService:
+    """Get or create the shared embedding service for the configured backend."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            from rag.embeddings import get_embeddings
+            _service = BatchingEmbeddingService(
+                get_embeddings(),
+                max_batch_size=int(os.getenv("RAG_EMBED_MAX_BATCH", "32")),
+                max_wait_ms=float(os.getenv("RAG_EMBED_MAX_WAIT_MS", "5"))
+            )
+    return _service
@@ -0,0 +1,137 @@
+"""
+Embedding Backends
+
+Both the knowledge base builder and the retriever get their embedding
+model from here, so the backend is chosen in one place.
+
+Backends (selected with the RAG_EMBEDDING_BACKEND environment variable):
+- "torch" (default): sentence-transformers through HuggingFaceEmbeddings
+- "onnx": the same model exported to ONNX with int8 dynamic quantization,
+  run through ONNX Runtime on CPU. Export it first with
+  `python -m rag.export_onnx`.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+# Embedding model used for the knowledge base
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Same limit as the sentence-transformers config of all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = 256
+
+# Exported ONNX model (created by rag.export_onnx)
+ONNX_MODEL_DIR = Path(__file__).parent / "onnx_model"
+ONNX_MODEL_FILE = "model_int8.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    MiniLM sentence embeddings computed with ONNX Runtime.
+
+    Reproduces the sentence-transformers pipeline (mean pooling over the
+    attention mask followed by L2 normalization) so vectors are
+    interchangeable with the torch backend.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_MODEL_DIR, batch_size: int = 32):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = model_dir / ONNX_MODEL_FILE
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"ONNX embedding model not found at {model_path}. "
+                "Please run 'python -m rag.export_onnx' first."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = os.getenv("RAG_ONNX_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.batch_size = batch_size
+
+        # Quantized vectors differ slightly from torch ones, and from other exports
+        with open(model_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        self.model_id = f"{EMBEDDING_MODEL_NAME}:onnx-int8:{digest}"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        import numpy as np
+
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            inputs = {
+                name: value.astype(np.int64)
+                for name, value in encoded.items()
+                if name in self.input_names
+            }
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+            # L2 normalization (the model's Normalize layer)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            vectors.extend((pooled / np.clip(norms, 1e-12, None)).tolist())
+
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text])[0]
+
+
+def get_embeddings(backend: str = None) -> Embeddings:
+    """
+    Create the embedding model for the configured backend.
+
+    Args:
+        backend: "torch" or "onnx" (default: RAG_EMBEDDING_BACKEND, else "torch")
+
+    Returns:
+        LangChain Embeddings instance
+    """
+    backend = backend or os.getenv("RAG_EMBEDDING_BACKEND", "torch")
+
+    if backend == "onnx":
+        return OnnxEmbeddings()
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+    raise ValueError(f"Unknown embedding backend: {backend}. Valid backends: ['torch', 'onnx']")
+
+
+def embedding_model_id(embeddings: Embeddings):
+    """
+    Identify the model behind an embedding backend (used as the embedding cache key).
+
+    Returns:
+        Model ID string, or None if the model is unknown
+    """
+    return getattr(embeddings, "model_id", None) or getattr(embeddings, "model_name", None)
@@ -0,0 +1,153 @@
+"""
+ONNX Embedding Model Export
+
+Exports the knowledge base embedding model to ONNX, applies int8 dynamic
+quantization, and checks that the quantized vectors still match the torch
+embeddings closely enough to keep retrieval recall unchanged.
+
+Usage:
+    python -m rag.export_onnx
+
+Then select it with RAG_EMBEDDING_BACKEND=onnx for both build_kb and the
+retriever.
+"""
+
+import json
+import sys
+
+from rag.embeddings import (
+    EMBEDDING_MODEL_NAME,
+    MAX_SEQ_LENGTH,
+    ONNX_MODEL_DIR,
+    ONNX_MODEL_FILE,
+    OnnxEmbeddings,
+)
+
+# Minimum cosine similarity between torch and ONNX vectors for the same text
+MIN_COSINE_SIMILARITY = 0.99
+
+# Parity check texts (short queries and counseling-style passages)
+PARITY_TEXTS = [
+    "I'm feeling anxious about exams",
+    "How do I stop overthinking at night?",
+    "I feel lonely even when I'm around people.",
+    "My partner and I keep arguing about small things and I don't know how to fix it.",
+    "Question: What is cognitive behavioral therapy?\nAnswer: CBT is a structured, "
+    "goal-oriented form of talk therapy that helps people notice and change unhelpful "
+    "thought patterns and behaviors.",
+    "I haven't been able to sleep properly for weeks and it's affecting my work.",
+    "It makes complete sense that you would feel that way after such a loss.",
+    "What are some grounding techniques for panic attacks?",
+]
+
+
+def export_model():
+    """Export the transformer to ONNX and quantize its weights to int8."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    ONNX_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    fp32_path = ONNX_MODEL_DIR / "model_fp32.onnx"
+    int8_path = ONNX_MODEL_DIR / ONNX_MODEL_FILE
+
+    print(f"Loading {EMBEDDING_MODEL_NAME}...")
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(
+        ["export sample"],
+        padding="max_length",
+        truncation=True,
+        max_length=MAX_SEQ_LENGTH,
+        return_tensors="pt"
+    )
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    print(f"Exporting to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    print(f"Quantizing to int8: {int8_path}...")
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+    # Tokenizer files next to the model so the ONNX backend loads offline
+    tokenizer.save_pretrained(str(ONNX_MODEL_DIR))
+
+    fp32_size = fp32_path.stat().st_size / (1024 * 1024)
+    int8_size = int8_path.stat().st_size / (1024 * 1024)
+    print(f"  fp32 model: {fp32_size:.1f} MB, int8 model: {int8_size:.1f} MB")
+
+
+def check_parity() -> dict:
+    """
+    Compare ONNX vectors against the torch backend.
+
+    Returns:
+        Parity statistics (min/mean cosine similarity and top-1 agreement)
+    """
+    import numpy as np
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    torch_vectors = np.array(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME).embed_documents(PARITY_TEXTS)
+    )
+    onnx_vectors = np.array(OnnxEmbeddings().embed_documents(PARITY_TEXTS))
+
+    cosines = (torch_vectors * onnx_vectors).sum(axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1)
+    )
+
+    # Nearest neighbour of each text among the others must not change
+    torch_sim = torch_vectors @ torch_vectors.T
+    onnx_sim = onnx_vectors @ onnx_vectors.T
+    np.fill_diagonal(torch_sim, -np.inf)
+    np.fill_diagonal(onnx_sim, -np.inf)
+    top1_agreement = float((torch_sim.argmax(axis=1) == onnx_sim.argmax(axis=1)).mean())
+
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "top1_agreement": top1_agreement,
+    }
+
+
+def main():
+    """Export, quantize and verify the ONNX embedding model."""
+    print("=" * 60)
+    print("Exporting ONNX Embedding Model")
+    print("=" * 60)
+
+    export_model()
+
+    print("\nChecking parity with torch embeddings...")
+    parity = check_parity()
+    print(f"  Min cosine similarity: {parity['min_cosine']:.4f}")
+    print(f"  Mean cosine similarity: {parity['mean_cosine']:.4f}")
+    print(f"  Nearest-neighbour agreement: {parity['top1_agreement'] * 100:.0f}%")
+
+    with open(ONNX_MODEL_DIR / "export_info.json", "w") as f:
+        json.dump({"model": EMBEDDING_MODEL_NAME, "quantization": "int8-dynamic", **parity}, f, indent=2)
+
+    if parity["min_cosine"] < MIN_COSINE_SIMILARITY or parity["top1_agreement"] < 1.0:
+        print(f"\nError: ONNX vectors drift too far from torch (min cosine must be >= {MIN_COSINE_SIMILARITY}).")
+        return 1
+
+    print(f"\nONNX model ready at {ONNX_MODEL_DIR}")
+    print("Enable it with: RAG_EMBEDDING_BACKEND=onnx")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
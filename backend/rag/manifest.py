@@ -0,0 +1,102 @@
+"""
+Build Manifest
+
+Records every chunk in a knowledge base version by content hash (source +
+chunker and embedding model parameters + chunk text), so a rebuild only embeds chunks that are
+new or changed and removes chunks that disappeared.
+
+The manifest is a SQLite file next to the Chroma files. A batch is marked
+committed only after it has been written to Chroma, so an interrupted build
+resumes from its last committed batch.
+"""
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+MANIFEST_FILE = "build_manifest.sqlite"
+
+
+def chunk_id(source: str, text: str, chunker_params: dict) -> str:
+    """Content hash identifying a chunk (also used as its Chroma ID)."""
+    key = json.dumps([source, chunker_params, text], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """
+    Committed chunks of one knowledge base version.
+
+    Args:
+        store_dir: Vector store directory the manifest belongs to
+        run_id: Identifier of the current build run; chunks not seen by
+            this run are stale once it has read the whole corpus
+    """
+
+    def __init__(self, store_dir: Path, run_id: str):
+        self.run_id = run_id
+        self.conn = sqlite3.connect(str(store_dir / MANIFEST_FILE))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id TEXT PRIMARY KEY, source TEXT NOT NULL, run_id TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_run ON chunks (run_id)")
+        self.conn.commit()
+
+    def is_committed(self, chunk_id: str) -> bool:
+        """Check whether a chunk is already embedded and stored."""
+        return self.conn.execute("SELECT 1 FROM chunks WHERE id = ?", (chunk_id,)).fetchone() is not None
+
+    def mark_seen(self, chunk_ids: list[str]):
+        """Mark committed chunks as still present in this run's corpus."""
+        self.conn.executemany(
+            "UPDATE chunks SET run_id = ? WHERE id = ?",
+            [(self.run_id, cid) for cid in chunk_ids]
+        )
+
+    def commit_batch(self, entries: list[tuple[str, str]]):
+        """
+        Record a batch of (chunk_id, source) that has been written to Chroma.
+
+        Commits the transaction, which also persists earlier mark_seen() calls.
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (id, source, run_id) VALUES (?, ?, ?)",
+            [(cid, source, self.run_id) for cid, source in entries]
+        )
+        self.conn.commit()
+
+    def stale(self, keep_sources=()) -> dict[str, list[str]]:
+        """
+        Chunks not seen by this run, grouped by source.
+
+        Args:
+            keep_sources: Sources to leave alone (e.g. datasets that failed to
+                load this run, whose chunks must not be mistaken for deleted)
+        """
+        rows = self.conn.execute("SELECT id, source FROM chunks WHERE run_id != ?", (self.run_id,))
+        stale = {}
+        for cid, source in rows:
+            if source not in keep_sources:
+                stale.setdefault(source, []).append(cid)
+        return stale
+
+    def chunk_ids(self, sources):
+        """Iterate over the IDs of the committed chunks of some sources."""
+        for source in sources:
+            for (cid,) in self.conn.execute("SELECT id FROM chunks WHERE source = ?", (source,)):
+                yield cid
+
+    def remove(self, chunk_ids: list[str]):
+        """Forget deleted chunks."""
+        self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(cid,) for cid in chunk_ids])
+        self.conn.commit()
+
+    def counts(self) -> dict[str, int]:
+        """Number of committed chunks per source."""
+        return dict(self.conn.execute("SELECT source, COUNT(*) FROM chunks GROUP BY source"))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,190 @@
+"""
+API Memory Report
+
+Starts the API with 1 to 8 uvicorn workers, sends RAG queries so every
+worker loads the knowledge base, and measures the memory of the whole
+process tree. Reports RSS and PSS (proportional set size: shared pages are
+split between the processes sharing them, so PSS adds up to the real
+total) and the memory each additional worker costs.
+
+Comparing index backends shows what the shared memory-mapped index saves:
+with "mmap" the vectors and chunk texts are page-cache pages shared by all
+workers, with "chroma" each worker loads its own HNSW indexes.
+
+Linux only (reads /proc/<pid>/smaps_rollup). Needs a built knowledge base.
+
+Usage:
+    python -m rag.memory_report
+    python -m rag.memory_report --workers 1,2,4,8 --index-backends mmap,chroma --output memory.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+WORKER_COUNTS = [1, 2, 4, 8]
+INDEX_BACKENDS = ["mmap", "chroma"]
+
+# Queries sent per worker so that (almost certainly) every worker has served one
+QUERIES_PER_WORKER = 8
+
+QUERIES = [
+    "I can't sleep because I keep worrying about work",
+    "How do I deal with feeling lonely?",
+    "What can I do when I have a panic attack?",
+    "My friend is depressed, how can I help?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_health(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"API did not become healthy within {timeout:.0f}s")
+
+
+def query(port: int, text: str):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/rag/retrieve",
+        data=json.dumps({"query": text, "topK": 3}).encode(),
+        headers={"Content-Type": "application/json", "Connection": "close"},
+    )
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+
+
+def process_tree(root_pid: int) -> list[int]:
+    """PIDs of a process and all its descendants."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def process_memory(pid: int) -> dict:
+    """RSS, PSS, shared and private memory of a process in MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def measure(workers: int, index_backend: str, startup_timeout: float) -> dict:
+    """Run the API with a number of workers and measure its process tree."""
+    port = free_port()
+    env = dict(os.environ, RAG_INDEX_BACKEND=index_backend)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.server:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        wait_for_health(port, startup_timeout)
+        texts = [QUERIES[i % len(QUERIES)] for i in range(workers * QUERIES_PER_WORKER)]
+        with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+            list(pool.map(lambda text: query(port, text), texts))
+        time.sleep(1)
+
+        processes = []
+        for pid in process_tree(server.pid):
+            try:
+                processes.append({"pid": pid, **process_memory(pid)})
+            except OSError:
+                continue
+        return {
+            "workers": workers,
+            "index_backend": index_backend,
+            "processes": processes,
+            "total_rss_mb": sum(p["rss_mb"] for p in processes),
+            "total_pss_mb": sum(p["pss_mb"] for p in processes),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    """Measure API memory for each worker count and index backend."""
+    parser = argparse.ArgumentParser(description="Measure API memory across uvicorn worker counts")
+    parser.add_argument("--workers", default=",".join(map(str, WORKER_COUNTS)), help="Comma-separated worker counts")
+    parser.add_argument("--index-backends", default=",".join(INDEX_BACKENDS), help="Comma-separated RAG_INDEX_BACKEND values")
+    parser.add_argument("--startup-timeout", type=float, default=300, help="Seconds to wait for the API to start")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    if not Path("/proc/self/smaps_rollup").exists():
+        print("Error: this report needs Linux /proc/<pid>/smaps_rollup")
+        return 1
+
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    runs = []
+    for index_backend in args.index_backends.split(","):
+        for workers in worker_counts:
+            print(f"Measuring {workers} worker(s), index backend {index_backend}...", file=sys.stderr)
+            runs.append(measure(workers, index_backend, args.startup_timeout))
+
+    # Memory added by each worker beyond the first, from the PSS totals
+    for run in runs:
+        base = next(r for r in runs if r["index_backend"] == run["index_backend"] and r["workers"] == min(worker_counts))
+        extra = run["workers"] - base["workers"]
+        run["per_worker_increment_mb"] = (run["total_pss_mb"] - base["total_pss_mb"]) / extra if extra else None
+
+    print(f"\n{'index':<8} {'workers':>7} {'total RSS MB':>13} {'total PSS MB':>13} {'MB per extra worker':>20}")
+    for run in runs:
+        increment = run["per_worker_increment_mb"]
+        increment = f"{increment:.1f}" if increment is not None else "-"
+        print(f"{run['index_backend']:<8} {run['workers']:>7} {run['total_rss_mb']:>13.1f} "
+              f"{run['total_pss_mb']:>13.1f} {increment:>20}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"runs": runs}, indent=2))
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
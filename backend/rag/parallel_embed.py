@@ -0,0 +1,139 @@
+"""
+Parallel Embedding
+
+Embeds document batches across several worker processes on CPU. Each
+worker loads its own copy of the embedding model and is pinned to a fixed
+number of torch (or ONNX Runtime) threads, so N workers x T threads fill
+the machine without oversubscribing it.
+
+A batch is split into tasks of TASK_SIZE texts, which the process pool
+queues and hands to whichever worker is free; results are reassembled in
+input order.
+
+Configuration (environment variables, overridden by build_kb flags):
+- RAG_EMBED_WORKERS: Worker processes (default: 1, embed in-process)
+- RAG_EMBED_TORCH_THREADS: Threads per worker (default: CPUs / workers)
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+# Texts per task sent to a worker: large enough to amortize pickling,
+# small enough to keep every worker busy until the end of a batch
+TASK_SIZE = 256
+
+# Model loaded by each worker process (set by _init_worker)
+_worker_embeddings = None
+
+
+def default_threads(workers: int) -> int:
+    """Threads per worker that spread the CPUs evenly across workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def pin_threads(threads: int):
+    """
+    Limit this process's math libraries to `threads` threads.
+
+    Must run before torch is imported for the OpenMP/MKL settings to apply.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "RAG_ONNX_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        # No torch (ONNX backend) or interop threads already fixed
+        pass
+
+
+def _init_worker(backend: str, threads: int):
+    global _worker_embeddings
+    from rag.embeddings import get_embeddings
+
+    pin_threads(threads)
+    _worker_embeddings = get_embeddings(backend)
+
+
+def _worker_model_id():
+    from rag.embeddings import embedding_model_id
+    return embedding_model_id(_worker_embeddings)
+
+
+def _embed_task(texts: list[str]):
+    import numpy as np
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+class ParallelEmbeddings(Embeddings):
+    """
+    Embeddings that fan document batches out to a pool of worker processes.
+
+    Args:
+        workers: Number of worker processes
+        threads: Torch threads per worker (default: CPUs / workers)
+        backend: Embedding backend to load in each worker (default: RAG_EMBEDDING_BACKEND)
+        task_size: Texts per task sent to a worker
+    """
+
+    def __init__(self, workers: int, threads: int = None, backend: str = None, task_size: int = TASK_SIZE):
+        self.workers = workers
+        self.threads = threads or default_threads(workers)
+        self.task_size = task_size
+        backend = backend or os.getenv("RAG_EMBEDDING_BACKEND", "torch")
+
+        # Spawn, not fork: forking a process that has touched torch/OpenMP can deadlock
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend, self.threads)
+        )
+
+        # Also waits for a first worker to load the model, surfacing load errors early
+        self.model_id = self.pool.submit(_worker_model_id).result()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        tasks = [texts[start:start + self.task_size] for start in range(0, len(texts), self.task_size)]
+        vectors = []
+        # map() keeps results in task order whatever order workers finish in
+        for result in self.pool.map(_embed_task, tasks):
+            vectors.extend(result.tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        """Stop the worker processes."""
+        self.pool.shutdown()
+
+
+def get_build_embeddings(workers: int = None, threads: int = None) -> Embeddings:
+    """
+    Create the embedding model for a knowledge base build.
+
+    Args:
+        workers: Worker processes (default: RAG_EMBED_WORKERS, else 1)
+        threads: Threads per worker (default: RAG_EMBED_TORCH_THREADS, else CPUs / workers)
+
+    Returns:
+        ParallelEmbeddings for more than one worker, else the in-process model
+    """
+    from rag.embeddings import get_embeddings
+
+    workers = workers or int(os.getenv("RAG_EMBED_WORKERS", "1"))
+    threads = threads or int(os.getenv("RAG_EMBED_TORCH_THREADS", "0")) or default_threads(workers)
+
+    if workers > 1:
+        print(f"Embedding with {workers} worker processes x {threads} threads")
+        return ParallelEmbeddings(workers, threads)
+
+    pin_threads(threads)
+    return get_embeddings()
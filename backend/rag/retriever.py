@@ -3,78 +3,373 @@ RAG Retriever
 
 This module provides retrieval functionality for the RAG system.
 It loads the pre-built vector store and retrieves relevant chunks for queries.
+
+The vector store is split into one partition per source dataset. When a
+healer is given, only the partitions that healer prefers are searched and
+their scores are weighted by the healer's source preferences. Searches
+return chunk IDs and scores; the texts of the final hits are read from the
+memory-mapped chunk text store (rag/doc_store.py).
+
+Versions that include the flat vector index (rag/vector_index.py) are
+searched through it instead of Chroma, so every uvicorn worker shares one
+page-cache copy of the vectors and texts (RAG_INDEX_BACKEND=chroma keeps
+using Chroma).
+
+The live knowledge base is whichever version vector_store/CURRENT points
+to. reload_knowledge_base() (called by the admin endpoint or the file
+watcher) loads a newly published version in the background, warms it up
+and swaps it in; queries already running finish on the old version, whose
+memory is released once they are done.
 """
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
+from contextlib import contextmanager
+from langchain_core.embeddings import Embeddings
 from pathlib import Path
+from typing import Optional
+import chromadb
+import gc
 import os
+import threading
+import time
 
-# Vector store directory
+from rag.doc_store import DocStore
+from rag.embedding_service import get_embedding_service
+from rag.sources import load_partition_manifest, select_partitions
+from rag.vector_index import VectorIndex
+from rag.versions import CURRENT_FILE, current_version_dir
+
+# Vector store directory (root of all knowledge base versions)
 VECTOR_STORE_DIR = Path(__file__).parent / "vector_store"
 
-# Global retriever instance (lazy loaded)
-_retriever = None
-_vectorstore = None
+# Collection used by vector stores built before partitioning (LangChain's default name)
+LEGACY_COLLECTION = "langchain"
+
+# Global knowledge base instance (lazy loaded, swapped on reload)
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_watcher = None
 
 
-def get_retriever(k: int = 5):
+class KnowledgeBase:
     """
-    Get or create the retriever instance.
+    A loaded vector store and the embedding model used to query it.
     
     Args:
-        k: Number of chunks to retrieve (default: 5)
-    
-    Returns:
-        Retriever instance
+        store_dir: Directory of a built vector store
+        embeddings: Embedding model for queries (default: the shared embedding service)
     """
-    global _retriever, _vectorstore
     
-    # Check if vector store exists
-    if not VECTOR_STORE_DIR.exists() or not any(VECTOR_STORE_DIR.iterdir()):
+    def __init__(self, store_dir: Path, embeddings: Optional[Embeddings] = None):
+        self.store_dir = store_dir
+        self.embeddings = embeddings or get_embedding_service()
+        
+        manifest = load_partition_manifest(store_dir)
+        self.partitioned = manifest is not None
+        if manifest is None:
+            # Built before partitioning: a single default collection
+            manifest = [{"source": None, "record_type": None, "collection": LEGACY_COLLECTION, "chunks": None}]
+        self.partitions = manifest
+        
+        # Chunk texts live in the memory-mapped text store (older builds keep them in Chroma)
+        self.doc_store = DocStore(store_dir) if DocStore.exists(store_dir) else None
+        
+        # Search the shared memory-mapped index when the version has one;
+        # Chroma is then never opened in this process
+        self.index = None
+        self.client = None
+        self.collections = {}
+        use_index = os.getenv("RAG_INDEX_BACKEND", "mmap") == "mmap"
+        if use_index and self.partitioned and self.doc_store is not None and VectorIndex.exists(store_dir):
+            self.index = VectorIndex(store_dir, manifest)
+        else:
+            # Queries are embedded by us, so collections need no embedding function
+            self.client = chromadb.PersistentClient(path=str(store_dir))
+            self.collections = {
+                partition["collection"]: self.client.get_collection(partition["collection"], embedding_function=None)
+                for partition in manifest
+            }
+        
+        # Queries currently running on this instance (see knowledge_base_session)
+        self._active = 0
+        self._idle = threading.Condition()
+    
+    def acquire(self):
+        """Register a query in flight."""
+        with self._idle:
+            self._active += 1
+    
+    def release(self):
+        """Unregister a finished query."""
+        with self._idle:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.notify_all()
+    
+    def close(self):
+        """
+        Wait for in-flight queries to finish, then free the index.
+        
+        Chroma caches one client system per directory, so the old version's
+        system is stopped and evicted from that cache; otherwise its HNSW
+        indexes would stay in memory for the life of the process.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: self._active == 0)
+        
+        if self.client is not None:
+            try:
+                from chromadb.api.client import SharedSystemClient
+                system = self.client._system
+                system.stop()
+                # Spelled "_identifer_to_system" in older Chroma releases
+                systems = getattr(SharedSystemClient, "_identifier_to_system", None)
+                if systems is None:
+                    systems = SharedSystemClient._identifer_to_system
+                systems.pop(SharedSystemClient._get_identifier_from_settings(system.settings), None)
+            except Exception as e:
+                print(f"Warning: could not release knowledge base at {self.store_dir}: {e}")
+        
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self.doc_store is not None:
+            self.doc_store.close()
+            self.doc_store = None
+        self.collections = {}
+        self.client = None
+    
+    def search(self, query: str, top_k: int = 5, healer_id: Optional[str] = None) -> list[dict]:
+        """
+        Search the partitions selected for a healer and merge their results.
+        
+        Each partition returns its own top_k hits; their cosine similarities
+        are multiplied by the partition weight and the best top_k overall are kept.
+        
+        Args:
+            query: User's query string
+            top_k: Number of chunks to retrieve
+            healer_id: Healer whose source preferences to apply (optional, ignored
+                for stores built before partitioning)
+        
+        Returns:
+            List of hits, each a dict with "id", "text", "metadata" and "score"
+        """
+        if self.partitioned:
+            selected = select_partitions(self.partitions, healer_id)
+        else:
+            selected = [(self.partitions[0], 1.0)]
+        if not selected:
+            return []
+        
+        # Embed the query once and reuse it for every partition
+        query_embedding = self.embeddings.embed_query(query)
+        
+        include = ["metadatas", "distances"]
+        if self.doc_store is None:
+            include.append("documents")
+        
+        hits = []
+        for partition, weight in selected:
+            if self.index is not None:
+                for chunk_id, similarity, metadata in self.index.search(partition["collection"], query_embedding, top_k):
+                    hits.append({"id": chunk_id, "text": None, "metadata": metadata, "score": similarity * weight})
+                continue
+            
+            results = self.collections[partition["collection"]].query(
+                query_embeddings=[query_embedding],
+                n_results=top_k,
+                include=include
+            )
+            for i, (chunk_id, metadata, distance) in enumerate(zip(
+                results["ids"][0], results["metadatas"][0], results["distances"][0]
+            )):
+                # Chroma returns squared L2 distance; on unit vectors that is 2 - 2 * cosine
+                similarity = 1.0 - distance / 2
+                hits.append({
+                    "id": chunk_id,
+                    "text": results["documents"][0][i] if self.doc_store is None else None,
+                    "metadata": metadata,
+                    "score": similarity * weight,
+                })
+        
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        hits = hits[:top_k]
+        
+        # Only the texts of the hits that are returned are read
+        if self.doc_store is not None:
+            for hit in hits:
+                hit["text"] = self.doc_store.get(hit["id"])
+            hits = [hit for hit in hits if hit["text"] is not None]
+        return hits
+
+
+def _load_current() -> KnowledgeBase:
+    """Load and warm up the version CURRENT points to."""
+    store_dir = current_version_dir(VECTOR_STORE_DIR)
+    if store_dir is None:
         raise FileNotFoundError(
             f"Vector store not found at {VECTOR_STORE_DIR}. "
             "Please run 'python -m rag.build_kb' first to build the knowledge base."
         )
     
-    # Lazy load vector store and retriever
-    if _vectorstore is None:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+    knowledge_base = KnowledgeBase(store_dir)
+    # Warm-up query: loads the HNSW indexes and the embedding model before serving
+    knowledge_base.search("warm up", top_k=1)
+    print(f"Loaded vector store from {store_dir} ({len(knowledge_base.partitions)} partitions)")
+    return knowledge_base
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """
+    Get or load the live knowledge base instance.
+    
+    Returns:
+        KnowledgeBase for the version CURRENT points to
+    """
+    global _knowledge_base
+    
+    # Lazy load vector store
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = _load_current()
+        return _knowledge_base
+
+
+@contextmanager
+def knowledge_base_session():
+    """
+    Use the live knowledge base for one query.
+    
+    The instance stays valid until the block exits even if a reload swaps
+    in a newer version meanwhile.
+    """
+    with _knowledge_base_lock:
+        knowledge_base = _knowledge_base
+        if knowledge_base is None:
+            knowledge_base = _knowledge_base = _load_current()
+        knowledge_base.acquire()
+    try:
+        yield knowledge_base
+    finally:
+        knowledge_base.release()
+
+
+def _retire(knowledge_base: KnowledgeBase):
+    """Close a replaced knowledge base once its last query finishes."""
+    knowledge_base.close()
+    gc.collect()
+    print(f"Released old vector store {knowledge_base.store_dir}")
+
+
+def reload_knowledge_base() -> dict:
+    """
+    Load the version CURRENT points to and swap it in if it changed.
+    
+    The new version is loaded and warmed up while the old one keeps
+    serving. Queries started before the swap finish on the old version,
+    which is closed in the background afterwards.
+    
+    Returns:
+        Dict with "status" ("reloaded", "unchanged" or "busy") and "version"
+    """
+    global _knowledge_base
+    
+    if not _reload_lock.acquire(blocking=False):
+        return {"status": "busy", "version": None}
+    
+    try:
+        store_dir = current_version_dir(VECTOR_STORE_DIR)
+        old = _knowledge_base
+        if old is not None and store_dir == old.store_dir:
+            return {"status": "unchanged", "version": store_dir.name}
         
-        _vectorstore = Chroma(
-            persist_directory=str(VECTOR_STORE_DIR),
-            embedding_function=embeddings
-        )
+        new = _load_current()
+        with _knowledge_base_lock:
+            old, _knowledge_base = _knowledge_base, new
         
-        print(f"Loaded vector store from {VECTOR_STORE_DIR}")
+        if old is not None:
+            threading.Thread(target=_retire, args=(old,), name="kb-retire", daemon=True).start()
+        return {"status": "reloaded", "version": new.store_dir.name}
+    finally:
+        _reload_lock.release()
+
+
+def reload_knowledge_base_async() -> dict:
+    """Start reload_knowledge_base() in a background thread."""
+    if _reload_lock.locked():
+        return {"status": "busy"}
     
-    # Create retriever with search parameters
-    _retriever = _vectorstore.as_retriever(
-        search_kwargs={"k": k}
-    )
+    def reload():
+        try:
+            result = reload_knowledge_base()
+            print(f"Knowledge base reload: {result['status']} ({result['version']})")
+        except Exception as e:
+            print(f"Error reloading knowledge base: {e}")
     
-    return _retriever
+    threading.Thread(target=reload, name="kb-reload", daemon=True).start()
+    return {"status": "reloading"}
 
 
-def retrieve_context(query: str, top_k: int = 5) -> list[str]:
+def start_watcher(interval: float = None):
+    """
+    Poll vector_store/CURRENT and reload when a new version is published.
+    
+    Args:
+        interval: Seconds between checks (default: RAG_KB_WATCH_INTERVAL; 0 disables)
+    """
+    global _watcher
+    
+    if interval is None:
+        interval = float(os.getenv("RAG_KB_WATCH_INTERVAL", "0"))
+    if interval <= 0 or _watcher is not None:
+        return
+    
+    pointer = VECTOR_STORE_DIR / CURRENT_FILE
+    
+    def read_pointer():
+        return pointer.read_text().strip() if pointer.exists() else None
+    
+    def watch():
+        last_seen = read_pointer()
+        while True:
+            time.sleep(interval)
+            seen = read_pointer()
+            if seen == last_seen:
+                continue
+            
+            # Nothing loaded yet means the next query loads the new version anyway
+            if _knowledge_base is not None:
+                print(f"New knowledge base version published: {seen}")
+                try:
+                    if reload_knowledge_base()["status"] == "busy":
+                        continue
+                except Exception as e:
+                    print(f"Error reloading knowledge base: {e}")
+            last_seen = seen
+    
+    _watcher = threading.Thread(target=watch, name="kb-watcher", daemon=True)
+    _watcher.start()
+
+
+def retrieve_context(query: str, top_k: int = 5, healer_id: Optional[str] = None) -> list[str]:
     """
     Retrieve relevant context chunks for a query.
     
     Args:
         query: User's query string
         top_k: Number of chunks to retrieve
+        healer_id: Healer whose source preferences to apply (optional)
     
     Returns:
         List of retrieved text chunks
     """
     try:
-        retriever = get_retriever(k=top_k)
-        documents = retriever.invoke(query)
+        with knowledge_base_session() as knowledge_base:
+            hits = knowledge_base.search(query, top_k=top_k, healer_id=healer_id)
         
-        # Extract text content from documents
-        chunks = [doc.page_content for doc in documents]
+        # Extract text content from hits
+        chunks = [hit["text"] for hit in hits]
         
         return chunks
     
@@ -88,5 +383,4 @@ def retrieve_context(query: str, top_k: int = 5) -> list[str]:
 
 def is_available() -> bool:
     """Check if RAG system is available (vector store exists)."""
-    return VECTOR_STORE_DIR.exists() and any(VECTOR_STORE_DIR.iterdir())
-
+    return current_version_dir(VECTOR_STORE_DIR) is not None
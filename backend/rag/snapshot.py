@@ -0,0 +1,180 @@
+"""
+Local Dataset Snapshots
+
+Lets the knowledge base be built without network access. The snapshot
+command downloads every configured dataset once and stores it as Arrow IPC
+files; later builds read those files through memory-mapped Arrow instead of
+streaming from the HuggingFace Hub.
+
+Builds also accept Parquet and JSONL files dropped into a dataset's snapshot
+directory. Text is extracted column-wise: the string columns of a whole
+file are joined with vectorized Arrow compute kernels, with the same rules
+as build_kb.extract_text() (non-blank string fields joined by newlines,
+texts of 50 characters or less dropped).
+
+Layout:
+    snapshots/
+    └── <owner>__<dataset>/
+        ├── snapshot.json      # Dataset name, fingerprint, rows, creation time
+        ├── part-00000.arrow
+        └── part-00001.arrow
+
+Usage:
+    python -m rag.snapshot                      # snapshot every dataset in sources.HF_DATASETS
+    python -m rag.snapshot --datasets tolu07/Mental_Health_FAQ
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from rag.sources import HF_DATASETS, partition_name
+
+# Snapshot location (override with RAG_SNAPSHOT_DIR)
+SNAPSHOT_DIR = Path(os.getenv("RAG_SNAPSHOT_DIR", Path(__file__).parent / "snapshots"))
+
+SNAPSHOT_INFO_FILE = "snapshot.json"
+
+# Rows per snapshot file; each file is one unit of parallel extraction work
+ROWS_PER_FILE = 100_000
+
+# Same threshold as build_kb.extract_text()
+MIN_TEXT_LENGTH = 50
+
+SNAPSHOT_SUFFIXES = (".arrow", ".parquet", ".jsonl")
+
+
+def snapshot_dir(name: str, root: Path = SNAPSHOT_DIR) -> Path:
+    """Directory holding the snapshot of a dataset."""
+    return root / partition_name(name)
+
+
+def snapshot_files(name: str, root: Path = SNAPSHOT_DIR) -> Optional[list[Path]]:
+    """
+    Get the local data files of a dataset.
+
+    Returns:
+        Sorted list of Arrow/Parquet/JSONL files, or None if there is no snapshot
+    """
+    directory = snapshot_dir(name, root)
+    if not directory.is_dir():
+        return None
+    files = sorted(path for path in directory.iterdir() if path.suffix in SNAPSHOT_SUFFIXES)
+    return files or None
+
+
+def read_table(path: Path) -> pa.Table:
+    """Read a snapshot file; Arrow and Parquet files are memory-mapped, not copied."""
+    if path.suffix == ".arrow":
+        return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(str(path), memory_map=True)
+    if path.suffix == ".jsonl":
+        import pyarrow.json as pj
+        return pj.read_json(str(path))
+    raise ValueError(f"Unsupported snapshot file: {path}")
+
+
+def extract_texts(table: pa.Table) -> list[str]:
+    """
+    Vectorized equivalent of build_kb.extract_text() over a whole table.
+
+    Returns:
+        Texts of the rows that pass the length filter, in row order
+    """
+    columns = []
+    for field in table.schema:
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            continue
+        column = table.column(field.name).cast(pa.large_string())
+        # Blank fields are skipped, like `value.strip()` being falsy
+        blank = pc.equal(pc.utf8_trim_whitespace(column), "")
+        columns.append(pc.if_else(blank, pa.scalar(None, column.type), column))
+
+    if not columns:
+        return []
+
+    separator = pa.scalar("\n", pa.large_string())
+    joined = pc.binary_join_element_wise(*columns, separator, null_handling="skip")
+    keep = pc.fill_null(pc.greater(pc.utf8_length(joined), MIN_TEXT_LENGTH), False)
+    return pc.filter(joined, keep).to_pylist()
+
+
+def write_snapshot(name: str, root: Path = SNAPSHOT_DIR, rows_per_file: int = ROWS_PER_FILE) -> dict:
+    """
+    Download a dataset and store it as Arrow IPC files.
+
+    The previous snapshot is replaced only once the new one is complete.
+
+    Returns:
+        Snapshot info (also written to snapshot.json)
+    """
+    import shutil
+    from datasets import load_dataset
+
+    ds = load_dataset(name, split="train")
+    table = ds.data.table
+
+    directory = snapshot_dir(name, root)
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    files = 0
+    for start in range(0, max(1, table.num_rows), rows_per_file):
+        part = table.slice(start, rows_per_file)
+        with pa.OSFile(str(tmp_dir / f"part-{files:05d}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, part.schema) as writer:
+                writer.write_table(part)
+        files += 1
+
+    info = {
+        "dataset": name,
+        "fingerprint": ds._fingerprint,
+        "rows": table.num_rows,
+        "files": files,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    (tmp_dir / SNAPSHOT_INFO_FILE).write_text(json.dumps(info, indent=2))
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return info
+
+
+def main():
+    """Snapshot the configured datasets for offline builds."""
+    parser = argparse.ArgumentParser(description="Snapshot knowledge base datasets for offline builds")
+    parser.add_argument("--datasets", nargs="+", default=list(HF_DATASETS), help="Datasets to snapshot")
+    parser.add_argument("--output", type=Path, default=SNAPSHOT_DIR, help="Snapshot directory")
+    parser.add_argument("--rows-per-file", type=int, default=ROWS_PER_FILE, help="Rows per Arrow file")
+    args = parser.parse_args()
+
+    failed = []
+    for name in args.datasets:
+        print(f"Snapshotting {name}...")
+        try:
+            info = write_snapshot(name, args.output, args.rows_per_file)
+            print(f"  {info['rows']} rows in {info['files']} files")
+        except Exception as e:
+            print(f"  Error snapshotting {name}: {e}")
+            failed.append(name)
+
+    print(f"\nSnapshots saved to: {args.output}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        return 1
+    print("Build offline with: RAG_SOURCE=local python -m rag.build_kb")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
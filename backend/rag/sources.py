@@ -0,0 +1,113 @@
+"""
+Knowledge Base Sources
+
+This module describes where the knowledge base content comes from.
+Each HuggingFace dataset is tagged with a record type, and every dataset
+is written to its own partition (a Chroma collection) so retrieval can
+restrict or weight sources per healer.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Optional
+
+# HuggingFace datasets for mental health counseling, with the kind of
+# records each one contains
+HF_DATASETS = {
+    "mrs83/kurtis_mental_health_final": "counseling_qa",
+    "samhog/psychology-RLHF": "counseling_qa",
+    "Felladrin/pretrain-mental-health-counseling-conversations": "dialogue",
+    "LuangMV97/Empathetic_counseling_Dataset": "empathetic_dialogue",
+    "tolu07/Mental_Health_FAQ": "faq",
+    "thu-coai/augesc": "empathetic_dialogue",
+    "nbertagnolli/counsel-chat": "counseling_qa",
+    "Amod/mental_health_counseling_conversations": "counseling_qa",
+    "ZahrizhalAli/mental_health_conversational_dataset": "dialogue",
+}
+
+# Per-healer source weights, keyed by record type.
+# Record types that are missing (or weighted 0) are not searched at all.
+HEALER_SOURCE_WEIGHTS = {
+    "milo": {"empathetic_dialogue": 1.0, "dialogue": 0.9, "counseling_qa": 0.7},
+    "leo": {"faq": 1.0, "counseling_qa": 0.9, "dialogue": 0.6},
+    "luna": {"empathetic_dialogue": 1.0, "counseling_qa": 0.8, "dialogue": 0.8},
+    "max": {"dialogue": 1.0, "counseling_qa": 0.9, "empathetic_dialogue": 0.8, "faq": 0.6},
+}
+
+# Partition manifest written next to the Chroma files
+PARTITIONS_FILE = "partitions.json"
+
+
+def partition_name(source: str) -> str:
+    """
+    Get the Chroma collection name for a source dataset.
+
+    Chroma collection names must be 3-63 characters of [a-zA-Z0-9._-],
+    so "owner/dataset" becomes "owner__dataset".
+    """
+    name = re.sub(r"[^a-zA-Z0-9._-]", "_", source.replace("/", "__"))
+    return name[:63].strip("._-")
+
+
+def record_type(source: str) -> str:
+    """Get the record type of a source dataset."""
+    return HF_DATASETS.get(source, "unknown")
+
+
+def write_partition_manifest(store_dir: Path, counts: dict[str, int]):
+    """
+    Write the partition manifest for a built vector store.
+
+    Args:
+        store_dir: Vector store directory
+        counts: Number of chunks written per source
+    """
+    partitions = [
+        {
+            "source": source,
+            "record_type": record_type(source),
+            "collection": partition_name(source),
+            "chunks": count,
+        }
+        for source, count in counts.items()
+    ]
+    with open(store_dir / PARTITIONS_FILE, "w") as f:
+        json.dump({"partitions": partitions}, f, indent=2)
+
+
+def load_partition_manifest(store_dir: Path) -> Optional[list[dict]]:
+    """
+    Load the partition manifest of a vector store.
+
+    Returns:
+        List of partition entries, or None for stores built before
+        partitioning (a single default collection)
+    """
+    manifest_path = store_dir / PARTITIONS_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)["partitions"]
+
+
+def select_partitions(partitions: list[dict], healer_id: Optional[str] = None) -> list[tuple[dict, float]]:
+    """
+    Pick the partitions to search for a healer and their score weights.
+
+    Args:
+        partitions: Partition entries from the manifest
+        healer_id: Healer to apply source preferences for (None searches everything)
+
+    Returns:
+        List of (partition, weight) pairs with weight > 0
+    """
+    weights = HEALER_SOURCE_WEIGHTS.get(healer_id) if healer_id else None
+    if weights is None:
+        return [(partition, 1.0) for partition in partitions]
+
+    selected = [
+        (partition, weights.get(partition["record_type"], 0.0))
+        for partition in partitions
+    ]
+    return [(partition, weight) for partition, weight in selected if weight > 0]
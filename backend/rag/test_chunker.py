@@ -0,0 +1,198 @@
+"""
+Chunker Parity and Speed Test
+
+Checks that rag.chunker produces exactly the same chunks as LangChain's
+RecursiveCharacterTextSplitter with the build settings, then compares
+their speed single-process and across worker processes.
+
+Test texts are the benchmark fixture, generated edge cases (long unbroken
+runs, separator-only text, Q/A dialogues, unicode) and, when local
+snapshots exist (python -m rag.snapshot), real dataset texts.
+
+Usage:
+    python3 rag/test_chunker.py
+    python3 rag/test_chunker.py --docs 20000 --workers 8
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add backend to path
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from rag.chunker import CHUNK_OVERLAP, CHUNK_SEPARATORS, CHUNK_SIZE, RecursiveChunker, split_batch
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures" / "bench_kb.jsonl"
+
+WORDS = ["anxiety", "sleep", "feel", "talk", "therapist", "I", "you", "and", "the", "because",
+         "sometimes", "overwhelmed", "support", "café", "😊", "breathe", "night", "calm"]
+
+
+def langchain_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=CHUNK_SEPARATORS
+    )
+
+
+def generated_texts(count: int, seed: int = 0) -> list[str]:
+    """Random counseling-like texts of very different shapes and lengths."""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        shape = i % 6
+        if shape == 0:
+            # Q/A dialogue
+            turns = [f"\nQuestion: {' '.join(rng.choices(WORDS, k=rng.randint(5, 120)))}?"
+                     f"\nAnswer: {' '.join(rng.choices(WORDS, k=rng.randint(20, 400)))}."
+                     for _ in range(rng.randint(1, 8))]
+            texts.append("".join(turns))
+        elif shape == 1:
+            # Paragraphs of sentences
+            paragraphs = [". ".join(" ".join(rng.choices(WORDS, k=rng.randint(3, 25)))
+                                    for _ in range(rng.randint(1, 30)))
+                          for _ in range(rng.randint(1, 6))]
+            texts.append("\n\n".join(paragraphs))
+        elif shape == 2:
+            # Long unbroken run (falls through to character splitting)
+            texts.append("x" * rng.randint(1000, 4000) + " tail")
+        elif shape == 3:
+            # Single very long line of words, no sentence breaks
+            texts.append(" ".join(rng.choices(WORDS, k=rng.randint(100, 1500))))
+        elif shape == 4:
+            # Separator-heavy text with lots of whitespace
+            texts.append(rng.choice(["\n\n", "\n", ". ", "  ", "\nAnswer:"]) * rng.randint(1, 500)
+                         + " ".join(rng.choices(WORDS, k=50)))
+        else:
+            # Short text
+            texts.append(" ".join(rng.choices(WORDS, k=rng.randint(1, 40))))
+    return texts
+
+
+def fixture_texts() -> list[str]:
+    with open(FIXTURE_PATH) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r["answer"] for r in records] + [f"{r['question']}\n{r['answer']}" for r in records]
+
+
+def snapshot_texts(limit: int) -> list[str]:
+    """Real dataset texts from local snapshots, if any (empty otherwise)."""
+    try:
+        from rag.snapshot import extract_texts, read_table, snapshot_files
+        from rag.sources import HF_DATASETS
+    except ImportError:
+        return []
+
+    texts = []
+    for name in HF_DATASETS:
+        for path in snapshot_files(name) or []:
+            texts.extend(extract_texts(read_table(path))[:limit // len(HF_DATASETS)])
+            break
+    return texts
+
+
+def check_parity(texts: list[str]) -> bool:
+    """Check chunk-for-chunk equality with LangChain."""
+    print("=" * 60)
+    print("Test 1: Parity with RecursiveCharacterTextSplitter")
+    print("=" * 60)
+    try:
+        reference = langchain_splitter()
+    except ImportError as e:
+        print(f"✗ langchain_text_splitters not installed: {e}")
+        return False
+
+    chunker = RecursiveChunker()
+    mismatches = 0
+    total_chunks = 0
+    for i, text in enumerate(texts):
+        expected = reference.split_text(text)
+        actual = chunker.split_text(text)
+        total_chunks += len(expected)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"✗ Text {i} ({len(text)} chars): {len(actual)} chunks, expected {len(expected)}")
+
+    if mismatches:
+        print(f"✗ {mismatches} of {len(texts)} texts differ")
+        return False
+    print(f"✓ {len(texts)} texts, {total_chunks} chunks identical")
+    return True
+
+
+def check_speed(texts: list[str], workers: int) -> bool:
+    """Compare chunking speed (LangChain vs fast, single process vs pool)."""
+    print("\n" + "=" * 60)
+    print("Test 2: Speed Benchmark")
+    print("=" * 60)
+    chars = sum(len(text) for text in texts)
+    print(f"Corpus: {len(texts)} texts, {chars / 1e6:.1f}M chars")
+
+    timings = {}
+    try:
+        reference = langchain_splitter()
+        start = time.perf_counter()
+        for text in texts:
+            reference.split_text(text)
+        timings["langchain"] = time.perf_counter() - start
+    except ImportError:
+        pass
+
+    chunker = RecursiveChunker()
+    start = time.perf_counter()
+    for text in texts:
+        chunker.split_text(text)
+    timings["fast (1 process)"] = time.perf_counter() - start
+
+    if workers > 1:
+        batches = [texts[i:i + 500] for i in range(0, len(texts), 500)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Start the workers before timing
+            list(pool.map(split_batch, [[""]] * workers))
+            start = time.perf_counter()
+            list(pool.map(split_batch, batches))
+            timings[f"fast ({workers} processes)"] = time.perf_counter() - start
+
+    baseline = timings.get("langchain", timings["fast (1 process)"])
+    for name, elapsed in timings.items():
+        print(f"  {name:<22} {elapsed:7.2f}s  {len(texts) / elapsed:9.0f} texts/s  "
+              f"{baseline / elapsed:5.1f}x")
+    return True
+
+
+def main():
+    """Run parity and speed tests."""
+    parser = argparse.ArgumentParser(description="Chunker parity and speed test")
+    parser.add_argument("--docs", type=int, default=5000, help="Generated texts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the parallel run")
+    args = parser.parse_args()
+
+    texts = fixture_texts() + generated_texts(args.docs) + snapshot_texts(args.docs)
+
+    results = []
+    results.append(("Parity", check_parity(texts)))
+    results.append(("Speed", check_speed(texts, args.workers)))
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for test_name, result in results:
+        status = "✓ PASS" if result else "✗ FAIL"
+        print(f"{test_name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Shared Vector Index
+
+A flat, read-only copy of each partition's vectors exported at build time,
+so API worker processes can search without loading Chroma:
+
+    vector_index/
+    ├── <collection>.npy             # float32 unit vectors, one row per chunk
+    ├── <collection>.ids.npy         # Chunk ID (32 raw bytes) of each row
+    └── <collection>.record_ids.npy  # Source record ID of each row (only if chunks have one)
+
+The files are opened with numpy's mmap_mode="r" (a read-only shared
+mapping), so however many uvicorn workers serve the same version, the
+vectors exist once in the OS page cache instead of once per process like
+Chroma's in-heap HNSW indexes. Together with the chunk text store
+(rag/doc_store.py) a worker holds no per-process copy of the knowledge base.
+
+Search is exact: one matrix-vector product per partition over the mapped
+vectors (dot product = cosine similarity on unit vectors), then a partial
+sort for the top k.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+INDEX_DIR = "vector_index"
+
+# Rows read from Chroma per request while exporting
+EXPORT_PAGE_SIZE = 5000
+
+
+def _paths(store_dir: Path, collection: str) -> tuple[Path, Path, Path]:
+    directory = store_dir / INDEX_DIR
+    return (
+        directory / f"{collection}.npy",
+        directory / f"{collection}.ids.npy",
+        directory / f"{collection}.record_ids.npy",
+    )
+
+
+def write_vector_index(store_dir: Path, collections: dict):
+    """
+    Export every partition's vectors from Chroma into the flat index.
+
+    Args:
+        store_dir: Vector store directory
+        collections: Chroma collections by collection name
+    """
+    directory = store_dir / INDEX_DIR
+    directory.mkdir(exist_ok=True)
+    for path in directory.iterdir():
+        path.unlink()
+
+    for name, collection in collections.items():
+        count = collection.count()
+        vectors_path, ids_path, record_ids_path = _paths(store_dir, name)
+
+        vectors = None
+        ids = np.empty(count, dtype="S32")
+        record_ids = [b""] * count
+        row = 0
+        while row < count:
+            page = collection.get(include=["embeddings", "metadatas"], limit=EXPORT_PAGE_SIZE, offset=row)
+            if not page["ids"]:
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32,
+                                                    shape=(count, embeddings.shape[1]))
+            end = row + len(page["ids"])
+            vectors[row:end] = embeddings
+            ids[row:end] = [bytes.fromhex(chunk_id) for chunk_id in page["ids"]]
+            for i, metadata in enumerate(page["metadatas"]):
+                record_ids[row + i] = str((metadata or {}).get("record_id", "")).encode("utf-8")
+            row = end
+
+        if vectors is None:
+            continue
+        vectors.flush()
+        del vectors
+        np.save(ids_path, ids[:row])
+        if any(record_ids[:row]):
+            np.save(record_ids_path, np.array(record_ids[:row]))
+
+
+class VectorIndex:
+    """
+    Memory-mapped flat vector index of a built vector store.
+
+    Args:
+        store_dir: Vector store directory
+        partitions: Partition manifest entries (see rag.sources)
+    """
+
+    def __init__(self, store_dir: Path, partitions: list[dict]):
+        self.partitions = {}
+        for partition in partitions:
+            vectors_path, ids_path, record_ids_path = _paths(store_dir, partition["collection"])
+            if not vectors_path.exists():
+                continue
+            self.partitions[partition["collection"]] = {
+                "vectors": np.load(vectors_path, mmap_mode="r"),
+                "ids": np.load(ids_path, mmap_mode="r"),
+                "record_ids": np.load(record_ids_path, mmap_mode="r") if record_ids_path.exists() else None,
+                "metadata": {"source": partition["source"], "record_type": partition["record_type"]},
+            }
+
+    @staticmethod
+    def exists(store_dir: Path) -> bool:
+        return (store_dir / INDEX_DIR).is_dir()
+
+    def search(self, collection: str, query_embedding, top_k: int) -> list[tuple[str, float, dict]]:
+        """
+        Find the nearest chunks of one partition.
+
+        Returns:
+            List of (chunk ID, cosine similarity, metadata), best first
+        """
+        partition = self.partitions.get(collection)
+        if partition is None or len(partition["ids"]) == 0:
+            return []
+
+        scores = partition["vectors"] @ np.asarray(query_embedding, dtype=np.float32)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            metadata = dict(partition["metadata"])
+            if partition["record_ids"] is not None and partition["record_ids"][row]:
+                metadata["record_id"] = partition["record_ids"][row].decode("utf-8")
+            # Restore NUL bytes numpy strips from the end of "S" values
+            chunk_id = partition["ids"][row].ljust(32, b"\0").hex()
+            results.append((chunk_id, float(scores[row]), metadata))
+        return results
+
+    def close(self):
+        self.partitions = {}
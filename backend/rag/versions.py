@@ -0,0 +1,124 @@
+"""
+Knowledge Base Versions
+
+Each build writes a fresh directory under vector_store/versions/ and only
+then points vector_store/CURRENT at it. The pointer is replaced atomically,
+so a running server never sees a half-written knowledge base and can load
+the new version in the background while still serving the old one.
+
+Layout:
+    vector_store/
+    ├── CURRENT                  # Name of the live version
+    └── versions/
+        ├── 20250101-120000/     # One complete vector store per build
+        └── 20250102-120000/
+
+A version being built carries a BUILDING marker until it is complete, so
+an interrupted build can be found and resumed.
+
+Vector stores built before versioning (Chroma files directly in
+vector_store/) are still served as-is until the first versioned build.
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+BUILDING_MARKER = "BUILDING"
+
+# Chroma's database file, present in the root of unversioned stores
+LEGACY_MARKER = "chroma.sqlite3"
+
+# Versions kept on disk after a build (the live one is always kept)
+KEEP_VERSIONS = 3
+
+
+def new_version_dir(store_root: Path) -> Path:
+    """Create an empty directory for a new knowledge base version."""
+    version = time.strftime("%Y%m%d-%H%M%S")
+    version_dir = store_root / VERSIONS_DIR / version
+    suffix = 1
+    while version_dir.exists():
+        version_dir = store_root / VERSIONS_DIR / f"{version}-{suffix}"
+        suffix += 1
+    version_dir.mkdir(parents=True)
+    return version_dir
+
+
+def mark_building(version_dir: Path):
+    """Flag a version directory as an unfinished build."""
+    (version_dir / BUILDING_MARKER).touch()
+
+
+def mark_finished(version_dir: Path):
+    """Clear the unfinished-build flag once a version is complete."""
+    (version_dir / BUILDING_MARKER).unlink(missing_ok=True)
+
+
+def find_unfinished_version(store_root: Path) -> Optional[Path]:
+    """Get the newest version directory whose build was interrupted, if any."""
+    versions_root = store_root / VERSIONS_DIR
+    if not versions_root.exists():
+        return None
+    unfinished = [
+        path for path in versions_root.iterdir()
+        if path.is_dir() and (path / BUILDING_MARKER).exists()
+    ]
+    return max(unfinished, key=lambda path: path.name) if unfinished else None
+
+
+def publish_version(store_root: Path, version_dir: Path):
+    """
+    Atomically make a built version the live knowledge base.
+
+    The pointer is written to a temporary file and renamed over CURRENT,
+    so readers see either the old or the new version, never a partial write.
+    """
+    tmp_path = store_root / f".{CURRENT_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version_dir.name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, store_root / CURRENT_FILE)
+
+
+def current_version_dir(store_root: Path) -> Optional[Path]:
+    """
+    Resolve the live knowledge base directory.
+
+    Returns:
+        The directory CURRENT points to, the store root itself for
+        unversioned (legacy) stores, or None if nothing has been built
+    """
+    pointer = store_root / CURRENT_FILE
+    if pointer.exists():
+        version_dir = store_root / VERSIONS_DIR / pointer.read_text().strip()
+        return version_dir if version_dir.is_dir() else None
+
+    # Legacy layout: Chroma files directly in the store root
+    if (store_root / LEGACY_MARKER).exists():
+        return store_root
+    return None
+
+
+def prune_versions(store_root: Path, keep: int = KEEP_VERSIONS):
+    """
+    Delete old versions, keeping the newest `keep` and the live one.
+
+    Servers that have not reloaded yet may still be reading a recent
+    version, which is why more than one is kept.
+    """
+    versions_root = store_root / VERSIONS_DIR
+    if not versions_root.exists():
+        return
+
+    live = current_version_dir(store_root)
+    versions = sorted((path for path in versions_root.iterdir() if path.is_dir()), key=lambda path: path.name)
+    for version_dir in versions[:-keep] if keep > 0 else versions:
+        if version_dir != live:
+            print(f"Removing old knowledge base version: {version_dir.name}")
+            shutil.rmtree(version_dir, ignore_errors=True)
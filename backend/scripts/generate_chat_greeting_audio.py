@@ -18,6 +18,7 @@ from pathlib import Path
 BACKEND_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(BACKEND_DIR))
 
+from tts.audio_format import AudioEncoding, pregenerated_encodings, transcode, write_formats_manifest
 from tts.cosyvoice_service import get_tts_service
 
 # Chat greeting messages for each healer (these appear as the first message in chat)
@@ -62,6 +63,12 @@ def main():
     print(f"  Frontend: {frontend_output_dir}")
     print()
     
+    # Compressed copies written next to each WAV master
+    encodings = pregenerated_encodings()
+    failed_formats = set()
+    print(f"Formats: wav{''.join(', ' + e.id for e in encodings)}")
+    print()
+    
     total_healers = len(CHAT_GREETINGS)
     current = 0
     
@@ -76,26 +83,49 @@ def main():
         backend_output_path = backend_output_dir / filename
         frontend_output_path = frontend_output_dir / filename
         
+        import shutil
+        
         # Skip if already exists in both locations
         if backend_output_path.exists() and frontend_output_path.exists():
             print(f"    ✓ Already exists, skipping: {filename}")
-            continue
-        
-        # Generate to backend directory first
-        success, generated_path = tts_service.generate_speech(
-            text=greeting_text,
-            healer_id=healer_id,
-            output_path=str(backend_output_path)
-        )
-        
-        if success:
+        else:
+            # Generate to backend directory first
+            success, generated_path = tts_service.generate_speech(
+                text=greeting_text,
+                healer_id=healer_id,
+                output_path=str(backend_output_path),
+                encoding=AudioEncoding("wav")
+            )
+            
+            if not success:
+                print(f"    ✗ Failed to generate")
+                continue
+            
             # Copy to frontend directory
-            import shutil
             shutil.copy2(backend_output_path, frontend_output_path)
             print(f"    ✓ Generated: {backend_output_path}")
             print(f"      Copied to: {frontend_output_path}")
-        else:
-            print(f"    ✗ Failed to generate")
+        
+        # Compressed versions, encoded from the WAV master
+        for encoding in encodings:
+            compressed_name = Path(filename).stem + encoding.suffix
+            if (backend_output_dir / compressed_name).exists() and (frontend_output_dir / compressed_name).exists():
+                continue
+            try:
+                transcode(backend_output_path, encoding, backend_output_dir / compressed_name)
+                shutil.copy2(backend_output_dir / compressed_name, frontend_output_dir / compressed_name)
+            except Exception as e:
+                print(f"    ✗ Failed to encode {compressed_name} ({encoding.id}): {e}")
+                failed_formats.add(encoding.format)
+                continue
+            print(f"    ✓ Encoded: {compressed_name} ({encoding.id})")
+    
+    # Tell the frontend which formats exist (only those encoded for every file)
+    if failed_formats:
+        print(f"\nNot listing formats that failed to encode: {', '.join(sorted(failed_formats))}")
+    complete = [encoding for encoding in encodings if encoding.format not in failed_formats]
+    for output_dir in (backend_output_dir, frontend_output_dir):
+        write_formats_manifest(output_dir, complete)
     
     print()
     print("=" * 60)
@@ -107,7 +137,7 @@ def main():
     print(f"  Frontend: {frontend_output_dir}")
     print()
     print("Files are ready to use! The chat interface will load them from:")
-    print("  /tts_audio/{healer_id}_chat_greeting.wav")
+    print("  /tts_audio/{healer_id}_chat_greeting.wav (or .ogg/.mp3, see formats.json)")
     print()
     print("Note: You may need to update ChatScreen.tsx to use these pre-generated")
     print("files instead of generating them on-the-fly.")
@@ -0,0 +1,180 @@
+"""
+TTS Audio Cache
+
+A persistent, content-addressed cache of generated speech, so the same
+healer reply is only ever synthesized once per model and voice:
+
+    audio_cache/
+    ├── <key>.wav       # One file per cached utterance (.ogg / .mp3 when
+    └── ...             # compressed, see tts/audio_format.py)
+
+The key is a SHA-256 over the healer ID, the full text, the model version,
+a hash of the healer's voice prompt (reference clip and prompt text) and
+the audio encoding, so changing the model or a voice clip never serves
+stale audio.
+
+Files are written under a temporary name and moved into place with
+os.replace, so readers (including other API workers sharing the directory)
+only ever see complete files. Recency is tracked with file modification
+times (a hit touches the file) and the least recently used files are
+evicted once the directory grows past its size limit.
+
+Usage:
+    python -m tts.audio_cache stats
+    python -m tts.audio_cache clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Cache location and size limit (override with TTS_CACHE_DIR / TTS_CACHE_MAX_MB)
+CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", Path(__file__).parent / "audio_cache"))
+CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+AUDIO_SUFFIX = ".wav"
+AUDIO_SUFFIXES = (".wav", ".ogg", ".mp3")
+TEMP_SUFFIX = ".tmp"
+
+
+def cache_key(healer_id: str, text: str, model_version: str, voice_hash: str, encoding: str = "wav") -> str:
+    """Content address of one utterance."""
+    payload = json.dumps([healer_id, model_version, voice_hash, encoding, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cache_filename(filename: str) -> bool:
+    """Whether a name looks like a cache entry (<64 hex chars>.wav/.ogg/.mp3)."""
+    stem, suffix = os.path.splitext(filename)
+    return (suffix in AUDIO_SUFFIXES and len(stem) == 64
+            and all(c in "0123456789abcdef" for c in stem))
+
+
+class AudioCache:
+    """
+    Size-bounded on-disk audio cache.
+
+    Args:
+        cache_dir: Directory holding the cached files
+        max_bytes: Total size above which least recently used files are evicted
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str, suffix: str = AUDIO_SUFFIX) -> Path:
+        return self.dir / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = AUDIO_SUFFIX) -> Optional[Path]:
+        """Path of a cached file (None on a miss). Marks the file as recently used."""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    @contextmanager
+    def writer(self, key: str, suffix: str = AUDIO_SUFFIX) -> Iterator[Path]:
+        """
+        Write a cache entry atomically.
+
+        Yields a temporary path to write the audio to; when the block exits
+        without an error the file is published under the key, otherwise it
+        is discarded.
+        """
+        temp_path = self.dir / f".{key}.{uuid.uuid4().hex}{TEMP_SUFFIX}"
+        try:
+            yield temp_path
+            os.replace(temp_path, self.path(key, suffix))
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self.evict()
+
+    def entries(self) -> list[tuple[Path, os.stat_result]]:
+        """Cached files with their stat results, least recently used first."""
+        entries = []
+        for path in self.dir.iterdir():
+            if not is_cache_filename(path.name):
+                continue
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        entries.sort(key=lambda entry: entry[1].st_mtime_ns)
+        return entries
+
+    def size_bytes(self) -> int:
+        return sum(stat.st_size for _, stat in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Remove least recently used files until the cache fits max_bytes.
+
+        Returns:
+            Number of files removed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = self.entries()
+            total = sum(stat.st_size for _, stat in entries)
+            removed = 0
+            for path, stat in entries:
+                if total <= max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= stat.st_size
+                removed += 1
+            return removed
+
+    def clear(self) -> int:
+        return self.evict(0)
+
+
+# Global cache instance
+_audio_cache: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> AudioCache:
+    """Get or create the global audio cache."""
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+    return _audio_cache
+
+
+def main():
+    """Show or clear the TTS audio cache."""
+    parser = argparse.ArgumentParser(description="Manage the TTS audio cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--dir", type=Path, default=CACHE_DIR, help="Cache directory")
+    args = parser.parse_args()
+
+    cache = AudioCache(args.dir)
+    if args.command == "stats":
+        entries = cache.entries()
+        total = sum(stat.st_size for _, stat in entries)
+        print(f"Cache directory: {cache.dir}")
+        print(f"Files: {len(entries)}")
+        print(f"Size: {total / (1024 * 1024):.1f} MB of {cache.max_bytes / (1024 * 1024):.0f} MB")
+    else:
+        print(f"Removed {cache.clear()} files from {cache.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
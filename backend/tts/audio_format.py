@@ -0,0 +1,349 @@
+"""
+TTS Audio Formats
+
+Generated speech can be stored and served compressed instead of as
+uncompressed WAV. Speech compresses very well: Opus at 24-32 kbit/s or
+MP3 at 48-64 kbit/s is a fraction of the size of 16-bit WAV with little
+audible difference, and downsampling to 16 or 24 kHz mono saves more.
+
+An AudioEncoding (format, bitrate, sample rate) is chosen per request by
+negotiate(): the client lists the formats it can play in order of
+preference and the server picks the first one it can produce, otherwise
+its default. The encoding is part of the audio cache key, so each variant
+of a reply is cached separately. The pregeneration scripts write every
+format in TTS_PREGENERATED_FORMATS next to the WAV master and list them in
+tts_audio/formats.json for the frontend.
+
+Opus and MP3 encoding (and resampling) use the ffmpeg command-line tool;
+without it only WAV at the model's sample rate is available.
+
+Configuration (environment variables):
+- TTS_AUDIO_FORMAT: Default format: wav, opus or mp3 (default: wav)
+- TTS_AUDIO_BITRATE: Bitrate in kbit/s for opus/mp3 (default: 32 for opus, 64 for mp3)
+- TTS_AUDIO_SAMPLE_RATE: Resample to this rate, e.g. 16000 or 24000 (default: keep the model's)
+- TTS_PREGENERATED_FORMATS: Formats written by the pregeneration scripts (default: opus,mp3)
+
+Usage (size and encode time benchmark):
+    python -m tts.audio_format
+    python -m tts.audio_format ../public/tts_audio/*.wav --output formats.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import wave
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+FORMATS = {
+    "wav": {"suffix": ".wav", "media_type": "audio/wav", "muxer": "wav", "codec": ["-c:a", "pcm_s16le"],
+            "default_bitrate": None},
+    "opus": {"suffix": ".ogg", "media_type": "audio/ogg", "muxer": "ogg",
+             "codec": ["-c:a", "libopus", "-application", "voip"], "default_bitrate": 32},
+    "mp3": {"suffix": ".mp3", "media_type": "audio/mpeg", "muxer": "mp3", "codec": ["-c:a", "libmp3lame"],
+            "default_bitrate": 64},
+}
+
+# Accept header media types of each format
+ACCEPT_TYPES = {
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav",
+    "audio/ogg": "opus", "audio/opus": "opus",
+    "audio/mpeg": "mp3", "audio/mp3": "mp3",
+}
+
+DEFAULT_FORMAT = os.getenv("TTS_AUDIO_FORMAT", "wav")
+DEFAULT_BITRATE = int(os.getenv("TTS_AUDIO_BITRATE", "0")) or None
+DEFAULT_SAMPLE_RATE = int(os.getenv("TTS_AUDIO_SAMPLE_RATE", "0")) or None
+PREGENERATED_FORMATS = [f for f in os.getenv("TTS_PREGENERATED_FORMATS", "opus,mp3").split(",") if f]
+
+# Written next to pregenerated audio, lists the formats available there
+FORMATS_MANIFEST = "formats.json"
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def media_type_for(filename: str) -> str:
+    """Content type of an audio file by its extension."""
+    suffix = Path(filename).suffix.lower()
+    for spec in FORMATS.values():
+        if spec["suffix"] == suffix:
+            return spec["media_type"]
+    return "application/octet-stream"
+
+
+class AudioEncoding:
+    """
+    Output encoding of generated speech.
+
+    Args:
+        format: One of FORMATS (wav, opus, mp3)
+        bitrate_kbps: Bitrate for compressed formats (default: the format's default)
+        sample_rate: Resample to this rate (default: keep the input rate)
+    """
+
+    def __init__(self, format: str = "wav", bitrate_kbps: Optional[int] = None, sample_rate: Optional[int] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown audio format: {format} (expected one of {', '.join(FORMATS)})")
+        self.format = format
+        self.bitrate_kbps = bitrate_kbps or FORMATS[format]["default_bitrate"]
+        self.sample_rate = sample_rate
+
+    @property
+    def suffix(self) -> str:
+        return FORMATS[self.format]["suffix"]
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.format]["media_type"]
+
+    @property
+    def id(self) -> str:
+        """Short identifier, e.g. "wav" or "opus-32k-24000" (part of cache keys)."""
+        parts = [self.format]
+        if self.bitrate_kbps:
+            parts.append(f"{self.bitrate_kbps}k")
+        if self.sample_rate:
+            parts.append(str(self.sample_rate))
+        return "-".join(parts)
+
+    @property
+    def needs_ffmpeg(self) -> bool:
+        return self.format != "wav" or self.sample_rate is not None
+
+    def encode(self, waveform, sample_rate: int, path):
+        """
+        Write a mono float waveform in [-1, 1] to path in this encoding.
+
+        Raises:
+            RuntimeError: If ffmpeg is needed but not installed or fails
+        """
+        pcm = (np.clip(np.asarray(waveform, dtype=np.float32).reshape(-1), -1.0, 1.0) * 32767).astype("<i2")
+
+        if not self.needs_ffmpeg:
+            with wave.open(str(path), "wb") as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(sample_rate)
+                f.writeframes(pcm.tobytes())
+            return
+
+        if not ffmpeg_available():
+            raise RuntimeError(f"ffmpeg is required for {self.id} audio")
+        spec = FORMATS[self.format]
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                   "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+                   "-ac", "1"]
+        if self.sample_rate:
+            command += ["-ar", str(self.sample_rate)]
+        command += spec["codec"]
+        if self.bitrate_kbps:
+            command += ["-b:a", f"{self.bitrate_kbps}k"]
+        command += ["-f", spec["muxer"], str(path)]
+        result = subprocess.run(command, input=pcm.tobytes(), capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.id}: {result.stderr.decode(errors='replace').strip()}")
+
+
+def available_formats() -> list[str]:
+    """Formats this server can produce."""
+    return list(FORMATS) if ffmpeg_available() else ["wav"]
+
+
+def encoding_for(format: str) -> AudioEncoding:
+    """Encoding of a format with the configured bitrate and sample rate."""
+    sample_rate = DEFAULT_SAMPLE_RATE if ffmpeg_available() else None
+    bitrate = DEFAULT_BITRATE if format == DEFAULT_FORMAT else None
+    return AudioEncoding(format, bitrate, sample_rate)
+
+
+_warned_no_ffmpeg = False
+
+
+def default_encoding() -> AudioEncoding:
+    """Configured default encoding (WAV if it needs ffmpeg and ffmpeg is missing)."""
+    global _warned_no_ffmpeg
+    if DEFAULT_FORMAT not in available_formats():
+        if not _warned_no_ffmpeg:
+            logging.warning(f"TTS_AUDIO_FORMAT={DEFAULT_FORMAT} needs ffmpeg, which is not installed; using wav")
+            _warned_no_ffmpeg = True
+        return encoding_for("wav")
+    return encoding_for(DEFAULT_FORMAT)
+
+
+def _accepted_formats(accept: str) -> list[str]:
+    """Formats named in an Accept header, by descending quality."""
+    ranked = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        if media_type.lower() in ACCEPT_TYPES and quality > 0:
+            ranked.append((-quality, position, ACCEPT_TYPES[media_type.lower()]))
+    return [format for _, _, format in sorted(ranked)]
+
+
+def negotiate(formats: Optional[list[str]] = None, accept: Optional[str] = None) -> AudioEncoding:
+    """
+    Choose the encoding for a client.
+
+    Args:
+        formats: Formats the client can play, most preferred first
+        accept: HTTP Accept header (used when formats is not given)
+
+    Returns:
+        The first requested format this server can produce, otherwise the
+        default encoding
+    """
+    requested = [f.lower() for f in formats] if formats else _accepted_formats(accept or "")
+    available = available_formats()
+    default = default_encoding()
+    for format in requested:
+        if format == default.format:
+            return default
+        if format in available:
+            return encoding_for(format)
+    return default
+
+
+def pregenerated_encodings() -> list[AudioEncoding]:
+    """Compressed encodings the pregeneration scripts write (besides WAV)."""
+    available = available_formats()
+    encodings = []
+    for format in PREGENERATED_FORMATS:
+        if format == "wav":
+            continue
+        if format not in available:
+            logging.warning(f"Skipping pregenerated {format} audio: ffmpeg is not installed")
+            continue
+        encodings.append(encoding_for(format))
+    return encodings
+
+
+def write_formats_manifest(directory: Path, encodings: list[AudioEncoding]):
+    """List the formats available in a pregenerated audio directory."""
+    manifest = {"formats": [e.format for e in encodings] + ["wav"],
+                "extensions": {e.format: e.suffix for e in encodings} | {"wav": ".wav"}}
+    (directory / FORMATS_MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+
+def read_wav(path) -> tuple[np.ndarray, int]:
+    """Read a 16-bit PCM or 32-bit float WAV as mono float32 samples."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError(f"Not a WAV file: {path}")
+
+    channels = sample_rate = bits = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        size = struct.unpack("<I", data[position + 4:position + 8])[0]
+        body = data[position + 8:position + 8 + size]
+        if chunk_id == b"fmt ":
+            _, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+        elif chunk_id == b"data" and bits:
+            width = bits // 8
+            body = body[:len(body) - len(body) % (width * channels)]
+            if bits == 32:
+                samples = np.frombuffer(body, dtype="<f4")
+            else:
+                samples = np.frombuffer(body, dtype="<i2").astype(np.float32) / 32768
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1)
+            return samples.astype(np.float32), sample_rate
+        position += 8 + size + (size & 1)
+    raise ValueError(f"No audio data in {path}")
+
+
+def transcode(wav_path, encoding: AudioEncoding, output_path):
+    """Encode an existing WAV file."""
+    samples, sample_rate = read_wav(wav_path)
+    encoding.encode(samples, sample_rate, output_path)
+
+
+# Encodings compared by the benchmark
+BENCH_ENCODINGS = [
+    AudioEncoding("wav"),
+    AudioEncoding("wav", sample_rate=16000),
+    AudioEncoding("opus", 24),
+    AudioEncoding("opus", 32),
+    AudioEncoding("opus", 24, 16000),
+    AudioEncoding("opus", 32, 24000),
+    AudioEncoding("mp3", 48),
+    AudioEncoding("mp3", 64),
+    AudioEncoding("mp3", 48, 24000),
+]
+
+
+def main():
+    """Compare size and encode time of WAV files across encodings."""
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark TTS audio encodings")
+    parser.add_argument("files", nargs="*", type=Path,
+                        help="WAV files (default: the pregenerated audio in public/tts_audio)")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here")
+    args = parser.parse_args()
+
+    files = args.files or sorted((BACKEND_DIR.parent / "public" / "tts_audio").glob("*.wav"))
+    if not files:
+        print("No WAV files to benchmark")
+        return 1
+    clips = [read_wav(path) for path in files]
+    duration = sum(len(samples) / rate for samples, rate in clips)
+    print(f"{len(files)} files, {duration:.1f}s of audio")
+    if not ffmpeg_available():
+        print("ffmpeg not found: only WAV at the original sample rate can be measured")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for encoding in BENCH_ENCODINGS:
+            if encoding.needs_ffmpeg and not ffmpeg_available():
+                continue
+            total_bytes = 0
+            start = time.perf_counter()
+            for i, (samples, rate) in enumerate(clips):
+                path = Path(directory) / f"{i}{encoding.suffix}"
+                encoding.encode(samples, rate, path)
+                total_bytes += path.stat().st_size
+            elapsed = time.perf_counter() - start
+            results.append({
+                "encoding": encoding.id,
+                "bytes": total_bytes,
+                "encode_seconds": elapsed,
+                "kbit_per_second_audio": total_bytes * 8 / 1000 / duration,
+                "encode_speed_x_realtime": duration / elapsed if elapsed else 0.0,
+            })
+
+    baseline = results[0]["bytes"]
+    print(f"\n{'encoding':<18} {'size KB':>10} {'vs WAV':>8} {'kbit/s':>8} {'encode s':>9} {'x realtime':>11}")
+    for r in results:
+        print(f"{r['encoding']:<18} {r['bytes'] / 1024:>10.1f} {r['bytes'] / baseline * 100:>7.1f}% "
+              f"{r['kbit_per_second_audio']:>8.1f} {r['encode_seconds']:>9.3f} {r['encode_speed_x_realtime']:>11.0f}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"files": len(files), "audio_seconds": duration, "results": results},
+                                          indent=2))
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+HTTP Serving of Generated Audio
+
+Response for GET /api/tts/audio/{filename} that browsers can cache and
+seek in without downloading the file again:
+
+- Strong ETag: a SHA-256 of the file content (computed once per file and
+  remembered, for the most recently served files, until it is replaced)
+- Cache entries are named by their cache key, so they are served with
+  Cache-Control: immutable; other files (temp directory, cache disabled)
+  must be revalidated
+- Conditional GET: If-None-Match answers 304 Not Modified
+- Byte ranges (Range / If-Range) answer 206 Partial Content, which is what
+  <audio> elements request when the user seeks
+- Zero-copy fast path: on ASGI servers offering the
+  http.response.zerocopysend extension, the file (or range) is handed to
+  the server's sendfile() instead of being read into Python
+
+Filenames are resolved against the audio cache directory (or the temp
+directory for tts_* files) and anything resolving elsewhere is rejected.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import JSONResponse, Response
+
+from tts.audio_cache import AUDIO_SUFFIXES, get_audio_cache, is_cache_filename
+from tts.audio_format import media_type_for
+
+# Cache-Control of content-addressed cache entries and of everything else
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Bytes per read when the server has no zero-copy send
+READ_CHUNK_SIZE = 256 * 1024
+
+# Names the generator writes to the temp directory when the cache is off
+TEMP_FILENAME = re.compile(r"tts_[a-z]+_[0-9a-f]{16}\.(wav|ogg|mp3)")
+
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)")
+
+# Files whose ETag is remembered (least recently served are forgotten first)
+ETAG_MEMO_SIZE = 1024
+
+# Content hashes keyed by (path, device, inode, size, mtime). Cache entries
+# leave mtime out: they are only ever replaced (os.replace gives a new
+# inode), and a cache hit touches their mtime. Other files can be rewritten
+# in place, so their mtime counts.
+_etag_memo = OrderedDict()
+_etag_lock = threading.Lock()
+
+
+def audio_file_path(filename: str) -> Optional[Path]:
+    """
+    Path of a servable audio file, or None if the name is not one.
+
+    Only plain names of cache entries (in the cache directory) and of
+    generated temp files (in the temp directory) are accepted, and the
+    resolved path must still be inside that directory.
+    """
+    if filename != os.path.basename(filename) or Path(filename).suffix not in AUDIO_SUFFIXES:
+        return None
+    if is_cache_filename(filename):
+        directory = get_audio_cache().dir
+    elif TEMP_FILENAME.fullmatch(filename):
+        directory = Path(tempfile.gettempdir())
+    else:
+        return None
+    directory = directory.resolve()
+    path = (directory / filename).resolve()
+    if path.parent != directory:
+        return None
+    return path
+
+
+def content_etag(path: Path, stat_result: os.stat_result) -> str:
+    """Strong ETag of a file: quoted SHA-256 of its content."""
+    mtime = None if is_cache_filename(path.name) else stat_result.st_mtime_ns
+    memo_key = (str(path), stat_result.st_dev, stat_result.st_ino, stat_result.st_size, mtime)
+    with _etag_lock:
+        etag = _etag_memo.get(memo_key)
+        if etag is not None:
+            _etag_memo.move_to_end(memo_key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                digest.update(block)
+        etag = f'"{digest.hexdigest()}"'
+        with _etag_lock:
+            _etag_memo[memo_key] = etag
+            if len(_etag_memo) > ETAG_MEMO_SIZE:
+                _etag_memo.popitem(last=False)
+    return etag
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches (weak comparison, as RFC 9110 asks)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header.
+
+    Returns:
+        Inclusive (start, end) byte positions, None to send the whole file
+        (no header, or a form this server doesn't handle such as several
+        ranges)
+
+    Raises:
+        ValueError: If the range can't be satisfied for a file of this size
+    """
+    if not header:
+        return None
+    match = RANGE_HEADER.fullmatch(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if not last or int(last) == 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range {header}")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError(f"Unsatisfiable range {header}")
+    return start, end
+
+
+class AudioFileResponse(Response):
+    """
+    File response with ETag, conditional GET and byte range support.
+
+    Build it with AudioFileResponse.prepare(), which stats and hashes the
+    file and evaluates the request's conditional and range headers.
+    """
+
+    def __init__(self, path: Path, status_code: int, headers: dict, media_type: str,
+                 byte_range: Optional[Tuple[int, int]] = None, send_body: bool = True):
+        self.path = path
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.byte_range = byte_range
+        self.send_body = send_body
+        self.init_headers(headers)
+
+    @classmethod
+    async def prepare(cls, path: Path, request_headers, method: str = "GET") -> Response:
+        """Response for a request of the file at path (404 if it is gone, e.g. evicted from the cache)."""
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, path)
+            etag = await anyio.to_thread.run_sync(content_etag, path, stat_result)
+        except FileNotFoundError:
+            return JSONResponse({"detail": "Audio file not found"}, status_code=404)
+        size = stat_result.st_size
+        headers = {
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "cache-control": IMMUTABLE_CACHE_CONTROL if is_cache_filename(path.name) else REVALIDATE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+        }
+        media_type = media_type_for(path.name)
+        send_body = method.upper() != "HEAD"
+
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        # If-Range with a stale validator: the client's partial copy is
+        # outdated, so send the whole file
+        byte_range = None
+        if_range = request_headers.get("if-range")
+        if not if_range or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request_headers.get("range"), size)
+            except ValueError:
+                headers["content-range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+
+        if byte_range is None:
+            headers["content-length"] = str(size)
+            return cls(path, 200, headers, media_type, send_body=send_body)
+
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return cls(path, 206, headers, media_type, byte_range, send_body)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        start, end = self.byte_range or (0, int(self.headers["content-length"]) - 1)
+        count = end - start + 1
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            # The server copies the file to the socket with sendfile()
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": start,
+                            "count": count, "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(start)
+            remaining = count
+            finished = False
+            while remaining > 0:
+                chunk = await f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                finished = remaining == 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": not finished})
+            if not finished:
+                # Empty file, or it shrank while sending: end the body anyway
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
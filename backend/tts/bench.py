@@ -0,0 +1,269 @@
+"""
+TTS Benchmark
+
+Synthesizes a fixed corpus of short, medium and long healer replies
+(tts/fixtures/bench_corpus.jsonl, several texts per length) in every
+healer voice, for each combination of inference profile and torch thread
+count, and records:
+
+- load time: model loading and speaker registration
+- time-to-first-audio (TTFA): until the first streamed chunk
+- total time and real-time factor (RTF = total time / audio duration)
+- peak memory (resident set size) of the process
+
+Each configuration runs in a fresh process, so thread settings and
+quantization don't leak between configurations and peak memory is the
+configuration's own. The audio cache is disabled while benchmarking.
+
+Results are written as JSON. Compare mode checks the medians per text
+length against a stored baseline and flags every metric that got worse by
+more than the tolerance (exit code 1 if any did), e.g. in CI or before
+merging a performance change. Medians over several texts (and --repeats)
+keep a single slow utterance from being flagged as a regression.
+
+On CPU a full sweep takes hours; narrow it with --healers, --lengths,
+--threads and --profiles.
+
+Usage:
+    python -m tts.bench --output bench.json
+    python -m tts.bench --profiles baseline,cpu-int8 --threads 4,8 --healers luna --output bench.json
+    python -m tts.bench --repeats 3 --output bench.json
+    python -m tts.bench --output bench.json --baseline tts/bench_baseline.json
+    python -m tts.bench --results bench.json --baseline tts/bench_baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+CORPUS_PATH = Path(__file__).parent / "fixtures" / "bench_corpus.jsonl"
+
+LENGTHS = ["short", "medium", "long"]
+
+# Metrics compared against the baseline (all lower is better)
+COMPARED_METRICS = ["load_time", "ttfa", "total_time", "rtf", "peak_rss_mb"]
+
+# Relative increase over the baseline that counts as a regression
+REGRESSION_TOLERANCE = 0.10
+
+
+def load_corpus(path: Path) -> list[dict]:
+    """Load corpus entries (id, length, text)."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def _init_worker(threads: int):
+    from tts.parallel import pin_threads
+    # Measure synthesis, not cache hits
+    os.environ["TTS_AUDIO_CACHE"] = "0"
+    pin_threads(threads)
+
+
+def _run_configuration(profile_name: str, threads: int, corpus: list[dict], healers: list[str],
+                       repeats: int = 1) -> dict:
+    """Load the model with one configuration and synthesize the corpus (in a fresh process)."""
+    from tts.cosyvoice_service import CosyVoiceService
+    from tts.inference_profile import InferenceProfile
+
+    service = CosyVoiceService(InferenceProfile(profile_name, threads))
+    start_time = time.perf_counter()
+    if not service.initialize():
+        raise RuntimeError("Failed to load the TTS model")
+    load_time = time.perf_counter() - start_time
+
+    # Warm-up run (first inference pays for lazy initialization)
+    service.synthesize("Hello.", healers[0])
+
+    utterances = []
+    for healer_id in healers:
+        for entry in corpus * repeats:
+            start_time = time.perf_counter()
+            audio_bytes = sum(len(chunk) for chunk in service.stream_speech(entry["text"], healer_id))
+            total_time = time.perf_counter() - start_time
+            stats = service.last_stream_stats
+            if not stats or stats.get("cached") or "audio_duration" not in stats:
+                raise RuntimeError(f"No audio synthesized for {healer_id}/{entry['id']}")
+            utterances.append({
+                "healer": healer_id,
+                "id": entry["id"],
+                "length": entry["length"],
+                "chars": len(entry["text"]),
+                "ttfa": stats["time_to_first_audio"],
+                "total_time": total_time,
+                "audio_duration": stats["audio_duration"],
+                "rtf": stats["rtf"],
+                "chunks": stats["chunks"],
+                "bytes": audio_bytes,
+            })
+            print(f"    {healer_id}/{entry['id']}: TTFA {stats['time_to_first_audio']:.2f}s, "
+                  f"total {total_time:.2f}s, RTF {stats['rtf']:.2f}x", file=sys.stderr)
+
+    # Effective settings (e.g. whether JIT modules were actually loaded)
+    return {"settings": service.profile.describe(), "load_time": load_time, "peak_rss_mb": peak_rss_mb(),
+            "utterances": utterances}
+
+
+def summarize(utterances: list[dict]) -> dict:
+    """Median TTFA, total time and RTF per text length (over all texts, voices and repeats)."""
+    summary = {}
+    for length in LENGTHS:
+        group = [u for u in utterances if u["length"] == length]
+        if not group:
+            continue
+        summary[length] = {
+            metric: statistics.median(u[metric] for u in group)
+            for metric in ("ttfa", "total_time", "rtf", "audio_duration")
+        }
+    return summary
+
+
+def run_benchmark(args) -> dict:
+    """Run every (profile, threads) configuration."""
+    corpus = [entry for entry in load_corpus(args.corpus) if entry["length"] in args.lengths]
+    report = {
+        "corpus": str(args.corpus),
+        "healers": args.healers,
+        "lengths": args.lengths,
+        "repeats": args.repeats,
+        "cpu_count": os.cpu_count(),
+        "configurations": [],
+    }
+    print(f"Benchmarking {len(corpus)} texts x {len(args.healers)} voices x {args.repeats} repeats "
+          f"on {os.cpu_count()} CPUs...", file=sys.stderr)
+
+    for profile_name in args.profiles:
+        for threads in args.threads:
+            print(f"\n[{profile_name}, {threads} threads]", file=sys.stderr)
+            configuration = {"profile": profile_name, "threads": threads}
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(threads,)) as pool:
+                try:
+                    result = pool.submit(_run_configuration, profile_name, threads, corpus, args.healers,
+                                         args.repeats).result()
+                except Exception as e:
+                    configuration["skipped"] = f"{type(e).__name__}: {e}"
+                    print(f"  Skipped: {configuration['skipped']}", file=sys.stderr)
+                    report["configurations"].append(configuration)
+                    continue
+            configuration.update(result)
+            configuration["summary"] = summarize(result["utterances"])
+            print(f"  load {result['load_time']:.1f}s, peak memory {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+            report["configurations"].append(configuration)
+    return report
+
+
+def _comparable(report: dict) -> dict:
+    """Flatten a report to {(profile, threads, scope): {metric: value}}."""
+    values = {}
+    for configuration in report["configurations"]:
+        if "skipped" in configuration:
+            continue
+        key = (configuration["profile"], configuration["threads"])
+        values[key + ("model",)] = {"load_time": configuration["load_time"],
+                                    "peak_rss_mb": configuration["peak_rss_mb"]}
+        for length, metrics in configuration["summary"].items():
+            values[key + (length,)] = metrics
+    return values
+
+
+def compare(report: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list[dict]:
+    """
+    Compare a report against a baseline report.
+
+    Only configurations and lengths present in both are compared.
+
+    Returns:
+        One entry per compared metric (profile, threads, scope, metric,
+        baseline, current, change, regression)
+    """
+    current_values = _comparable(report)
+    baseline_values = _comparable(baseline)
+    rows = []
+    for key in sorted(set(current_values) & set(baseline_values), key=str):
+        profile_name, threads, scope = key
+        for metric in COMPARED_METRICS:
+            if metric not in current_values[key] or metric not in baseline_values[key]:
+                continue
+            old, new = baseline_values[key][metric], current_values[key][metric]
+            change = (new - old) / old if old > 0 else 0.0
+            rows.append({"profile": profile_name, "threads": threads, "scope": scope, "metric": metric,
+                         "baseline": old, "current": new, "change": change, "regression": change > tolerance})
+    return rows
+
+
+def print_comparison(rows: list[dict], tolerance: float):
+    print(f"\n{'profile':<10} {'threads':>7} {'scope':<7} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}",
+          file=sys.stderr)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['profile']:<10} {row['threads']:>7} {row['scope']:<7} {row['metric']:<12} "
+              f"{row['baseline']:>10.2f} {row['current']:>10.2f} {row['change']:>+7.1%}{flag}", file=sys.stderr)
+    regressions = sum(row["regression"] for row in rows)
+    if not rows:
+        print("No configurations in common with the baseline", file=sys.stderr)
+    elif regressions:
+        print(f"\n{regressions} metric(s) regressed by more than {tolerance:.0%}", file=sys.stderr)
+    else:
+        print(f"\nNo regressions (tolerance {tolerance:.0%})", file=sys.stderr)
+
+
+def main():
+    """Run the TTS benchmark and/or compare results against a baseline."""
+    from tts.cosyvoice_service import HEALER_VOICE_MAP
+    from tts.inference_profile import DEFAULT_PROFILE, PROFILES
+
+    parser = argparse.ArgumentParser(description="Benchmark TTS latency, real-time factor and memory")
+    parser.add_argument("--corpus", type=Path, default=CORPUS_PATH, help="Corpus (JSONL with id, length, text)")
+    parser.add_argument("--healers", default=",".join(HEALER_VOICE_MAP), help="Comma-separated healer voices")
+    parser.add_argument("--lengths", default=",".join(LENGTHS), help="Comma-separated text lengths")
+    parser.add_argument("--profiles", default=DEFAULT_PROFILE,
+                        help=f"Comma-separated inference profiles ({', '.join(PROFILES)})")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1), help="Comma-separated torch thread counts")
+    parser.add_argument("--repeats", type=int, default=1, help="Synthesize every text this many times")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here instead of stdout")
+    parser.add_argument("--results", type=Path, help="Compare these results instead of running the benchmark")
+    parser.add_argument("--baseline", type=Path, help="Baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Relative increase that counts as a regression (default: 0.10)")
+    args = parser.parse_args()
+    args.healers = args.healers.split(",")
+    args.lengths = args.lengths.split(",")
+    args.profiles = args.profiles.split(",")
+    args.threads = [int(n) for n in args.threads.split(",")]
+
+    if args.results:
+        report = json.loads(args.results.read_text())
+    else:
+        report = run_benchmark(args)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            args.output.write_text(output)
+            print(f"\nResults written to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    if args.baseline:
+        rows = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        print_comparison(rows, args.tolerance)
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,14 +3,46 @@ CosyVoice TTS Service for NightWhisper
 
 This module provides TTS functionality using CosyVoice for voice cloning.
 Each healer has a corresponding voice clone file.
+
+The prompt features of every healer voice (speaker embedding and speech
+tokens of the reference clip) are extracted once when the model loads and
+registered with CosyVoice as cached zero-shot speakers, so requests only
+pay for synthesizing their own text. Set TTS_SPEAKER_CACHE=0 to extract
+them on every request instead.
+
+Generated audio is kept in a persistent audio cache (tts/audio_cache.py)
+keyed by healer, text, model version, voice prompt and audio encoding, so
+repeated replies are served without running the model. Set
+TTS_AUDIO_CACHE=0 to disable it. Audio is written in the requested
+encoding (WAV, Opus or MP3, see tts/audio_format.py).
+
+stream_speech() synthesizes with CosyVoice's streaming mode and yields a
+WAV stream chunk by chunk, so playback can start after the first chunk
+(time-to-first-audio) instead of after the whole utterance.
+
+Every inference waits for a slot from the inference scheduler
+(tts/scheduler.py), which caps concurrent inferences and orders waiting
+requests by priority lane and session.
+
+How the model is loaded and run on CPU (JIT, int8 quantization, threads)
+is set by the inference profile (TTS_INFERENCE_PROFILE, see
+tts/inference_profile.py).
 """
 
+import hashlib
 import os
+import struct
 import sys
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Iterator, Optional, Tuple
 import logging
 
+from tts.audio_cache import cache_key, get_audio_cache
+from tts.audio_format import AudioEncoding, default_encoding
+from tts.inference_profile import InferenceProfile, get_inference_profile
+from tts.scheduler import INTERACTIVE, get_scheduler, lane_for
+
 # Add CosyVoice to path
 BACKEND_DIR = Path(__file__).parent.parent
 COSYVOICE_DIR = BACKEND_DIR / "CosyVoice"
@@ -48,13 +80,115 @@ HEALER_PROMPT_TEXT = {
 MODEL_DIR = COSYVOICE_DIR / "pretrained_models" / "CosyVoice-300M"
 VOICE_DIR = COSYVOICE_DIR
 
+# Reuse per-healer prompt features registered at initialization
+SPEAKER_CACHE_ENABLED = os.getenv("TTS_SPEAKER_CACHE", "1") != "0"
+
+# Serve repeated utterances from the persistent audio cache
+AUDIO_CACHE_ENABLED = os.getenv("TTS_AUDIO_CACHE", "1") != "0"
+
+# Memoized hashes, keyed by the stat signature of what they hash
+_hash_memo = {}
+
+
+def _stat_signature(paths) -> tuple:
+    signature = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append((path.name, None, None))
+    return tuple(signature)
+
+
+def model_version() -> str:
+    """
+    Version of the installed model: a hash of the model directory's file
+    names, sizes and modification times (re-downloading or swapping the
+    model changes it).
+    """
+    files = sorted(p for p in MODEL_DIR.iterdir() if p.is_file()) if MODEL_DIR.exists() else []
+    signature = ("model", MODEL_DIR.name, _stat_signature(files))
+    if signature not in _hash_memo:
+        _hash_memo[signature] = hashlib.sha256(repr(signature).encode()).hexdigest()[:16]
+    return _hash_memo[signature]
+
+
+def voice_hash(healer_id: str) -> str:
+    """Hash of a healer's voice prompt (reference clip content and prompt text)."""
+    voice_file = VOICE_DIR / HEALER_VOICE_MAP[healer_id]
+    prompt_text = HEALER_PROMPT_TEXT.get(healer_id, "")
+    signature = ("voice", healer_id, prompt_text, _stat_signature([voice_file]))
+    if signature not in _hash_memo:
+        digest = hashlib.sha256(prompt_text.encode("utf-8"))
+        if voice_file.exists():
+            digest.update(voice_file.read_bytes())
+        _hash_memo[signature] = digest.hexdigest()[:16]
+    return _hash_memo[signature]
+
+
+def audio_cache_key(text: str, healer_id: str, encoding: Optional[AudioEncoding] = None) -> str:
+    """Audio cache key of an utterance with the current model, voice and encoding."""
+    encoding = encoding or default_encoding()
+    # int8 audio is kept apart from fp32 audio
+    model = f"{model_version()}-{get_inference_profile().precision}"
+    return cache_key(healer_id, text, model, voice_hash(healer_id), encoding.id)
+
+
+# Bytes read per chunk when streaming an already generated file
+STREAM_FILE_CHUNK_SIZE = 64 * 1024
+
+# Size fields of a WAV stream whose length is unknown when the header is sent
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def wav_stream_header(sample_rate: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """
+    Header of a PCM WAV stream of unknown length.
+    
+    The RIFF and data chunk sizes are set to 0xFFFFFFFF, which players
+    treat as "read until the end of the stream".
+    """
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", WAV_UNKNOWN_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                sample_rate * block_align, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", WAV_UNKNOWN_SIZE)
+    )
+
+
+def pcm16_bytes(speech) -> bytes:
+    """16-bit little-endian PCM of a float waveform tensor in [-1, 1]."""
+    import torch
+    return (speech.flatten().clamp(-1, 1) * 32767).to(torch.int16).cpu().numpy().tobytes()
+
+
+def speaker_id(healer_id: str) -> str:
+    """ID under which a healer's voice is registered as a zero-shot speaker."""
+    return f"healer_{healer_id}"
+
 
 class CosyVoiceService:
-    """Service for generating TTS audio using CosyVoice."""
+    """
+    Service for generating TTS audio using CosyVoice.
     
-    def __init__(self):
+    Args:
+        profile: Inference profile (default: TTS_INFERENCE_PROFILE)
+    """
+    
+    def __init__(self, profile: Optional[InferenceProfile] = None):
         self.model: Optional[CosyVoice] = None
         self.is_initialized = False
+        self.profile = profile or get_inference_profile()
+        
+        # Reference clips loaded once (16kHz tensors) and healers whose
+        # prompt features are registered as cached speakers
+        self.prompt_speech = {}
+        self.cached_speakers = set()
+        
+        # Timings of the most recent stream_speech() call
+        self.last_stream_stats = None
         
     def initialize(self) -> bool:
         """Initialize the CosyVoice model."""
@@ -82,119 +216,338 @@ class CosyVoiceService:
                 logging.warning("CPU mode detected - TTS generation will be VERY SLOW (3-5 minutes per message)")
                 logging.warning("Consider using GPU for acceptable performance (3-10 seconds per message)")
             
-            # Try to use JIT-compiled models for better performance (if available)
-            # JIT models are pre-compiled and faster, but may not exist for all models
+            # Threads, JIT exports and int8 quantization come from the inference profile
+            logging.info(f"Inference profile: {self.profile.describe()}")
+            self.profile.apply_threads()
             self.model = CosyVoice(
                 str(MODEL_DIR),
                 device=device,
-                load_jit=False,  # Set to True if JIT models are available (check model directory)
+                load_jit=self.profile.load_jit(MODEL_DIR),  # TorchScript exports, if present
                 load_trt=False,  # TensorRT requires GPU and special setup
                 fp16=False       # FP16 requires GPU
             )
+            self.profile.prepare(self.model)
             self.is_initialized = True
             logging.info("CosyVoice model loaded successfully.")
+            
+            self._register_speakers()
             return True
             
         except Exception as e:
             logging.error(f"Failed to initialize CosyVoice: {e}")
             return False
     
+    def _register_speakers(self):
+        """
+        Load every healer's reference clip and register its prompt features
+        as a cached zero-shot speaker.
+        
+        Healers whose clip is missing are skipped (generate_speech reports
+        the error). CosyVoice versions without add_zero_shot_spk still reuse
+        the loaded clips but extract features per request.
+        """
+        supports_cache = hasattr(self.model, "add_zero_shot_spk")
+        if SPEAKER_CACHE_ENABLED and not supports_cache:
+            logging.warning("This CosyVoice version cannot cache speakers; prompt features are extracted per request")
+        
+        for healer_id, voice_filename in HEALER_VOICE_MAP.items():
+            voice_file = VOICE_DIR / voice_filename
+            if not voice_file.exists():
+                continue
+            
+            start_time = time.time()
+            try:
+                self.prompt_speech[healer_id] = load_wav(str(voice_file), 16000)
+                if SPEAKER_CACHE_ENABLED and supports_cache:
+                    self.model.add_zero_shot_spk(
+                        HEALER_PROMPT_TEXT.get(healer_id, ""),
+                        self.prompt_speech[healer_id],
+                        speaker_id(healer_id)
+                    )
+                    self.cached_speakers.add(healer_id)
+            except Exception as e:
+                logging.error(f"Failed to prepare voice for healer {healer_id}: {e}")
+                continue
+            logging.info(f"Prepared voice for healer {healer_id} in {time.time() - start_time:.2f}s "
+                         f"(cached speaker: {healer_id in self.cached_speakers})")
+    
+    def cached_audio(self, text: str, healer_id: str, encoding: Optional[AudioEncoding] = None) -> Optional[str]:
+        """
+        Path of an already generated utterance, or None.
+        
+        Does not need the model, so a hit is served without loading it.
+        """
+        if not AUDIO_CACHE_ENABLED or healer_id not in HEALER_VOICE_MAP:
+            return None
+        encoding = encoding or default_encoding()
+        path = get_audio_cache().get(audio_cache_key(text, healer_id, encoding), encoding.suffix)
+        return str(path) if path else None
+    
+    def voice_available(self, healer_id: str) -> bool:
+        """Whether the healer's reference clip is loaded or can be loaded."""
+        voice_file = VOICE_DIR / HEALER_VOICE_MAP[healer_id]
+        if healer_id not in self.prompt_speech and not voice_file.exists():
+            logging.error(f"Voice file not found: {voice_file}")
+            logging.error(f"Please ensure {HEALER_VOICE_MAP[healer_id]} exists in {VOICE_DIR}")
+            return False
+        return True
+    
+    def _prompt_inputs(self, healer_id: str, use_speaker_cache: bool = True):
+        """
+        Prompt arguments of inference_zero_shot for a healer.
+        
+        Returns:
+            Tuple of (prompt_text, prompt_speech_16k, zero_shot_spk_id)
+        """
+        # Load prompt speech (once per healer)
+        if healer_id not in self.prompt_speech:
+            self.prompt_speech[healer_id] = load_wav(str(VOICE_DIR / HEALER_VOICE_MAP[healer_id]), 16000)
+        prompt_speech_16k = self.prompt_speech[healer_id]
+        
+        # Registered speaker: CosyVoice reuses its features instead of the clip
+        zero_shot_spk_id = ""
+        if use_speaker_cache and healer_id in self.cached_speakers:
+            zero_shot_spk_id = speaker_id(healer_id)
+        
+        # Get prompt text for this healer (the text that corresponds to the voice clone audio)
+        prompt_text = HEALER_PROMPT_TEXT.get(healer_id, "")
+        if not prompt_text:
+            logging.warning(f"No prompt text found for healer {healer_id}, using empty string")
+            prompt_text = ""
+        
+        return prompt_text, prompt_speech_16k, zero_shot_spk_id
+    
+    def synthesize(self, text: str, healer_id: str, use_speaker_cache: bool = True):
+        """
+        Synthesize text with the loaded model.
+        
+        CosyVoice splits long text internally and yields one output per
+        piece; they are concatenated into a single waveform.
+        
+        Returns:
+            Waveform tensor of shape (1, samples) at self.model.sample_rate
+        """
+        import torch
+        
+        prompt_text, prompt_speech_16k, zero_shot_spk_id = self._prompt_inputs(healer_id, use_speaker_cache)
+        
+        # Generate audio using zero-shot inference
+        # Parameters: (tts_text, prompt_text, prompt_speech_16k, zero_shot_spk_id='', stream=False, ...)
+        # - tts_text: The text we want to synthesize (healer's response)
+        # - prompt_text: The text that corresponds to the voice clone audio (from original.txt)
+        # - prompt_speech_16k: The voice clone audio file (16kHz)
+        # - zero_shot_spk_id: The healer's cached speaker ('' extracts features from the clip)
+        with self.profile.inference_context():
+            outputs = [output['tts_speech'] for output in self.model.inference_zero_shot(
+                text,              # tts_text: text to synthesize
+                prompt_text,       # prompt_text: text from original audio
+                prompt_speech_16k, # prompt_speech_16k: voice clone audio
+                zero_shot_spk_id,  # zero_shot_spk_id: cached speaker features (or '')
+                stream=False       # stream: False for complete audio
+            )]
+        if not outputs:
+            return torch.zeros(1, 0)
+        return torch.cat(outputs, dim=1)
+    
     def generate_speech(
         self, 
         text: str, 
         healer_id: str,
-        output_path: Optional[str] = None
+        output_path: Optional[str] = None,
+        use_speaker_cache: bool = True,
+        lane: Optional[str] = None,
+        session: Optional[str] = None,
+        on_start: Optional[Callable[[], None]] = None,
+        encoding: Optional[AudioEncoding] = None
     ) -> Tuple[bool, Optional[str]]:
         """
         Generate speech for the given text using the healer's voice clone.
         
+        With TTS_PARALLEL_WORKERS > 1 the text is split into sentences that
+        are synthesized concurrently by worker processes (see tts/parallel.py)
+        and stitched into the same single file.
+        
         Args:
             text: Text to synthesize
             healer_id: ID of the healer (milo, leo, luna, max)
-            output_path: Optional path to save the audio file
+            output_path: Optional path to save the audio file (default: the
+                audio cache, which also returns earlier results directly)
+            use_speaker_cache: Reuse the healer's cached prompt features
+                (False re-extracts them, e.g. to measure the difference)
+            lane: Scheduler lane (default: by text length, see tts/scheduler.py)
+            session: Client session, for fair queuing between clients
+            on_start: Called when the scheduler lets the inference start
+            encoding: Audio format to write (default: TTS_AUDIO_FORMAT)
             
         Returns:
             Tuple of (success: bool, output_path: Optional[str])
         """
-        if not self.is_initialized:
-            if not self.initialize():
-                return False, None
+        from tts.parallel import get_parallel_synthesizer
         
         if healer_id not in HEALER_VOICE_MAP:
             logging.error(f"Unknown healer_id: {healer_id}")
             return False, None
         
-        voice_file = VOICE_DIR / HEALER_VOICE_MAP[healer_id]
-        if not voice_file.exists():
-            logging.error(f"Voice file not found: {voice_file}")
-            logging.error(f"Please ensure {HEALER_VOICE_MAP[healer_id]} exists in {VOICE_DIR}")
-            return False, None
+        encoding = encoding or default_encoding()
+        if output_path is None:
+            cached_path = self.cached_audio(text, healer_id, encoding)
+            if cached_path:
+                logging.info(f"Audio cache hit for healer {healer_id}: {cached_path}")
+                return True, cached_path
+        
+        # The worker pool loads its own models; otherwise use this process's
+        synthesizer = get_parallel_synthesizer()
+        if synthesizer is None:
+            if not self.is_initialized:
+                if not self.initialize():
+                    return False, None
+            if not self.voice_available(healer_id):
+                return False, None
         
         try:
-            # Load prompt speech
-            prompt_speech_16k = load_wav(str(voice_file), 16000)
-            
-            # Get prompt text for this healer (the text that corresponds to the voice clone audio)
-            prompt_text = HEALER_PROMPT_TEXT.get(healer_id, "")
-            if not prompt_text:
-                logging.warning(f"No prompt text found for healer {healer_id}, using empty string")
-                prompt_text = ""
+            import torch
             
             logging.info(f"Generating speech for healer {healer_id}: {text[:50]}...")
-            logging.info(f"Using prompt text: {prompt_text[:50]}...")
             logging.info(f"Text length: {len(text)} characters")
             
-            # Generate audio using zero-shot inference
-            # Parameters: (tts_text, prompt_text, prompt_speech_16k, zero_shot_spk_id='', stream=False, ...)
-            # - tts_text: The text we want to synthesize (healer's response)
-            # - prompt_text: The text that corresponds to the voice clone audio (from original.txt)
-            # - prompt_speech_16k: The voice clone audio file (16kHz)
-            import time
-            start_time = time.time()
-            
-            logging.info("Starting TTS generation (this may take 3-5 minutes on CPU, 3-10 seconds on GPU)...")
-            
-            audio_generated = False
-            for i, output in enumerate(self.model.inference_zero_shot(
-                text,              # tts_text: text to synthesize
-                prompt_text,       # prompt_text: text from original audio
-                prompt_speech_16k, # prompt_speech_16k: voice clone audio
-                '',                # zero_shot_spk_id: empty string (not using cached speaker)
-                stream=False       # stream: False for complete audio
-            )):
-                # Save the generated audio
-                if output_path is None:
-                    # Generate a temporary file path
-                    import tempfile
-                    import hashlib
-                    text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-                    output_path = str(Path(tempfile.gettempdir()) / f"tts_{healer_id}_{text_hash}.wav")
+            with get_scheduler().slot(lane or lane_for(text), session, on_grant=on_start):
+                start_time = time.time()
+                logging.info("Starting TTS generation (this may take 3-5 minutes on CPU, 3-10 seconds on GPU)...")
                 
-                torchaudio.save(
-                    output_path,
-                    output['tts_speech'],
-                    self.model.sample_rate
-                )
-                audio_generated = True
-                elapsed_time = time.time() - start_time
-                audio_duration = output['tts_speech'].shape[1] / self.model.sample_rate
-                rtf = elapsed_time / audio_duration if audio_duration > 0 else 0
-                logging.info(f"Speech generated successfully in {elapsed_time:.2f}s ({elapsed_time/60:.2f} minutes)")
-                logging.info(f"Audio duration: {audio_duration:.2f}s, Real-time factor (RTF): {rtf:.2f}x")
-                logging.info(f"Output file: {output_path}")
-                break
+                if synthesizer is not None:
+                    audio, sample_rate = synthesizer.synthesize(text, healer_id)
+                    speech = torch.from_numpy(audio).unsqueeze(0)
+                else:
+                    speech = self.synthesize(text, healer_id, use_speaker_cache)
+                    sample_rate = self.model.sample_rate
             
-            if audio_generated:
-                return True, output_path
-            else:
+            if speech.shape[1] == 0:
                 logging.error("No audio generated from model")
                 return False, None
+            
+            # Save the generated audio in the requested encoding
+            waveform = speech.reshape(-1).cpu().numpy()
+            if output_path is not None:
+                encoding.encode(waveform, sample_rate, output_path)
+            elif AUDIO_CACHE_ENABLED:
+                # Publish into the audio cache (written atomically)
+                cache = get_audio_cache()
+                key = audio_cache_key(text, healer_id, encoding)
+                with cache.writer(key, encoding.suffix) as temp_path:
+                    encoding.encode(waveform, sample_rate, temp_path)
+                output_path = str(cache.path(key, encoding.suffix))
+            else:
+                # Generate a temporary file path
+                import tempfile
+                text_hash = hashlib.sha256(f"{encoding.id}:{text}".encode()).hexdigest()[:16]
+                output_path = str(Path(tempfile.gettempdir()) / f"tts_{healer_id}_{text_hash}{encoding.suffix}")
+                encoding.encode(waveform, sample_rate, output_path)
+            
+            elapsed_time = time.time() - start_time
+            audio_duration = speech.shape[1] / sample_rate
+            rtf = elapsed_time / audio_duration if audio_duration > 0 else 0
+            logging.info(f"Speech generated successfully in {elapsed_time:.2f}s ({elapsed_time/60:.2f} minutes), "
+                         f"speaker cache: {'off' if not use_speaker_cache else 'on'}, "
+                         f"parallel workers: {synthesizer.workers if synthesizer else 1}, "
+                         f"format: {encoding.id}, profile: {self.profile.name}")
+            logging.info(f"Audio duration: {audio_duration:.2f}s, Real-time factor (RTF): {rtf:.2f}x")
+            logging.info(f"Output file: {output_path}")
+            return True, output_path
                 
         except Exception as e:
             logging.error(f"Error generating speech: {e}")
             import traceback
             logging.error(traceback.format_exc())
             return False, None
+    
+    def stream_speech(
+        self,
+        text: str,
+        healer_id: str,
+        use_speaker_cache: bool = True,
+        session: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """
+        Generate speech as a WAV byte stream, chunk by chunk.
+        
+        Yields a streaming WAV header followed by 16-bit PCM as CosyVoice
+        produces it (stream=True). A cached utterance is streamed from its
+        file instead, and a newly synthesized one is added to the cache when
+        the stream completes (as WAV at the model's sample rate, whatever
+        TTS_AUDIO_FORMAT is). The caller must check initialize() and
+        voice_available() first; errors during synthesis end the stream.
+        
+        The scheduler slot (interactive lane: a listener is waiting) is held
+        until synthesis ends or the client goes away. Timings of the last
+        stream are kept in last_stream_stats (time_to_first_audio,
+        total_time, audio_duration, rtf); total_time includes scheduler wait.
+        """
+        start_time = time.time()
+        encoding = AudioEncoding("wav")
+        
+        cached_path = self.cached_audio(text, healer_id, encoding)
+        if cached_path:
+            logging.info(f"Audio cache hit for healer {healer_id}, streaming {cached_path}")
+            with open(cached_path, "rb") as f:
+                while True:
+                    data = f.read(STREAM_FILE_CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield data
+            self.last_stream_stats = {"time_to_first_audio": 0.0, "total_time": time.time() - start_time,
+                                      "cached": True}
+            return
+        
+        import torch
+        
+        prompt_text, prompt_speech_16k, zero_shot_spk_id = self._prompt_inputs(healer_id, use_speaker_cache)
+        logging.info(f"Streaming speech for healer {healer_id}: {text[:50]}...")
+        
+        yield wav_stream_header(self.model.sample_rate)
+        
+        chunks = []
+        time_to_first_audio = None
+        with get_scheduler().slot(INTERACTIVE, session):
+            outputs = self.model.inference_zero_shot(
+                text,
+                prompt_text,
+                prompt_speech_16k,
+                zero_shot_spk_id,
+                stream=True        # stream: yield audio chunks as they are synthesized
+            )
+            while True:
+                # The profile's context is entered per chunk rather than across
+                # yields: inference mode is thread-local, and the consumer may
+                # resume this generator on another thread
+                with self.profile.inference_context():
+                    output = next(outputs, None)
+                if output is None:
+                    break
+                speech = output['tts_speech']
+                if time_to_first_audio is None:
+                    time_to_first_audio = time.time() - start_time
+                    logging.info(f"Time to first audio: {time_to_first_audio:.2f}s")
+                chunks.append(speech)
+                yield pcm16_bytes(speech)
+        
+        if not chunks:
+            logging.error("No audio generated from model")
+            return
+        
+        audio = torch.cat(chunks, dim=1)
+        total_time = time.time() - start_time
+        audio_duration = audio.shape[1] / self.model.sample_rate
+        rtf = total_time / audio_duration if audio_duration > 0 else 0
+        self.last_stream_stats = {"time_to_first_audio": time_to_first_audio, "total_time": total_time,
+                                  "audio_duration": audio_duration, "rtf": rtf, "chunks": len(chunks),
+                                  "cached": False}
+        logging.info(f"Speech streamed in {total_time:.2f}s ({len(chunks)} chunks), "
+                     f"time to first audio: {time_to_first_audio:.2f}s, RTF: {rtf:.2f}x")
+        
+        if AUDIO_CACHE_ENABLED:
+            cache = get_audio_cache()
+            with cache.writer(audio_cache_key(text, healer_id, encoding), encoding.suffix) as temp_path:
+                encoding.encode(audio.reshape(-1).cpu().numpy(), self.model.sample_rate, temp_path)
 
 
 # Global service instance
@@ -0,0 +1,349 @@
+"""
+TTS Inference Profiles
+
+How the CosyVoice model is loaded and run on CPU. A profile combines:
+
+- JIT: load the TorchScript exports of the LLM text encoder, the LLM and
+  the flow encoder that ship with the model (llm.text_encoder.fp32.zip,
+  llm.llm.fp32.zip, flow.encoder.fp32.zip), when they are present.
+  CosyVoice itself only loads them with CUDA (it resets load_jit without a
+  GPU), so on a CPU-only install cpu-jit is thread tuning and no autograd;
+  the profile reports whether JIT modules were actually loaded
+- int8: dynamic int8 quantization of the Linear layers of the LLM and the
+  flow model (weights stored as int8, activations quantized on the fly).
+  The vocoder (HiFT) stays fp32: it is convolutional and most sensitive
+  to precision. JIT modules are traced in fp32, so int8 profiles load the
+  eager modules instead
+- Threads: torch intra-op threads (TTS_TORCH_THREADS, default: all CPUs)
+  and a single inter-op thread; autoregressive decoding runs one small op
+  after another, so inter-op parallelism only adds contention
+- No autograd: model parameters are frozen and synthesis runs under
+  torch.inference_mode()
+
+Profiles (TTS_INFERENCE_PROFILE):
+- baseline: eager fp32, torch default threads (the original behaviour)
+- cpu-jit: JIT, thread tuning and no autograd, fp32
+- cpu-int8: int8 LLM and flow, thread tuning and no autograd
+
+int8 audio can sound slightly different, so the audio cache keeps it apart
+from fp32 audio. The benchmark below reports the real-time factor of each
+profile and checks that quality stays acceptable: the audio must not be
+silent or clipped, and when openai-whisper is installed, a transcript of
+it must still match the text (word error rate).
+
+Usage (benchmark):
+    python -m tts.inference_profile
+    python -m tts.inference_profile --profiles baseline,cpu-int8 --healer luna --output profiles.json
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# TorchScript exports CosyVoice loads with load_jit=True (fp32)
+JIT_FILES = ["llm.text_encoder.fp32.zip", "llm.llm.fp32.zip", "flow.encoder.fp32.zip"]
+
+# Profile name -> (JIT, int8 quantization, tuned threads and no autograd)
+PROFILES = {
+    "baseline": (False, False, False),
+    "cpu-jit": (True, False, True),
+    "cpu-int8": (False, True, True),
+}
+
+DEFAULT_PROFILE = os.getenv("TTS_INFERENCE_PROFILE", "baseline")
+
+# Quality limits of the benchmark check
+QUALITY_MAX_WER = 0.15           # Word error rate of the transcript
+QUALITY_MAX_WER_INCREASE = 0.05  # Over the baseline profile
+QUALITY_MIN_RMS_DB = -45.0       # Quieter than this is treated as silence
+QUALITY_MAX_CLIPPED = 0.001      # Fraction of samples at full scale
+
+# Whisper model used for the transcript check
+QUALITY_ASR_MODEL = os.getenv("TTS_QUALITY_ASR_MODEL", "base")
+
+
+class InferenceProfile:
+    """
+    Model loading and runtime settings of one profile.
+
+    Args:
+        name: Profile name (key of PROFILES)
+        threads: Torch intra-op threads (default: TTS_TORCH_THREADS or all
+            CPUs for tuned profiles, torch's default for baseline)
+    """
+
+    def __init__(self, name: str = DEFAULT_PROFILE, threads: Optional[int] = None):
+        if name not in PROFILES:
+            raise ValueError(f"Unknown inference profile {name!r} (choose from {', '.join(PROFILES)})")
+        self.name = name
+        # jit is what the profile asks for until prepare() checks what was loaded
+        self.jit, self.quantize, self.tuned = PROFILES[name]
+        if threads is None and self.tuned:
+            threads = int(os.getenv("TTS_TORCH_THREADS", "0")) or os.cpu_count() or 1
+        self.threads = threads
+        self.interop_threads = 1 if self.tuned else None
+
+    @property
+    def precision(self) -> str:
+        """Numeric precision of the LLM and flow (part of the audio cache key)."""
+        return "int8" if self.quantize else "fp32"
+
+    def describe(self) -> dict:
+        return {"name": self.name, "jit": self.jit, "int8": self.quantize,
+                "threads": self.threads, "interop_threads": self.interop_threads}
+
+    def apply_threads(self):
+        """Set torch's thread pools (before the model runs for the interop setting to apply)."""
+        import torch
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        if self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                # Already fixed once inter-op work has started
+                logging.warning("Torch inter-op threads are already set; keeping "
+                                f"{torch.get_num_interop_threads()}")
+
+    def load_jit(self, model_dir: Path) -> bool:
+        """Whether to ask CosyVoice to load the JIT exports."""
+        if not self.jit or self.quantize:
+            return False
+        missing = [name for name in JIT_FILES if not (model_dir / name).exists()]
+        if missing:
+            logging.warning(f"JIT exports not found in {model_dir} ({', '.join(missing)}); using eager modules")
+            return False
+        return True
+
+    def prepare(self, cosyvoice):
+        """Freeze a loaded CosyVoice model and quantize it if the profile asks."""
+        import torch
+        model = cosyvoice.model
+        if self.jit:
+            # CosyVoice drops load_jit without CUDA ("no cuda device"), so
+            # report the modules that were loaded, not the ones asked for
+            self.jit = any(isinstance(module, torch.jit.ScriptModule) for module in (
+                getattr(getattr(model, "llm", None), "text_encoder", None),
+                getattr(getattr(model, "flow", None), "encoder", None)))
+            if not self.jit:
+                logging.warning(f"Profile {self.name}: CosyVoice did not load the TorchScript exports "
+                                "(it only does with CUDA); running eager fp32 modules")
+        # requires_grad is per tensor, so this also covers CosyVoice's own
+        # threads, where inference_mode() (thread-local) doesn't reach
+        if self.tuned:
+            for name in ("llm", "flow", "hift"):
+                module = getattr(model, name, None)
+                if isinstance(module, torch.nn.Module):
+                    module.eval()
+                    module.requires_grad_(False)
+
+        if self.quantize:
+            for name in ("llm", "flow"):
+                module = getattr(model, name)
+                size_before = module_size_mb(module)
+                setattr(model, name, torch.ao.quantization.quantize_dynamic(
+                    module, {torch.nn.Linear}, dtype=torch.qint8))
+                logging.info(f"Quantized {name} to int8: {size_before:.0f} MB -> "
+                             f"{module_size_mb(getattr(model, name)):.0f} MB")
+
+    def inference_context(self):
+        """Context for running synthesis (no autograd bookkeeping in tuned profiles)."""
+        import torch
+        return torch.inference_mode() if self.tuned else contextlib.nullcontext()
+
+
+def module_size_mb(module) -> float:
+    """Size of a module's weights (including packed int8 weights) in MB."""
+    import io
+    import torch
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+# Global profile instance
+_inference_profile: Optional[InferenceProfile] = None
+
+
+def get_inference_profile() -> InferenceProfile:
+    """Get or create the configured profile (TTS_INFERENCE_PROFILE)."""
+    global _inference_profile
+    if _inference_profile is None:
+        _inference_profile = InferenceProfile()
+    return _inference_profile
+
+
+# ==================== Quality check ====================
+
+def signal_stats(waveform: np.ndarray, sample_rate: int, text: str) -> dict:
+    """Level, clipping and speaking rate of a synthesized utterance."""
+    waveform = np.asarray(waveform, dtype=np.float32).reshape(-1)
+    rms = float(np.sqrt(np.mean(waveform ** 2))) if len(waveform) else 0.0
+    return {
+        "duration": len(waveform) / sample_rate,
+        "rms_db": float(20 * np.log10(max(rms, 1e-10))),
+        "clipped": float(np.mean(np.abs(waveform) >= 0.999)) if len(waveform) else 0.0,
+        "seconds_per_char": len(waveform) / sample_rate / max(1, len(text)),
+    }
+
+
+def _words(text: str) -> list[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level edit distance divided by the reference length."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / max(1, len(ref))
+
+
+def load_asr_model():
+    """Whisper model for the transcript check, or None if whisper isn't installed."""
+    try:
+        import whisper
+    except ImportError:
+        print("openai-whisper is not installed: skipping the transcript (WER) check")
+        return None
+    return whisper.load_model(QUALITY_ASR_MODEL, device="cpu")
+
+
+def transcribe(asr_model, waveform: np.ndarray, sample_rate: int) -> str:
+    """Transcript of a waveform (resampled to Whisper's 16 kHz)."""
+    waveform = np.asarray(waveform, dtype=np.float32).reshape(-1)
+    if sample_rate != 16000:
+        positions = np.arange(0, len(waveform), sample_rate / 16000)
+        waveform = np.interp(positions, np.arange(len(waveform)), waveform).astype(np.float32)
+    return asr_model.transcribe(waveform, language="en", fp16=False)["text"].strip()
+
+
+def quality_problems(stats: dict, wer: Optional[float], baseline_wer: Optional[float]) -> list[str]:
+    """Reasons an utterance's quality is not acceptable (empty if it is)."""
+    problems = []
+    if stats["rms_db"] < QUALITY_MIN_RMS_DB:
+        problems.append(f"silent ({stats['rms_db']:.1f} dBFS)")
+    if stats["clipped"] > QUALITY_MAX_CLIPPED:
+        problems.append(f"clipped ({stats['clipped']:.2%} of samples)")
+    if wer is not None:
+        if wer > QUALITY_MAX_WER:
+            problems.append(f"WER {wer:.2f} > {QUALITY_MAX_WER}")
+        if baseline_wer is not None and wer - baseline_wer > QUALITY_MAX_WER_INCREASE:
+            problems.append(f"WER {wer:.2f} is {wer - baseline_wer:+.2f} over baseline")
+    return problems
+
+
+# ==================== Benchmark ====================
+
+def _run_profile(name: str, healer_id: str, texts: list[str]) -> dict:
+    """Load the model with a profile and synthesize texts (in a fresh process)."""
+    from tts.cosyvoice_service import CosyVoiceService
+
+    profile = InferenceProfile(name)
+    service = CosyVoiceService(profile)
+    start_time = time.time()
+    if not service.initialize():
+        raise RuntimeError(f"Failed to load the model with profile {name}")
+    load_time = time.time() - start_time
+
+    # Warm-up run (first inference pays for lazy initialization)
+    service.synthesize("Hello.", healer_id)
+
+    utterances = []
+    for text in texts:
+        start_time = time.time()
+        speech = service.synthesize(text, healer_id)
+        elapsed = time.time() - start_time
+        waveform = speech.reshape(-1).cpu().numpy()
+        duration = len(waveform) / service.model.sample_rate
+        utterances.append({"text": text, "time": elapsed, "duration": duration,
+                           "rtf": elapsed / duration if duration > 0 else 0.0, "waveform": waveform})
+
+    total_time = sum(u["time"] for u in utterances)
+    total_duration = sum(u["duration"] for u in utterances)
+    return {
+        "profile": profile.describe(),
+        "load_time": load_time,
+        "sample_rate": service.model.sample_rate,
+        "rtf": total_time / total_duration if total_duration > 0 else 0.0,
+        "utterances": utterances,
+    }
+
+
+def main():
+    """Benchmark the real-time factor and audio quality of each profile."""
+    from tts.parallel import BENCH_SENTENCES
+
+    parser = argparse.ArgumentParser(description="Benchmark TTS inference profiles")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles")
+    parser.add_argument("--healer", default="luna", help="Healer voice")
+    parser.add_argument("--sentences", type=int, default=3, help="Benchmark sentences to synthesize")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here")
+    args = parser.parse_args()
+
+    names = args.profiles.split(",")
+    texts = BENCH_SENTENCES[:args.sentences]
+    print(f"CPUs: {os.cpu_count()}, healer: {args.healer}, {len(texts)} sentences")
+
+    results = []
+    for name in names:
+        print(f"\nProfile {name}...")
+        # Each profile in its own process: thread pools and quantized
+        # modules can't be undone within a process
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(_run_profile, name, args.healer, texts).result()
+        print(f"  load {result['load_time']:.1f}s, RTF {result['rtf']:.2f}x")
+        results.append(result)
+
+    print("\nChecking audio quality...")
+    asr_model = load_asr_model()
+    baseline_wers = None
+    for result in results:
+        wers = []
+        for utterance in result["utterances"]:
+            waveform = utterance.pop("waveform")
+            utterance["signal"] = signal_stats(waveform, result["sample_rate"], utterance["text"])
+            if asr_model is not None:
+                utterance["transcript"] = transcribe(asr_model, waveform, result["sample_rate"])
+                utterance["wer"] = word_error_rate(utterance["text"], utterance["transcript"])
+            wers.append(utterance.get("wer"))
+        if result["profile"]["name"] == "baseline":
+            baseline_wers = wers
+        for i, utterance in enumerate(result["utterances"]):
+            baseline_wer = baseline_wers[i] if baseline_wers and result["profile"]["name"] != "baseline" else None
+            utterance["problems"] = quality_problems(utterance["signal"], utterance.get("wer"), baseline_wer)
+        result["quality_ok"] = not any(u["problems"] for u in result["utterances"])
+
+    print(f"\n{'profile':<10} {'load':>7} {'RTF':>7} {'WER':>6}  quality")
+    for result in results:
+        wers = [u["wer"] for u in result["utterances"] if "wer" in u]
+        wer = f"{sum(wers) / len(wers):.2f}" if wers else "-"
+        problems = "; ".join(p for u in result["utterances"] for p in u["problems"])
+        print(f"{result['profile']['name']:<10} {result['load_time']:>6.1f}s {result['rtf']:>6.2f}x {wer:>6}  "
+              f"{'ok' if result['quality_ok'] else problems}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"cpus": os.cpu_count(), "healer": args.healer, "profiles": results},
+                                          indent=2))
+        print(f"\nResults written to {args.output}")
+    return 0 if all(result["quality_ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
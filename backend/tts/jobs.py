@@ -0,0 +1,304 @@
+"""
+TTS Job Queue
+
+Speech generation takes minutes on CPU, longer than proxies keep an HTTP
+request open. Instead of waiting on /api/tts/generate, clients submit a
+job, get its ID back immediately and then poll it or subscribe to its
+completion (server-sent events).
+
+- Identical (healer, text, audio encoding) jobs that are queued or running
+  are coalesced:
+  the second submit returns the job that is already in flight.
+- The queue is bounded (TTS_MAX_QUEUED_JOBS); submitting to a full queue
+  fails instead of piling up hours of work.
+- Jobs are handed to the inference scheduler (tts/scheduler.py) as soon as
+  they are submitted; it decides when each one runs (by lane and session)
+  and the job turns from "queued" to "generating" when it is granted a slot.
+- Jobs can be cancelled. Every submit gets its own cancel token, so a
+  client can only withdraw its own submit (retrying a cancel is harmless),
+  and a coalesced job is only cancelled once every submitter has
+  cancelled it; a job that is already synthesizing finishes
+  in the background (the model call can't be interrupted) but reports
+  "cancelled" and its result is ignored.
+- Each job records when it was queued, started and finished.
+
+Finished jobs are kept for JOB_TTL_SECONDS so clients can still fetch the
+result, then dropped.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+# Jobs waiting to start (not counting running ones)
+MAX_QUEUED_JOBS = int(os.getenv("TTS_MAX_QUEUED_JOBS", "32"))
+
+# How long finished jobs stay available
+JOB_TTL_SECONDS = 600
+
+# Job states (generating/ready/error match TTSResponse.status)
+QUEUED = "queued"
+GENERATING = "generating"
+READY = "ready"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINISHED_STATES = (READY, ERROR, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a full queue."""
+
+
+class JobCancelledError(Exception):
+    """Raised in place of starting a job that was cancelled while queued."""
+
+
+class CancelTokenError(Exception):
+    """Raised when cancelling a job with a token that was not issued for it."""
+
+
+class TTSJob:
+    """One speech generation job."""
+
+    def __init__(self, healer_id: str, text: str, session: Optional[str] = None, lane: Optional[str] = None,
+                 encoding=None):
+        self.id = uuid.uuid4().hex
+        self.healer_id = healer_id
+        self.text = text
+        self.session = session
+        self.lane = lane
+        self.encoding = encoding
+        self.status = QUEUED
+        self.audio_path: Optional[str] = None
+        self.error: Optional[str] = None
+        # Cancel tokens of every submit sharing this job (coalesced submits),
+        # and of those that have not cancelled yet
+        self.tokens = set()
+        self.submitters = set()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    @property
+    def key(self) -> Tuple[str, str, Optional[str]]:
+        return (self.healer_id, self.text, self.encoding.id if self.encoding else None)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def add_submitter(self) -> str:
+        """Register one more submit of this job; returns its cancel token."""
+        token = uuid.uuid4().hex
+        self.tokens.add(token)
+        self.submitters.add(token)
+        return token
+
+    def finish(self, status: str, audio_path: Optional[str] = None, error: Optional[str] = None):
+        self.status = status
+        self.audio_path = audio_path
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+    def timings(self) -> dict:
+        """Seconds spent queued, generating and in total (so far, if unfinished)."""
+        now = time.time()
+        started = self.started_at or (self.finished_at if self.finished else now)
+        return {
+            "queued": started - self.created_at,
+            "generating": ((self.finished_at or now) - self.started_at) if self.started_at else 0.0,
+            "total": (self.finished_at or now) - self.created_at,
+        }
+
+
+class TTSJobQueue:
+    """
+    Bounded set of TTS jobs, each generated in a worker thread.
+
+    Must be used from the server's event loop. Every in-flight job occupies
+    a thread, most of them waiting inside generate() for the scheduler.
+
+    Args:
+        generate: Function (text, healer_id, lane=, session=, on_start=,
+            encoding=) -> (success, audio path); calls on_start when
+            generation begins
+        cached: Function (text, healer_id, encoding) -> audio path or None, checked
+            before queuing so cached replies finish immediately
+        max_queued: Maximum number of jobs waiting to start
+        max_running: Jobs that can be generating at the same time (sizes
+            the thread pool; the scheduler enforces the real limit)
+    """
+
+    def __init__(self, generate: Callable, cached: Optional[Callable] = None,
+                 max_queued: int = MAX_QUEUED_JOBS, max_running: int = 1):
+        self.generate = generate
+        self.cached = cached
+        self.max_queued = max_queued
+        self.jobs = OrderedDict()
+        self._in_flight = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_queued + max(1, max_running),
+                                            thread_name_prefix="tts-job")
+
+    def queued_count(self) -> int:
+        return sum(1 for job in self._in_flight.values() if job.status == QUEUED)
+
+    def position(self, job: TTSJob) -> Optional[int]:
+        """
+        1-based position of a queued job among all queued jobs in submit
+        order (None once it has started). The scheduler may start jobs in
+        another order, so this is an estimate.
+        """
+        if job.status != QUEUED:
+            return None
+        queued = [j for j in self.jobs.values() if j.status == QUEUED]
+        return queued.index(job) + 1
+
+    def _purge(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, text: str, healer_id: str, session: Optional[str] = None,
+               lane: Optional[str] = None, encoding=None) -> Tuple[TTSJob, str]:
+        """
+        Queue a job, or join the identical job already in flight.
+
+        Args:
+            session: Client session, for fair scheduling between clients
+            lane: Scheduler lane (default: chosen by text length)
+            encoding: AudioEncoding to generate (default: the server's)
+
+        Returns:
+            Tuple of (job, cancel token of this submit)
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        self._purge()
+
+        job = TTSJob(healer_id, text, session, lane, encoding)
+        in_flight = self._in_flight.get(job.key)
+        if in_flight is not None:
+            token = in_flight.add_submitter()
+            logging.info(f"Coalesced TTS job {in_flight.id} ({len(in_flight.submitters)} requests)")
+            return in_flight, token
+
+        cached_path = self.cached(text, healer_id, encoding) if self.cached else None
+        if cached_path:
+            job.started_at = job.created_at
+            job.finish(READY, audio_path=cached_path)
+            self.jobs[job.id] = job
+            return job, job.add_submitter()
+
+        if self.queued_count() >= self.max_queued:
+            raise QueueFullError(f"TTS queue is full ({self.max_queued} jobs waiting)")
+
+        self.jobs[job.id] = job
+        self._in_flight[job.key] = job
+        token = job.add_submitter()
+        asyncio.create_task(self._run(job))
+        return job, token
+
+    def get(self, job_id: str) -> Optional[TTSJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str, token: str) -> Optional[TTSJob]:
+        """
+        Withdraw one submitter's interest in a job.
+
+        The job is cancelled when no submitter is left. Cancelling again
+        with the same token changes nothing.
+
+        Args:
+            token: Cancel token returned by the submit being withdrawn
+
+        Returns:
+            The job (None if unknown)
+
+        Raises:
+            CancelTokenError: If the token was not issued for this job
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if token not in job.tokens:
+            raise CancelTokenError(f"Invalid cancel token for TTS job {job.id}")
+        if job.finished:
+            return job
+        job.submitters.discard(token)
+        if not job.submitters:
+            self._in_flight.pop(job.key, None)
+            job.finish(CANCELLED)
+            logging.info(f"Cancelled TTS job {job.id}")
+        return job
+
+    async def wait(self, job: TTSJob, timeout: Optional[float] = None) -> bool:
+        """Wait for a job to finish; False if the timeout expired first."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _started(self, job: TTSJob):
+        if not job.finished:
+            job.status = GENERATING
+        job.started_at = time.time()
+
+    async def _run(self, job: TTSJob):
+        loop = asyncio.get_running_loop()
+
+        def on_start():
+            # Cancelled while waiting for the scheduler: give the slot back
+            if job.finished:
+                raise JobCancelledError(f"TTS job {job.id} was cancelled")
+            loop.call_soon_threadsafe(self._started, job)
+
+        def generate():
+            # Cancelled while waiting for a thread: don't occupy the model
+            if job.finished:
+                return False, None
+            return self.generate(job.text, job.healer_id, lane=job.lane, session=job.session,
+                                 on_start=on_start, encoding=job.encoding)
+
+        try:
+            success, audio_path = await loop.run_in_executor(self._executor, generate)
+            if not job.finished:
+                if success and audio_path:
+                    job.finish(READY, audio_path=audio_path)
+                else:
+                    job.finish(ERROR, error="Failed to generate speech audio.")
+        except Exception as e:
+            logging.error(f"TTS job {job.id} failed: {e}")
+            if not job.finished:
+                job.finish(ERROR, error=f"TTS generation error: {str(e)}")
+        finally:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+
+        timings = job.timings()
+        logging.info(f"TTS job {job.id} {job.status}: queued {timings['queued']:.2f}s, "
+                     f"generating {timings['generating']:.2f}s")
+
+
+# Global queue instance
+_job_queue: Optional[TTSJobQueue] = None
+
+
+def get_job_queue() -> TTSJobQueue:
+    """Get or create the global TTS job queue."""
+    global _job_queue
+    if _job_queue is None:
+        from tts.cosyvoice_service import get_tts_service
+        from tts.scheduler import MAX_CONCURRENT_INFERENCES
+        service = get_tts_service()
+        _job_queue = TTSJobQueue(service.generate_speech, cached=service.cached_audio,
+                                 max_running=MAX_CONCURRENT_INFERENCES)
+    return _job_queue
@@ -0,0 +1,268 @@
+"""
+Sentence-Parallel Synthesis
+
+Splits a healer reply at sentence boundaries and synthesizes the segments
+concurrently in a pool of model worker processes, then stitches them back
+together in order with a short pause between segments (each segment fades
+in and out over a few milliseconds so the joins don't click).
+
+Each worker loads its own copy of the model (with the cached healer
+speakers) and is pinned to a fixed number of torch threads, so N workers x
+T threads fill the machine without oversubscribing it. Autoregressive
+decoding uses small ops that don't scale across many threads, so several
+workers on fewer threads each finish a multi-sentence reply sooner than
+one worker using every core. Memory grows by one model per worker.
+
+Configuration (environment variables):
+- TTS_PARALLEL_WORKERS: Worker processes (default: 1, synthesize in-process)
+- TTS_PARALLEL_THREADS: Torch threads per worker (default: CPUs / workers)
+
+Usage (benchmark):
+    python -m tts.parallel --workers 1,2,4 --segments 1,2,4,8
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"([.!?。！？…]+[\"'”’)\]]*)\s+")
+
+# Segments shorter than this are merged into the next one (tiny segments
+# cost a full model call and sound clipped on their own)
+MIN_SEGMENT_CHARS = 40
+
+# Silence inserted between segments and fade applied at every join
+PAUSE_SECONDS = 0.12
+FADE_SECONDS = 0.01
+
+PARALLEL_WORKERS = int(os.getenv("TTS_PARALLEL_WORKERS", "1"))
+
+# Service of the current worker process (set by _init_worker)
+_worker_service = None
+
+
+def split_sentences(text: str, min_chars: int = MIN_SEGMENT_CHARS) -> list[str]:
+    """Split text into sentence segments of at least min_chars (except the last)."""
+    # split() alternates text and captured sentence ends; rejoin them
+    parts = SENTENCE_END.split(text.strip())
+    sentences = [parts[i] + (parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+
+    segments = []
+    current = ""
+    for sentence in sentences:
+        if not sentence:
+            continue
+        current = f"{current} {sentence}" if current else sentence
+        if len(current) >= min_chars:
+            segments.append(current)
+            current = ""
+    if current:
+        if segments and len(current) < min_chars:
+            segments[-1] = f"{segments[-1]} {current}"
+        else:
+            segments.append(current)
+    return segments
+
+
+def stitch(segments: list[np.ndarray], sample_rate: int, pause_seconds: float = PAUSE_SECONDS,
+           fade_seconds: float = FADE_SECONDS) -> np.ndarray:
+    """Join mono waveforms in order with a short fade at each join and a pause between."""
+    fade = int(fade_seconds * sample_rate)
+    pause = np.zeros(int(pause_seconds * sample_rate), dtype=np.float32)
+    parts = []
+    for i, segment in enumerate(segments):
+        segment = np.asarray(segment, dtype=np.float32).reshape(-1).copy()
+        n = min(fade, len(segment) // 2)
+        if n:
+            ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            if i > 0:
+                segment[:n] *= ramp
+            if i < len(segments) - 1:
+                segment[-n:] *= ramp[::-1]
+        if i > 0:
+            parts.append(pause)
+        parts.append(segment)
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+def default_threads(workers: int) -> int:
+    """Threads per worker that spread the CPUs evenly across workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def pin_threads(threads: int):
+    """
+    Limit this process's math libraries to `threads` threads.
+
+    Must run before torch is imported for the OpenMP/MKL settings to apply.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        # Interop threads already fixed
+        pass
+
+
+def _init_worker(threads: int):
+    global _worker_service
+    pin_threads(threads)
+
+    from tts.cosyvoice_service import CosyVoiceService
+    from tts.inference_profile import InferenceProfile, get_inference_profile
+    # The configured profile, on this worker's share of the CPUs
+    _worker_service = CosyVoiceService(InferenceProfile(get_inference_profile().name, threads))
+    if not _worker_service.initialize():
+        logging.error("TTS worker failed to load the model")
+
+
+def _synthesize_segment(text: str, healer_id: str) -> tuple[np.ndarray, int, float]:
+    """Synthesize one segment in a worker: (waveform, sample rate, seconds taken)."""
+    start_time = time.time()
+    if not _worker_service.is_initialized and not _worker_service.initialize():
+        raise RuntimeError("TTS model is not available in the worker")
+    speech = _worker_service.synthesize(text, healer_id)
+    return speech.reshape(-1).cpu().numpy(), _worker_service.model.sample_rate, time.time() - start_time
+
+
+class ParallelSynthesizer:
+    """
+    Pool of model worker processes synthesizing sentence segments.
+
+    Args:
+        workers: Worker processes (each loads the model)
+        threads: Torch threads per worker (default: CPUs / workers)
+    """
+
+    def __init__(self, workers: int, threads: Optional[int] = None):
+        self.workers = workers
+        self.threads = threads or default_threads(workers)
+        # spawn: workers must not inherit torch/OpenMP state from the server
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads,)
+        )
+        self.last_stats = None
+
+    def synthesize(self, text: str, healer_id: str) -> tuple[np.ndarray, int]:
+        """
+        Synthesize text segment-parallel.
+
+        Returns:
+            Tuple of (stitched waveform, sample rate)
+        """
+        start_time = time.time()
+        segments = split_sentences(text) or [text]
+        futures = [self.pool.submit(_synthesize_segment, segment, healer_id) for segment in segments]
+        results = [future.result() for future in futures]
+        sample_rate = results[0][1]
+        audio = stitch([waveform for waveform, _, _ in results], sample_rate)
+
+        self.last_stats = {
+            "segments": len(segments),
+            "wall_time": time.time() - start_time,
+            "segment_times": [seconds for _, _, seconds in results],
+            "audio_duration": len(audio) / sample_rate,
+        }
+        logging.info(f"Synthesized {len(segments)} segments on {self.workers} workers "
+                     f"in {self.last_stats['wall_time']:.2f}s "
+                     f"(sequential would take ~{sum(self.last_stats['segment_times']):.2f}s)")
+        return audio, sample_rate
+
+    def warm_up(self):
+        """Wait until every worker has loaded the model."""
+        futures = [self.pool.submit(_synthesize_segment, "Hello.", "luna") for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Global synthesizer instance
+_parallel_synthesizer: Optional[ParallelSynthesizer] = None
+
+
+def get_parallel_synthesizer() -> Optional[ParallelSynthesizer]:
+    """The global worker pool, or None when TTS_PARALLEL_WORKERS <= 1."""
+    global _parallel_synthesizer
+    if PARALLEL_WORKERS <= 1:
+        return None
+    if _parallel_synthesizer is None:
+        threads = int(os.getenv("TTS_PARALLEL_THREADS", "0")) or None
+        _parallel_synthesizer = ParallelSynthesizer(PARALLEL_WORKERS, threads)
+    return _parallel_synthesizer
+
+
+# Benchmark sentences (each well above MIN_SEGMENT_CHARS, so one sentence = one segment)
+BENCH_SENTENCES = [
+    "It sounds like today has been really heavy for you.",
+    "Let's take one slow breath together before we go on.",
+    "You don't have to figure everything out tonight.",
+    "Notice where you feel the tension, and let it soften a little.",
+    "Whatever you are feeling right now is allowed to be here.",
+    "Small steps still count, even when they feel invisible.",
+    "I'm glad you reached out instead of carrying this alone.",
+    "When you're ready, tell me what part feels hardest.",
+]
+
+
+def main():
+    """Benchmark wall-clock speedup against segment count and worker count."""
+    parser = argparse.ArgumentParser(description="Benchmark sentence-parallel TTS")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--segments", default="1,2,4,8", help="Comma-separated segment counts")
+    parser.add_argument("--healer", default="luna", help="Healer voice")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here")
+    args = parser.parse_args()
+
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    segment_counts = [int(n) for n in args.segments.split(",")]
+    print(f"CPUs: {os.cpu_count()}")
+
+    results = []
+    for workers in worker_counts:
+        synthesizer = ParallelSynthesizer(workers)
+        print(f"Loading {workers} worker(s) x {synthesizer.threads} thread(s)...")
+        synthesizer.warm_up()
+        for segments in segment_counts:
+            text = " ".join(BENCH_SENTENCES[i % len(BENCH_SENTENCES)] for i in range(segments))
+            synthesizer.synthesize(text, args.healer)
+            stats = dict(synthesizer.last_stats, workers=workers, threads=synthesizer.threads)
+            results.append(stats)
+            print(f"  {segments} segments: {stats['wall_time']:.2f}s wall, "
+                  f"{stats['audio_duration']:.2f}s audio")
+        synthesizer.close()
+
+    print(f"\n{'segments':>8} " + " ".join(f"{f'{w} worker(s)':>14}" for w in worker_counts) + "   speedup")
+    for segments in segment_counts:
+        times = [next(r["wall_time"] for r in results if r["workers"] == w and r["segments"] == segments)
+                 for w in worker_counts]
+        speedups = " ".join(f"{times[0] / t:.2f}x" for t in times[1:])
+        print(f"{segments:>8} " + " ".join(f"{t:>13.2f}s" for t in times) + f"   {speedups}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"cpus": os.cpu_count(), "runs": results}, indent=2))
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
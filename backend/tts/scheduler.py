@@ -0,0 +1,182 @@
+"""
+TTS Inference Scheduler
+
+All synthesis in the API process goes through one scheduler that owns the
+model: at most TTS_MAX_CONCURRENT_INFERENCES inferences run at once (more
+would only make every request slower by fighting over the CPU), and the
+rest wait for a slot in priority lanes:
+
+1. interactive: short replies a user is waiting to hear
+2. long: longer replies
+3. pregeneration: batch generation of static audio (scripts/)
+
+A free slot always goes to the highest non-empty lane. Within a lane,
+sessions take turns (round robin), so one client submitting many requests
+can't push everyone else's back.
+
+Wait time (queued until a slot is granted) and service time (holding the
+slot) are recorded separately per lane; see stats().
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Inferences running at the same time
+MAX_CONCURRENT_INFERENCES = int(os.getenv("TTS_MAX_CONCURRENT_INFERENCES", "1"))
+
+# Texts up to this length go to the interactive lane
+SHORT_TEXT_CHARS = int(os.getenv("TTS_SHORT_TEXT_CHARS", "200"))
+
+# Lanes in priority order
+INTERACTIVE = "interactive"
+LONG = "long"
+PREGENERATION = "pregeneration"
+LANES = [INTERACTIVE, LONG, PREGENERATION]
+
+# Recent requests per lane used for the timing statistics
+STATS_WINDOW = 200
+
+
+def lane_for(text: str) -> str:
+    """Default lane of an on-demand request."""
+    return INTERACTIVE if len(text) <= SHORT_TEXT_CHARS else LONG
+
+
+def _summary(values) -> dict:
+    if not values:
+        return {"mean": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class _Ticket:
+    def __init__(self, lane: str, session: str):
+        self.lane = lane
+        self.session = session
+        self.queued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+
+
+class InferenceScheduler:
+    """
+    Grants inference slots by lane priority and per-session round robin.
+
+    Args:
+        concurrency: Maximum inferences running at the same time
+    """
+
+    def __init__(self, concurrency: int = MAX_CONCURRENT_INFERENCES):
+        self.concurrency = max(1, concurrency)
+        self._condition = threading.Condition()
+        self._running = 0
+        # lane -> session -> waiting tickets; the first session is served next
+        self._waiting = {lane: OrderedDict() for lane in LANES}
+        self._stats = {
+            lane: {"completed": 0, "wait": deque(maxlen=STATS_WINDOW), "service": deque(maxlen=STATS_WINDOW)}
+            for lane in LANES
+        }
+
+    @contextmanager
+    def slot(self, lane: Optional[str] = None, session: Optional[str] = None,
+             on_grant: Optional[Callable[[], None]] = None):
+        """
+        Wait for an inference slot and hold it for the duration of the block.
+
+        Args:
+            lane: One of LANES (default: interactive)
+            session: Client session for fair queuing within the lane
+            on_grant: Called once the slot is granted, before the block runs;
+                raising from it gives the slot back without running the block
+        """
+        lane = lane if lane in self._waiting else INTERACTIVE
+        ticket = _Ticket(lane, session or "")
+        with self._condition:
+            self._waiting[lane].setdefault(ticket.session, deque()).append(ticket)
+            self._dispatch()
+            while ticket.granted_at is None:
+                self._condition.wait()
+
+        wait_time = ticket.granted_at - ticket.queued_at
+        try:
+            if on_grant:
+                on_grant()
+            yield
+        finally:
+            service_time = time.monotonic() - ticket.granted_at
+            with self._condition:
+                self._running -= 1
+                stats = self._stats[lane]
+                stats["completed"] += 1
+                stats["wait"].append(wait_time)
+                stats["service"].append(service_time)
+                self._dispatch()
+            logging.info(f"TTS inference ({lane}, session {ticket.session or '-'}): "
+                         f"waited {wait_time:.2f}s, service {service_time:.2f}s")
+
+    def _dispatch(self):
+        """Grant free slots to waiting tickets (caller holds the lock)."""
+        granted = False
+        while self._running < self.concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted_at = time.monotonic()
+            self._running += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for lane in LANES:
+            sessions = self._waiting[lane]
+            if not sessions:
+                continue
+            session, tickets = next(iter(sessions.items()))
+            ticket = tickets.popleft()
+            # The served session moves to the back of the lane
+            del sessions[session]
+            if tickets:
+                sessions[session] = tickets
+            return ticket
+        return None
+
+    def stats(self) -> dict:
+        """Running/waiting counts and wait vs service time per lane (seconds)."""
+        with self._condition:
+            return {
+                "concurrency": self.concurrency,
+                "running": self._running,
+                "lanes": {
+                    lane: {
+                        "waiting": sum(len(tickets) for tickets in self._waiting[lane].values()),
+                        "sessions_waiting": len(self._waiting[lane]),
+                        "completed": stats["completed"],
+                        "wait_seconds": _summary(stats["wait"]),
+                        "service_seconds": _summary(stats["service"]),
+                    }
+                    for lane, stats in self._stats.items()
+                },
+            }
+
+
+# Global scheduler instance
+_scheduler: Optional[InferenceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> InferenceScheduler:
+    """Get or create the global inference scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler()
+        return _scheduler
@@ -8,6 +8,8 @@ This script performs comprehensive tests for the TTS service, including:
 - Dependency checks
 - Model loading
 - Real TTS generation with timing
+- Per-request latency with and without the cached speaker features
+- Streaming time-to-first-audio
 
 Usage:
     python3 tts/test_tts_service.py
@@ -16,6 +18,7 @@ Note: Full TTS generation test takes 3-5 minutes on CPU, 3-10 seconds on GPU.
 """
 
 import sys
+import tempfile
 import time
 from pathlib import Path
 
@@ -247,6 +250,100 @@ def test_real_tts_generation():
         traceback.print_exc()
         return False
 
+def test_speaker_cache_latency():
+    """Compare per-request latency with and without cached speaker features."""
+    print("\n" + "=" * 60)
+    print("Test 7: Speaker Cache Latency")
+    print("=" * 60)
+    
+    try:
+        from tts.cosyvoice_service import get_tts_service
+        
+        service = get_tts_service()
+        if not service.is_initialized and not service.initialize():
+            print("✗ Failed to initialize model")
+            return False
+        
+        test_healer = "luna"
+        if test_healer not in service.cached_speakers:
+            print(f"⚠ No cached speaker for {test_healer} (TTS_SPEAKER_CACHE=0 or unsupported CosyVoice version)")
+            return True
+        
+        test_text = "Take a slow breath with me."
+        timings = {}
+        # An explicit output path bypasses the audio cache, so both runs synthesize
+        with tempfile.TemporaryDirectory() as output_dir:
+            # Uncached first so the cached run does not benefit from warm-up
+            for label, use_cache in (("without cache", False), ("with cache", True)):
+                start_time = time.time()
+                success, _ = service.generate_speech(
+                    text=test_text,
+                    healer_id=test_healer,
+                    output_path=str(Path(output_dir) / f"speaker_cache_{use_cache}.wav"),
+                    use_speaker_cache=use_cache
+                )
+                timings[label] = time.time() - start_time
+                if not success:
+                    print(f"✗ Generation {label} failed")
+                    return False
+                print(f"  {label:<14} {timings[label]:.2f}s")
+        
+        saved = timings["without cache"] - timings["with cache"]
+        print(f"✓ Cached speaker saves {saved:.2f}s per request "
+              f"({saved / timings['without cache'] * 100:.0f}%)")
+        return True
+    
+    except Exception as e:
+        print(f"✗ Speaker cache test error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def test_streaming_time_to_first_audio():
+    """Measure time-to-first-audio of streaming synthesis against the full utterance."""
+    print("\n" + "=" * 60)
+    print("Test 8: Streaming Time-to-First-Audio")
+    print("=" * 60)
+    
+    try:
+        from tts.cosyvoice_service import get_tts_service
+        
+        service = get_tts_service()
+        if not service.is_initialized and not service.initialize():
+            print("✗ Failed to initialize model")
+            return False
+        
+        # Unique text so the audio cache cannot answer
+        test_text = (f"Let's slow down together ({time.time():.0f}). Notice your breathing, "
+                     "and let each breath be a little longer than the last.")
+        start_time = time.time()
+        first_chunk_time = None
+        received = 0
+        for i, data in enumerate(service.stream_speech(test_text, "luna")):
+            # The first chunk is the WAV header; audio starts with the second
+            if i == 1:
+                first_chunk_time = time.time() - start_time
+            received += len(data)
+        total_time = time.time() - start_time
+        
+        if first_chunk_time is None:
+            print("✗ No audio streamed")
+            return False
+        
+        stats = service.last_stream_stats or {}
+        print(f"  Time to first audio: {first_chunk_time:.2f}s")
+        print(f"  Total time:          {total_time:.2f}s ({stats.get('chunks', '?')} chunks, {received / 1024:.1f} KB)")
+        if stats.get("audio_duration"):
+            print(f"  Audio duration:      {stats['audio_duration']:.2f}s, RTF {stats['rtf']:.2f}x")
+        print(f"✓ Playback can start {total_time - first_chunk_time:.2f}s earlier than with the full file")
+        return True
+    
+    except Exception as e:
+        print(f"✗ Streaming test error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 def main():
     """Run all tests."""
     print("\n" + "=" * 60)
@@ -262,6 +359,8 @@ def main():
     results.append(("Dependencies", test_dependencies()))
     results.append(("Model Loading", test_model_loading()))
     results.append(("Real TTS Generation", test_real_tts_generation()))
+    results.append(("Speaker Cache Latency", test_speaker_cache_latency()))
+    results.append(("Streaming TTFA", test_streaming_time_to_first_audio()))
     
     print("\n" + "=" * 60)
     print("Test Summary")
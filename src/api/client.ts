@@ -5,7 +5,7 @@
  * API base URL can be configured via VITE_API_BASE_URL environment variable.
  */
 
-import { ChatRequest, ChatResponse, RAGRetrievalRequest, RAGRetrievalResponse, TTSRequest, TTSResponse } from './types';
+import { ChatRequest, ChatResponse, RAGRetrievalRequest, RAGRetrievalResponse, TTSJobResponse, TTSRequest, TTSResponse } from './types';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
@@ -66,6 +66,7 @@ export async function retrieveRAGContext(
       body: JSON.stringify({
         query: request.query,
         topK: request.topK || 3,
+        healerId: request.healerId,
       }),
     });
 
@@ -97,15 +98,76 @@ export async function healthCheck(): Promise<boolean> {
   }
 }
 
+// Seconds each job status request waits for the job to finish (long polling)
+const TTS_JOB_POLL_WAIT = 25;
+
+// Identifies this browser tab to the TTS scheduler (requests of different sessions take turns)
+const TTS_SESSION_ID = crypto.randomUUID();
+
+// Compressed formats in order of preference, with the MIME type the browser must be able to play
+const TTS_AUDIO_FORMATS: [string, string][] = [
+  ['opus', 'audio/ogg; codecs="opus"'],
+  ['mp3', 'audio/mpeg'],
+];
+
+/**
+ * Audio formats this browser can play, most preferred (smallest) first
+ */
+export function preferredAudioFormats(): string[] {
+  const probe = new Audio();
+  const formats = TTS_AUDIO_FORMATS
+    .filter(([, mimeType]) => probe.canPlayType(mimeType) !== '')
+    .map(([format]) => format);
+  return [...formats, 'wav'];
+}
+
+interface PregeneratedFormats {
+  formats: string[];
+  extensions: Record<string, string>;
+}
+
+// formats.json of /tts_audio, fetched once
+let pregeneratedFormats: Promise<PregeneratedFormats | null> | null = null;
+
+/**
+ * URL of the best pre-generated version of a /tts_audio/*.wav file
+ * 
+ * The pregeneration scripts write compressed copies next to each WAV and
+ * list them in /tts_audio/formats.json; this picks the first one the
+ * browser can play and falls back to the WAV.
+ * 
+ * @param url - URL of the WAV file
+ * @returns URL of the file to play
+ */
+export async function resolvePregeneratedAudioUrl(url: string): Promise<string> {
+  if (!pregeneratedFormats) {
+    pregeneratedFormats = fetch('/tts_audio/formats.json')
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null);
+  }
+  const manifest = await pregeneratedFormats;
+  if (!manifest) {
+    return url;
+  }
+  const format = preferredAudioFormats().find((f) => manifest.formats.includes(f));
+  if (!format || format === 'wav') {
+    return url;
+  }
+  return url.replace(/\.wav$/, manifest.extensions[format]);
+}
+
 /**
  * Generate TTS audio for a healer's message
  * 
+ * Submits a TTS job and long-polls it until it finishes, so no single
+ * HTTP request stays open for the whole (multi-minute on CPU) generation.
+ * 
  * @param request - TTS request with text and healer ID
  * @returns TTS response with audio URL or error
  */
 export async function generateTTS(request: TTSRequest): Promise<TTSResponse> {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/tts/generate`, {
+    const response = await fetch(`${API_BASE_URL}/api/tts/jobs`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -113,22 +175,35 @@ export async function generateTTS(request: TTSRequest): Promise<TTSResponse> {
       body: JSON.stringify({
         text: request.text,
         healerId: request.healerId,
+        sessionId: TTS_SESSION_ID,
+        formats: preferredAudioFormats(),
       }),
     });
 
     if (!response.ok) {
-      const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
-      throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+      const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
+      throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
     }
 
-    const data: TTSResponse = await response.json();
-    
-    // Convert relative URL to absolute URL
-    if (data.audioUrl && !data.audioUrl.startsWith('http')) {
-      data.audioUrl = `${API_BASE_URL}${data.audioUrl}`;
+    let job: TTSJobResponse = await response.json();
+    while (job.status === 'queued' || job.status === 'generating') {
+      const pollResponse = await fetch(`${API_BASE_URL}/api/tts/jobs/${job.jobId}?wait=${TTS_JOB_POLL_WAIT}`);
+      if (!pollResponse.ok) {
+        throw new Error(`HTTP error! status: ${pollResponse.status}`);
+      }
+      job = await pollResponse.json();
     }
-    
-    return data;
+
+    if (job.status !== 'ready' || !job.audioUrl) {
+      return {
+        status: 'error',
+        error: job.error || `TTS job ${job.status}`,
+      };
+    }
+
+    // Convert relative URL to absolute URL
+    const audioUrl = job.audioUrl.startsWith('http') ? job.audioUrl : `${API_BASE_URL}${job.audioUrl}`;
+    return { status: 'ready', audioUrl };
   } catch (error) {
     console.error('Error generating TTS:', error);
     return {
@@ -138,3 +213,20 @@ export async function generateTTS(request: TTSRequest): Promise<TTSResponse> {
   }
 }
 
+/**
+ * URL of a healer's message as a streaming WAV
+ * 
+ * Audio starts playing as soon as the first chunk is synthesized
+ * (set it as the src of an <audio> element).
+ * 
+ * @param request - TTS request with text and healer ID
+ * @returns Absolute URL of the audio stream
+ */
+export function getTTSStreamUrl(request: TTSRequest): string {
+  const params = new URLSearchParams({
+    text: request.text,
+    healerId: request.healerId,
+    sessionId: TTS_SESSION_ID,
+  });
+  return `${API_BASE_URL}/api/tts/stream?${params.toString()}`;
+}
@@ -22,6 +22,7 @@ export interface ChatResponse {
 export interface RAGRetrievalRequest {
   query: string;
   topK?: number; // Default to 3-5
+  healerId?: string; // Restrict/weight sources by healer preference
 }
 
 export interface RAGRetrievalResponse {
@@ -40,3 +41,17 @@ export interface TTSResponse {
   status: 'generating' | 'ready' | 'error';
 }
 
+export interface TTSJobResponse {
+  jobId: string;
+  status: 'queued' | 'generating' | 'ready' | 'error' | 'cancelled';
+  audioUrl?: string;
+  error?: string;
+  queuePosition?: number;
+  cancelToken?: string;
+  timings: {
+    queued: number;
+    generating: number;
+    total: number;
+  };
+}
+
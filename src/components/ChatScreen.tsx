@@ -4,7 +4,7 @@ import { Sidebar } from './Sidebar';
 import { Healer, Message } from '../types';
 import { getChatResponse, convertToChatMessage } from '../services/chatService';
 import { ChatMessage } from '../api/types';
-import { generateTTS } from '../api/client';
+import { generateTTS, resolvePregeneratedAudioUrl } from '../api/client';
 
 interface ChatScreenProps {
   healer: Healer;
@@ -42,6 +42,7 @@ export const ChatScreen: React.FC<ChatScreenProps> = ({ healer, userAvatar, onBa
   const [sidebarOpen, setSidebarOpen] = useState(true);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const [isFirstMessageGenerated, setIsFirstMessageGenerated] = useState(false);
+  const [preGeneratedAudioUrl, setPreGeneratedAudioUrl] = useState<string | null>(null);
   const greetingAudioRef = useRef<HTMLAudioElement | null>(null);
   const [isGreetingAudioPlaying, setIsGreetingAudioPlaying] = useState(false);
   
@@ -68,14 +69,27 @@ export const ChatScreen: React.FC<ChatScreenProps> = ({ healer, userAvatar, onBa
     },
   ]);
 
+  // Pick the pre-generated greeting file in the best format this browser plays
+  useEffect(() => {
+    let cancelled = false;
+    setPreGeneratedAudioUrl(null);
+    resolvePregeneratedAudioUrl(`/tts_audio/${healer.id}_chat_greeting.wav`).then((url) => {
+      if (!cancelled) {
+        setPreGeneratedAudioUrl(url);
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [healer.id]);
+
   // Load pre-generated TTS audio for first greeting message (if exists)
   useEffect(() => {
-    if (isFirstMessageGenerated) return;
+    if (isFirstMessageGenerated || !preGeneratedAudioUrl) return;
     
     let isMounted = true;
     
     // First, try to use pre-generated audio file
-    const preGeneratedAudioUrl = `/tts_audio/${healer.id}_chat_greeting.wav`;
     
     // Test if pre-generated audio exists by trying to load it
     const testAudio = new Audio(preGeneratedAudioUrl);
@@ -210,7 +224,7 @@ export const ChatScreen: React.FC<ChatScreenProps> = ({ healer, userAvatar, onBa
       testAudio.onloadstart = null;
       testAudio.src = '';
     };
-  }, [healer.id, greetingMessage, isFirstMessageGenerated]); // Include all dependencies
+  }, [healer.id, greetingMessage, isFirstMessageGenerated, preGeneratedAudioUrl]); // Include all dependencies
 
   // Auto-scroll to bottom when new messages arrive
   useEffect(() => {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Healer, VoiceMessage } from '../types';
+import { resolvePregeneratedAudioUrl } from '../api/client';
 
 interface VoiceMailboxProps {
   healer: Healer;
@@ -268,7 +269,20 @@ export const VoiceMailbox: React.FC<VoiceMailboxProps> = ({ healer, isDayMode, s
     const allMessages = VOICE_MESSAGES[healer.id] || [];
     // Show 3-4 random messages
     const shuffled = [...allMessages].sort(() => Math.random() - 0.5);
-    setMessages(shuffled.slice(0, 4));
+    const selected = shuffled.slice(0, 4);
+    setMessages(selected);
+
+    // Swap in the compressed versions when available
+    let cancelled = false;
+    Promise.all(selected.map(async (msg) => ({ ...msg, audioUrl: await resolvePregeneratedAudioUrl(msg.audioUrl) })))
+      .then((resolved) => {
+        if (!cancelled) {
+          setMessages(resolved);
+        }
+      });
+    return () => {
+      cancelled = true;
+    };
   }, [healer.id]);
 
   const handlePlay = (messageId: string, audioUrl: string) => {
@@ -53,6 +53,7 @@ export async function getChatResponse(
       const ragResult = await retrieveRAGContext({
         query: userInput,
         topK: 3,
+        healerId: healer.id,
       });
       
       if (ragResult.chunks && ragResult.chunks.length > 0) {